@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""author_convert.py: convert documents in bulk without a display.
+
+Files are read and written with the same rules the editor uses when it
+opens and saves them (document_formats), on a pool of worker processes.
+A line is printed for every file as soon as it finishes, followed by a
+throughput summary.
+
+Finished files are recorded in a state file. Running the same command
+again after an interruption skips every source that is unchanged since
+it was converted, so only the remaining files are processed.
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+import conversion_service
+import document_formats
+import document_package
+
+OUTPUT_FORMATS = {
+    'html': '.html',
+    'md': '.md',
+    'txt': '.txt',
+    'hdoc': document_package.PACKAGE_EXTENSION,
+    'mhtml': '.mhtml',
+}
+
+INPUT_EXTENSIONS = (document_formats.HTML_EXTENSIONS + document_formats.MHTML_EXTENSIONS +
+                    document_formats.MARKDOWN_EXTENSIONS + document_formats.TEXT_EXTENSIONS +
+                    [document_package.PACKAGE_EXTENSION])
+
+STATE_FILE_NAME = ".author-convert-state"
+
+
+def convert_file(source, target, fsync_policy):
+    """Convert one file; runs in a worker process.
+
+    Returns (bytes read, bytes written, seconds). The worker's conversion
+    service, and the converters it holds, are reused for every file the
+    worker handles.
+    """
+    start = time.perf_counter()
+    service = conversion_service.get_service()
+    html = document_formats.load_document_html(source, service)
+
+    target_ext = os.path.splitext(target)[1].lower()
+    os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+    if target_ext == document_package.PACKAGE_EXTENSION:
+        html, assets = document_package.extract_data_urls(html)
+        document_package.DocumentPackage(target).save(html, assets, fsync_policy)
+    elif target_ext in document_formats.MHTML_EXTENSIONS:
+        html, assets = document_package.extract_data_urls(html)
+        document_formats.save_mhtml(target, html, assets, fsync_policy)
+    else:
+        data = document_formats.render_document(html, target_ext, service)
+        document_formats.atomic_write(target, data, fsync_policy)
+    return os.path.getsize(source), os.path.getsize(target), time.perf_counter() - start
+
+
+def find_sources(inputs):
+    """Yield (source, root) for input files and supported files under input folders"""
+    for path in inputs:
+        if os.path.isdir(path):
+            for directory, dirnames, filenames in os.walk(path):
+                dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+                for filename in sorted(filenames):
+                    if os.path.splitext(filename)[1].lower() in INPUT_EXTENSIONS:
+                        yield os.path.join(directory, filename), path
+        else:
+            yield path, os.path.dirname(path)
+
+
+def target_path(source, root, output_dir, extension):
+    """Output path for source, keeping its place below root inside output_dir"""
+    base = os.path.splitext(source)[0] + extension
+    if output_dir is None:
+        return base
+    return os.path.join(output_dir, os.path.relpath(base, root or '.'))
+
+
+def source_key(source):
+    """Identifies a source and its version in the state file"""
+    stat = os.stat(source)
+    return [os.path.realpath(source), stat.st_mtime_ns, stat.st_size]
+
+
+class ConversionState:
+    """Append-only record of finished conversions, one JSON object per line"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.done.add((tuple(entry['key']), entry['target']))
+                    except (ValueError, KeyError, TypeError):
+                        pass  # Line torn by an interrupted run
+        except FileNotFoundError:
+            pass
+        self._file = None
+
+    # Targets are stored resolved, so a run from another directory finds them
+    def is_done(self, key, target):
+        return (tuple(key), os.path.realpath(target)) in self.done and os.path.exists(target)
+
+    def record(self, key, target):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps({'key': key, 'target': os.path.realpath(target)}) + '\n')
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def format_size(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Convert documents between the formats Author opens and saves.")
+    parser.add_argument("inputs", nargs='+', help="files or folders to convert")
+    parser.add_argument("-t", "--to", choices=sorted(OUTPUT_FORMATS), default='html',
+                        help="output format (default: html)")
+    parser.add_argument("-o", "--output-dir",
+                        help="write results here instead of next to the sources")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--state",
+                        help=f"resume file (default: {STATE_FILE_NAME} in the output folder)")
+    parser.add_argument("--restart", action='store_true',
+                        help="ignore the resume file and convert everything again")
+    parser.add_argument("--fsync", choices=list(document_formats.SAVE_FSYNC_POLICIES), default='none',
+                        help="how durably each output is written (default: none)")
+    parser.add_argument("-q", "--quiet", action='store_true', help="only print failures and the summary")
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    extension = OUTPUT_FORMATS[args.to]
+    if args.to == 'md' and not conversion_service.HTML2TEXT_AVAILABLE:
+        print("author_convert.py: Markdown output needs the html2text package", file=sys.stderr)
+        return 2
+
+    state_path = args.state or os.path.join(args.output_dir or '.', STATE_FILE_NAME)
+    if args.restart:
+        try:
+            os.remove(state_path)
+        except FileNotFoundError:
+            pass
+    state = ConversionState(state_path)
+
+    converted = skipped = failed = 0
+    bytes_in = bytes_out = 0
+    start = time.perf_counter()
+
+    def finish(future, source, target, key):
+        nonlocal converted, failed, bytes_in, bytes_out
+        try:
+            size_in, size_out, seconds = future.result()
+        except Exception as e:
+            failed += 1
+            print(f"FAILED  {source}: {e}", file=sys.stderr)
+            return
+        converted += 1
+        bytes_in += size_in
+        bytes_out += size_out
+        state.record(key, target)
+        if not args.quiet:
+            print(f"{seconds * 1000:8.1f} ms  {format_size(size_in):>9} -> {format_size(size_out):>9}  {target}",
+                  flush=True)
+
+    interrupted = False
+    pending = {}
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs)
+    try:
+        for source, root in find_sources(args.inputs):
+            target = target_path(source, root, args.output_dir, extension)
+            try:
+                key = source_key(source)
+            except OSError as e:
+                failed += 1
+                print(f"FAILED  {source}: {e}", file=sys.stderr)
+                continue
+            if os.path.realpath(target) == key[0]:
+                failed += 1
+                print(f"FAILED  {source}: would overwrite the source; use --output-dir", file=sys.stderr)
+                continue
+            if state.is_done(key, target):
+                skipped += 1
+                continue
+
+            # Keep a bounded number of files in flight so huge trees stream
+            while len(pending) >= args.jobs * 4:
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    finish(future, *pending.pop(future))
+            pending[executor.submit(convert_file, source, target, args.fsync)] = (source, target, key)
+
+        for future in concurrent.futures.as_completed(list(pending)):
+            finish(future, *pending.pop(future))
+    except KeyboardInterrupt:
+        interrupted = True
+        executor.shutdown(wait=False, cancel_futures=True)
+    finally:
+        executor.shutdown(wait=not interrupted)
+        state.close()
+
+    elapsed = time.perf_counter() - start
+    rate = converted / elapsed if elapsed else 0.0
+    print(f"{converted} converted, {skipped} already done, {failed} failed in {elapsed:.2f} s "
+          f"({rate:.1f} files/s, {format_size(bytes_in / elapsed if elapsed else 0)}/s read)",
+          file=sys.stderr)
+    if interrupted:
+        print(f"Interrupted; run the same command again to resume ({state_path})", file=sys.stderr)
+        return 130
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Append-only autosave journal stored next to a document.
+
+The journal starts with MAGIC followed by records. Each record is a one-byte
+kind, a four-byte big-endian payload length and a zlib-compressed JSON
+payload:
+
+- CHECKPOINT holds every top-level block of the editor.
+- DELTA replaces the blocks between an unchanged prefix and suffix.
+
+Replaying the records rebuilds the editor content after a crash. A record
+that was only partly written when the crash happened is ignored.
+"""
+
+import json
+import os
+import struct
+import zlib
+
+MAGIC = b"AUTHORJ1"
+CHECKPOINT = b"C"
+DELTA = b"D"
+_HEADER = struct.Struct(">cI")
+
+# Compact into a fresh checkpoint once this many deltas have piled up
+MAX_DELTAS = 200
+
+
+def journal_path_for(document_path):
+    """Return the hidden journal path that belongs to a document"""
+    directory, name = os.path.split(document_path)
+    return os.path.join(directory, f".{name}.author-journal")
+
+
+def has_recoverable_journal(document_path):
+    """True if a journal newer than the document was left behind"""
+    path = journal_path_for(document_path)
+    try:
+        journal_mtime = os.path.getmtime(path)
+    except OSError:
+        return False
+    try:
+        return journal_mtime >= os.path.getmtime(document_path)
+    except OSError:
+        return True
+
+
+def _encode(kind, payload):
+    data = zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+    return _HEADER.pack(kind, len(data)) + data
+
+
+def replay(path):
+    """Rebuild the journaled HTML, or return None if there is no usable checkpoint"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if not data.startswith(MAGIC):
+        return None
+
+    blocks = None
+    pos = len(MAGIC)
+    while pos + _HEADER.size <= len(data):
+        kind, length = _HEADER.unpack_from(data, pos)
+        pos += _HEADER.size
+        if pos + length > len(data):
+            break  # Torn record at the end of the journal
+        try:
+            payload = json.loads(zlib.decompress(data[pos:pos + length]))
+        except (zlib.error, ValueError):
+            break
+        pos += length
+
+        if kind == CHECKPOINT:
+            blocks = payload['blocks']
+        elif kind == DELTA and blocks is not None:
+            end = len(blocks) - payload['suffix']
+            blocks[payload['prefix']:end] = payload['blocks']
+
+    if blocks is None:
+        return None
+    return ''.join(blocks)
+
+
+class AutosaveJournal:
+    """Writes checkpoints and deltas for one document"""
+
+    def __init__(self, document_path):
+        self.document_path = document_path
+        self.path = journal_path_for(document_path)
+        self.has_checkpoint = False
+        self.checkpoint_bytes = 0
+        self.delta_bytes = 0
+        self.delta_count = 0
+
+    def needs_checkpoint(self):
+        """True when the next write should be a full checkpoint instead of a delta"""
+        return (not self.has_checkpoint or
+                self.delta_count >= MAX_DELTAS or
+                self.delta_bytes > self.checkpoint_bytes)
+
+    def write_checkpoint(self, blocks):
+        """Replace the journal with a single checkpoint record"""
+        record = _encode(CHECKPOINT, {'blocks': blocks})
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+        self.has_checkpoint = True
+        self.checkpoint_bytes = len(record)
+        self.delta_bytes = 0
+        self.delta_count = 0
+
+    def append_delta(self, prefix, suffix, blocks):
+        """Append the blocks that changed since the previous record"""
+        if not self.has_checkpoint:
+            raise RuntimeError("A checkpoint must be written before deltas")
+        record = _encode(DELTA, {'prefix': prefix, 'suffix': suffix, 'blocks': blocks})
+        with open(self.path, 'ab') as f:
+            f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.delta_bytes += len(record)
+        self.delta_count += 1
+
+    def discard(self):
+        """Remove the journal, e.g. after the document was saved"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Could not remove autosave journal: {e}")
+        self.has_checkpoint = False
+        self.checkpoint_bytes = 0
+        self.delta_bytes = 0
+        self.delta_count = 0
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""Long-lived document converters shared by every window.
+
+Setting a converter up (probing which Markdown extensions load, building
+the Markdown instance) happens once per process instead of once per file.
+Each conversion is available synchronously, or through submit(), which
+runs it on the service's worker threads and returns a
+concurrent.futures.Future. Nothing here needs GTK, so batch tools can use
+the same rules as the editor.
+"""
+
+import concurrent.futures
+import re
+import threading
+from html.parser import HTMLParser
+
+from startup_profile import lazy_import, module_available
+
+# Markdown and html2text are slow to import; they load on first conversion
+MARKDOWN_AVAILABLE = module_available('markdown')
+markdown = lazy_import('markdown')
+
+# html2text handles HTML to Markdown conversion
+HTML2TEXT_AVAILABLE = module_available('html2text')
+html2text = lazy_import('html2text')
+
+MARKDOWN_EXTENSIONS = ['tables', 'fenced_code', 'codehilite', 'nl2br', 'sane_lists', 'smarty', 'attr_list']
+
+# Conversion kinds accepted by convert() and submit()
+CONVERSIONS = {
+    'md-html': 'markdown_to_html',
+    'html-md': 'html_to_markdown',
+    'html-txt': 'html_to_text',
+}
+
+
+def simple_markdown_to_html(content):
+    """Simple markdown to HTML conversion, used when the markdown package is missing"""
+    html = content
+
+    # Basic markdown conversions
+    html = re.sub(r'^# (.*?)$', r'<h1>\1</h1>', html, flags=re.MULTILINE)
+    html = re.sub(r'^## (.*?)$', r'<h2>\1</h2>', html, flags=re.MULTILINE)
+    html = re.sub(r'^### (.*?)$', r'<h3>\1</h3>', html, flags=re.MULTILINE)
+    html = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', html)
+    html = re.sub(r'\*(.*?)\*', r'<em>\1</em>', html)
+    html = re.sub(r'`(.*?)`', r'<code>\1</code>', html)
+    html = re.sub(r'\[(.*?)\]\((.*?)\)', r'<a href="\2">\1</a>', html)
+
+    # Convert paragraphs
+    paragraphs = re.split(r'\n\s*\n', html)
+    processed_paragraphs = []
+    for p in paragraphs:
+        if p.strip() and not p.strip().startswith('<'):
+            processed_paragraphs.append(f'<p>{p}</p>')
+        else:
+            processed_paragraphs.append(p)
+
+    html = '\n'.join(processed_paragraphs)
+    return html
+
+
+class _TextExtractor(HTMLParser):
+    """Collects text with a line break after each block, like innerText"""
+    BLOCKS = frozenset(['br', 'div', 'p', 'li', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'pre', 'blockquote'])
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'br':
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.BLOCKS and self.parts and not self.parts[-1].endswith('\n'):
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        self.parts.append(data)
+
+
+class ConversionService:
+    """Keeps configured converters alive between conversions"""
+
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._local = threading.local()  # Markdown instances are not thread-safe
+        self._extensions = None
+        self._executor = None
+
+    def markdown_extensions(self):
+        """Markdown extensions that load here, probed once per session"""
+        with self._lock:
+            if self._extensions is None:
+                available = []
+                for ext in MARKDOWN_EXTENSIONS:
+                    try:
+                        markdown.Markdown(extensions=[ext])
+                        available.append(ext)
+                    except (ImportError, ValueError):
+                        pass
+                self._extensions = available
+            return self._extensions
+
+    def _markdown(self):
+        converter = getattr(self._local, 'markdown', None)
+        if converter is None:
+            converter = markdown.Markdown(extensions=self.markdown_extensions())
+            self._local.markdown = converter
+        return converter
+
+    def markdown_to_html(self, text):
+        if not MARKDOWN_AVAILABLE:
+            return simple_markdown_to_html(text)
+        try:
+            return self._markdown().reset().convert(text)
+        except Exception as e:
+            print(f"Error converting markdown: {e}")
+            # Fallback to simple conversion
+            return simple_markdown_to_html(text)
+
+    def html_to_markdown(self, html):
+        if not HTML2TEXT_AVAILABLE:
+            raise RuntimeError("html2text library not available for Markdown conversion")
+        # HTML2Text keeps parser state, so only its settings are reused
+        h2t = html2text.HTML2Text()
+        h2t.unicode_snob = True        # Use Unicode
+        h2t.body_width = 0             # Don't wrap lines
+        h2t.ignore_links = False       # Preserve links
+        h2t.ignore_images = False      # Preserve images
+        h2t.ignore_tables = False      # Try to handle tables
+        return h2t.handle(html)
+
+    def html_to_text(self, html):
+        extractor = _TextExtractor()
+        extractor.feed(html)
+        extractor.close()
+        return ''.join(extractor.parts)
+
+    def convert(self, kind, text):
+        """Run a conversion such as 'md-html' on the calling thread"""
+        return getattr(self, CONVERSIONS[kind])(text)
+
+    def submit(self, kind, text):
+        """Run a conversion on a worker thread and return its Future"""
+        return self.run(getattr(self, CONVERSIONS[kind]), text)
+
+    def run(self, function, *args):
+        """Run any function on the service's worker threads and return its Future"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="author-convert")
+        return self._executor.submit(function, *args)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service():
+    """The process-wide conversion service"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ConversionService()
+        return _service
@@ -100,6 +100,10 @@ class PaginatedEditorWindow(Adw.ApplicationWindow):
             padding: 1in;
             box-sizing: border-box;
             position: relative;
+            /* Pages out of view skip style, layout and paint; their size is fixed, so
+               they keep their place in the scroll height and stay in the DOM for
+               selection, search and getEditorContent() */
+            content-visibility: auto;
         }
         
         .page-content {
@@ -137,187 +141,335 @@ class PaginatedEditorWindow(Adw.ApplicationWindow):
 
     <script>
         // Global variables
-        let pages = document.querySelectorAll('.page');
         const editor = document.getElementById('editor');
+        const pageContents = editor.getElementsByClassName('page-content');  // live, in page order
         let activePageIndex = 0; // Track active page
-        let isReflowing = false; // Prevent recursive reflow
         let caretPosition = {
             pageIndex: 0,
             node: null,
             offset: 0
         };
         
+        // Pagination engine.
+        // Edits mark the first page that may have to change; a reflow starts there and
+        // stops at the first page whose contents did not move, so an edit on page 80
+        // costs about as much as one on page 1. Each page is measured with a handful of
+        // rect reads (binary searches over its children and, for a block that straddles
+        // the page end, over its text) and then changed with a single DOM write.
+        const paginator = {
+            dirtyFrom: Infinity,
+            frame: 0,
+            budgetMs: 8,            // work per frame before yielding to the next one
+            lineSlack: 10,          // underflow smaller than this is not worth a pull
+            nextSplitId: 1,
+            stats: { runs: 0, lastMs: 0, maxMs: 0, lastPages: 0, frames: 0 }
+        };
+        const measureRange = document.createRange();
+        
         // Function to save caret position
         function saveCaretPosition() {
             const selection = window.getSelection();
             if (selection.rangeCount > 0) {
                 const range = selection.getRangeAt(0);
                 const startNode = range.startContainer;
-                const startOffset = range.startOffset;
-                
-                // Find which page contains this node
-                let pageIndex = 0;
-                const pageContents = document.querySelectorAll('.page-content');
-                
-                for (let i = 0; i < pageContents.length; i++) {
-                    if (pageContents[i].contains(startNode) || pageContents[i] === startNode) {
-                        pageIndex = i;
-                        break;
-                    }
-                }
+                const element = startNode.nodeType === Node.ELEMENT_NODE ? startNode : startNode.parentElement;
+                const page = element ? element.closest('.page-content') : null;
+                if (!page) return;
                 
                 caretPosition = {
-                    pageIndex: pageIndex,
+                    pageIndex: Array.prototype.indexOf.call(pageContents, page),
                     node: startNode,
-                    offset: startOffset
+                    offset: range.startOffset
                 };
-                
-                activePageIndex = pageIndex;
+                activePageIndex = caretPosition.pageIndex;
             }
         }
         
         // Function to restore caret position after reflow
         function restoreCaretPosition() {
             try {
-                const pageContents = document.querySelectorAll('.page-content');
-                
-                // Check if the saved page index is still valid
-                if (caretPosition.pageIndex >= pageContents.length) {
-                    caretPosition.pageIndex = pageContents.length - 1;
-                }
-                
-                // Get the target page content
-                const targetPage = pageContents[caretPosition.pageIndex];
+                if (!caretPosition.node || !editor.contains(caretPosition.node)) return;
+                const page = (caretPosition.node.nodeType === Node.ELEMENT_NODE ?
+                    caretPosition.node : caretPosition.node.parentElement).closest('.page-content');
+                const range = document.createRange();
+                const selection = window.getSelection();
+                range.setStart(caretPosition.node, caretPosition.offset);
+                range.collapse(true);
+                selection.removeAllRanges();
+                selection.addRange(range);
                 
-                // If we have a saved node and it's still in the document
-                if (caretPosition.node && document.contains(caretPosition.node)) {
-                    // Create a new range
-                    const range = document.createRange();
-                    const selection = window.getSelection();
-                    
-                    // Try to set the range to the saved position
-                    try {
-                        range.setStart(caretPosition.node, caretPosition.offset);
-                        range.collapse(true);
-                        
-                        // Clear existing selection and add our range
-                        selection.removeAllRanges();
-                        selection.addRange(range);
-                        
-                        // Ensure the page with the caret is visible
-                        pages[caretPosition.pageIndex].scrollIntoView({
-                            behavior: 'smooth', 
-                            block: 'center'
-                        });
-                    } catch (e) {
-                        // If setting the range failed, just focus the page
-                        targetPage.focus();
-                    }
-                } else {
-                    // If the node is no longer valid, just focus on the target page
-                    targetPage.focus();
+                const pageIndex = Array.prototype.indexOf.call(pageContents, page);
+                if (pageIndex !== caretPosition.pageIndex) {
+                    // The caret was carried onto another page
+                    page.focus();
+                    selection.removeAllRanges();
+                    selection.addRange(range);
+                    page.parentElement.scrollIntoView({ block: 'nearest' });
+                    caretPosition.pageIndex = activePageIndex = pageIndex;
                 }
             } catch (e) {
                 console.error("Error restoring caret position:", e);
-                // As a fallback, focus the first page
-                document.querySelector('.page-content').focus();
             }
         }
         
         // Calculate maximum content height for a page (accounting for padding)
         function getMaxHeight() {
-            const page = document.querySelector('.page');
-            const pageContent = page.querySelector('.page-content');
-            return pageContent.clientHeight;
+            return pageContents[0].clientHeight;
         }
         
-        // Function to check if content overflows
-        function checkOverflow() {
-            if (isReflowing) return; // Prevent recursive calls
-            isReflowing = true;
-            
-            // Save current caret position before reflowing
-            saveCaretPosition();
+        function isEmptyPage(content) {
+            return !content.firstChild || (!content.textContent.trim() && !content.querySelector('br, img, hr, table'));
+        }
+        
+        // Bottom of a child in page coordinates; reads only, so repeated calls share one layout
+        function nodeBottom(content, node) {
+            let rect;
+            if (node.nodeType === Node.ELEMENT_NODE && node.tagName !== 'BR') {
+                rect = node.getBoundingClientRect();
+            } else {
+                measureRange.selectNode(node);
+                rect = measureRange.getBoundingClientRect();
+            }
+            if (!rect.height && !rect.width) return null;  // collapsed, e.g. a trailing <br>
+            return rect.bottom - content.getBoundingClientRect().top + content.scrollTop;
+        }
+        
+        function nodeTop(content, node) {
+            let rect;
+            if (node.nodeType === Node.ELEMENT_NODE && node.tagName !== 'BR') {
+                rect = node.getBoundingClientRect();
+            } else {
+                measureRange.selectNode(node);
+                rect = measureRange.getBoundingClientRect();
+            }
+            return rect.top - content.getBoundingClientRect().top + content.scrollTop;
+        }
+        
+        // Index of the first child that ends below limit, or children.length if all fit
+        function firstOverflowingChild(content, limit) {
+            const children = content.childNodes;
+            let low = 0, high = children.length;
+            while (low < high) {
+                const mid = (low + high) >> 1;
+                // Collapsed nodes take the position of the nearest measurable node before them
+                let probe = mid, bottom = null;
+                while (probe >= low && (bottom = nodeBottom(content, children[probe])) === null) probe--;
+                if (bottom !== null && bottom > limit) high = mid;
+                else low = mid + 1;
+            }
+            return low;
+        }
+        
+        // Largest offset in a text node whose characters before it all end above limit
+        function textFitOffset(content, textNode, limit) {
+            let low = 0, high = textNode.length;
+            while (low < high) {
+                const mid = (low + high) >> 1;
+                measureRange.setStart(textNode, mid);
+                measureRange.setEnd(textNode, mid + 1);
+                const rect = measureRange.getBoundingClientRect();
+                const bottom = rect.bottom - content.getBoundingClientRect().top + content.scrollTop;
+                if (bottom > limit) high = mid;
+                else low = mid + 1;
+            }
+            // Break after a space rather than inside a word
+            const space = textNode.data.lastIndexOf(' ', low - 1);
+            return space > 0 ? space + 1 : low;
+        }
+        
+        // Split a text node at offset, keeping the caret on the right half
+        function splitTextNode(textNode, offset) {
+            const tail = textNode.splitText(offset);
+            if (caretPosition.node === textNode && caretPosition.offset > offset) {
+                caretPosition.node = tail;
+                caretPosition.offset -= offset;
+            }
+            return tail;
+        }
+        
+        // Cut a straddling node at the page limit. Returns the node the next page starts
+        // with, or null if nothing of it fits and it should move as a whole.
+        function splitStraddlingNode(content, node, limit) {
+            if (node.nodeType === Node.TEXT_NODE) {
+                const offset = textFitOffset(content, node, limit);
+                return offset > 0 && offset < node.length ? splitTextNode(node, offset) : null;
+            }
+            if (node.nodeType !== Node.ELEMENT_NODE) return null;
             
-            const pageContents = document.querySelectorAll('.page-content');
-            const maxHeight = getMaxHeight();
+            const walker = document.createTreeWalker(node, NodeFilter.SHOW_TEXT);
+            const texts = [];
+            while (walker.nextNode()) texts.push(walker.currentNode);
+            // First text node that runs past the limit
+            let low = 0, high = texts.length;
+            while (low < high) {
+                const mid = (low + high) >> 1;
+                const bottom = nodeBottom(content, texts[mid]);
+                if (bottom !== null && bottom > limit) high = mid;
+                else low = mid + 1;
+            }
+            if (low === texts.length) return null;
+            let start = texts[low];
+            const offset = textFitOffset(content, start, limit);
+            if (offset >= start.length) return null;
+            if (offset > 0) start = splitTextNode(start, offset);
+            else if (low === 0) return null;
             
-            // Process all pages except the last one
-            for (let i = 0; i < pageContents.length - 1; i++) {
-                const content = pageContents[i];
-                
-                // Check if this page overflows
-                while (content.scrollHeight > maxHeight) {
-                    // Get the last node of this page
-                    const lastNode = content.lastChild;
-                    if (!lastNode) break;
-                    
-                    // Remove it from this page
-                    content.removeChild(lastNode);
-                    
-                    // Add it to the beginning of the next page
-                    const nextPageContent = pageContents[i + 1];
-                    if (nextPageContent.firstChild) {
-                        nextPageContent.insertBefore(lastNode, nextPageContent.firstChild);
-                    } else {
-                        nextPageContent.appendChild(lastNode);
-                    }
+            // Everything from start to the end of the element goes into a shallow copy of it
+            node.dataset.splitId = node.dataset.splitId || String(paginator.nextSplitId++);
+            const range = document.createRange();
+            range.setStartBefore(start);
+            range.setEnd(node, node.childNodes.length);
+            const fragment = range.extractContents();
+            const tail = node.cloneNode(false);
+            tail.appendChild(fragment);
+            node.after(tail);
+            return tail;
+        }
+        
+        // Two halves of a split node meet at a page boundary: join them again
+        function isContinuation(before, after) {
+            if (!before || !after) return false;
+            if (before.nodeType === Node.TEXT_NODE && after.nodeType === Node.TEXT_NODE) return true;
+            return before.nodeType === Node.ELEMENT_NODE && after.nodeType === Node.ELEMENT_NODE &&
+                before.dataset.splitId && before.dataset.splitId === after.dataset.splitId;
+        }
+        
+        function joinContinuation(before, after) {
+            if (before.nodeType === Node.TEXT_NODE) {
+                if (caretPosition.node === after) {
+                    caretPosition.node = before;
+                    caretPosition.offset += before.length;
                 }
-                
-                // Check if we can pull content from the next page
-                while (content.scrollHeight < maxHeight - 10) { // Leave a small buffer
-                    const nextPageContent = pageContents[i + 1];
-                    const firstNode = nextPageContent.firstChild;
-                    
-                    // If next page is empty or adding this node would overflow, break
-                    if (!firstNode) break;
-                    
-                    // Temporarily add node to check if it would overflow
-                    nextPageContent.removeChild(firstNode);
-                    content.appendChild(firstNode);
-                    
-                    // If it overflows, put it back
-                    if (content.scrollHeight > maxHeight) {
-                        content.removeChild(firstNode);
-                        nextPageContent.insertBefore(firstNode, nextPageContent.firstChild);
-                        break;
-                    }
+                before.appendData(after.data);
+                after.remove();
+                return;
+            }
+            const range = document.createRange();
+            range.selectNodeContents(after);
+            before.appendChild(range.extractContents());
+            after.remove();
+        }
+        
+        // Move everything from the first child that runs past the page onto the next page
+        function pushOverflow(index, limit) {
+            const content = pageContents[index];
+            if (content.scrollHeight <= limit) return false;
+            
+            const children = content.childNodes;
+            let split = firstOverflowingChild(content, limit);
+            if (split >= children.length) return false;
+            
+            const node = children[split];
+            // Large blocks, and anything at the very top of a page, are cut rather than moved
+            if (node.nodeType === Node.TEXT_NODE || split === 0 ||
+                (node.nodeType === Node.ELEMENT_NODE && node.getBoundingClientRect().height > limit / 4)) {
+                if (nodeTop(content, node) < limit) {
+                    const tail = splitStraddlingNode(content, node, limit);
+                    if (tail) split = Array.prototype.indexOf.call(children, tail);
+                    else if (split === 0) split = 1;  // Taller than a page and unsplittable
                 }
             }
+            if (split >= children.length) return false;
             
-            // Check the last page for overflow
-            const lastPage = pageContents[pageContents.length - 1];
-            if (lastPage.scrollHeight > maxHeight) {
-                addNewPage();
-                
-                // Now move overflowing content to the new page
-                const newLastPage = document.querySelector('.page-content:last-child');
-                while (lastPage.scrollHeight > maxHeight) {
-                    const lastNode = lastPage.lastChild;
-                    if (!lastNode) break;
-                    
-                    lastPage.removeChild(lastNode);
-                    if (newLastPage.firstChild) {
-                        newLastPage.insertBefore(lastNode, newLastPage.firstChild);
-                    } else {
-                        newLastPage.appendChild(lastNode);
-                    }
+            if (index === pageContents.length - 1) addNewPage();
+            const next = pageContents[index + 1];
+            const range = document.createRange();
+            range.setStartBefore(children[split]);
+            range.setEndAfter(content.lastChild);
+            const moved = range.extractContents();
+            const first = next.firstChild;
+            const last = moved.lastChild;
+            next.insertBefore(moved, first);
+            if (isContinuation(last, first)) joinContinuation(last, first);
+            return true;
+        }
+        
+        // Pull whole nodes back from the next page while they fit
+        function pullUnderflow(index, limit) {
+            const content = pageContents[index];
+            const next = pageContents[index + 1];
+            if (!next || !next.firstChild) return false;
+            
+            const last = content.lastChild;
+            const used = last ? (nodeBottom(content, last) || nodeTop(content, last)) : 0;
+            const available = limit - used;
+            if (available < paginator.lineSlack) return false;
+            
+            if (isContinuation(last, next.firstChild)) {
+                // Rejoin a split node; pushOverflow cuts it again at the right place
+                joinContinuation(last, next.firstChild);
+                return true;
+            }
+            const count = firstOverflowingChild(next, available);
+            if (count === 0) return false;
+            
+            const range = document.createRange();
+            range.setStartBefore(next.firstChild);
+            range.setEndAfter(next.childNodes[count - 1]);
+            content.appendChild(range.extractContents());
+            return true;
+        }
+        
+        function reflowPage(index, limit) {
+            let changed = pullUnderflow(index, limit);
+            changed = pushOverflow(index, limit) || changed;
+            return changed;
+        }
+        
+        function reflow() {
+            paginator.frame = 0;
+            const start = performance.now();
+            const limit = getMaxHeight();
+            let index = Math.min(paginator.dirtyFrom, pageContents.length - 1);
+            const first = index;
+            paginator.dirtyFrom = Infinity;
+            saveCaretPosition();
+            
+            let visited = 0, wrote = false;
+            for (; index < pageContents.length; index++) {
+                const changed = reflowPage(index, limit);
+                visited++;
+                wrote = wrote || changed;
+                // Later pages are untouched once a page after the edit point stays as it was
+                if (!changed && index > first) break;
+                if (performance.now() - start > paginator.budgetMs && index + 1 < pageContents.length) {
+                    // Out of budget: continue from the next page in the next frame
+                    markDirty(index + 1);
+                    paginator.stats.frames++;
+                    break;
                 }
             }
             
-            // Check if we need to remove empty pages
-            checkForEmptyPages();
+            // Pages only ever empty out at the end of the document
+            while (pageContents.length > 1 && isEmptyPage(pageContents[pageContents.length - 1])) {
+                pageContents[pageContents.length - 1].parentElement.remove();
+                wrote = true;
+            }
+            if (wrote) restoreCaretPosition();
             
-            // Restore caret position after reflowing
-            setTimeout(() => {
-                restoreCaretPosition();
-                isReflowing = false;
-            }, 0);
+            const elapsed = performance.now() - start;
+            paginator.stats.runs++;
+            paginator.stats.lastMs = elapsed;
+            paginator.stats.maxMs = Math.max(paginator.stats.maxMs, elapsed);
+            paginator.stats.lastPages = visited;
+        }
+        
+        // Schedule a reflow from the given page; work is batched into the next frame
+        function markDirty(pageIndex) {
+            // An edit can let the previous page pull content back
+            paginator.dirtyFrom = Math.min(paginator.dirtyFrom, Math.max(0, pageIndex - 1));
+            if (!paginator.frame) paginator.frame = requestAnimationFrame(reflow);
+        }
+        
+        function pageIndexOf(node) {
+            const element = node.nodeType === Node.ELEMENT_NODE ? node : node.parentElement;
+            const page = element ? element.closest('.page-content') : null;
+            return page ? Array.prototype.indexOf.call(pageContents, page) : 0;
         }
         
         // Function to add a new page
         function addNewPage() {
-            const pageCount = pages.length;
+            const pageCount = pageContents.length;
             
             // Create new page
             const newPage = document.createElement('div');
@@ -327,11 +479,6 @@ class PaginatedEditorWindow(Adw.ApplicationWindow):
             const newContent = document.createElement('div');
             newContent.className = 'page-content';
             newContent.contentEditable = 'true';
-            newContent.addEventListener('input', onInput);
-            newContent.addEventListener('keydown', onKeyDown);
-            newContent.addEventListener('focus', () => {
-                activePageIndex = Array.from(document.querySelectorAll('.page')).length - 1;
-            });
             
             // Create page number
             const newPageNumber = document.createElement('div');
@@ -344,92 +491,23 @@ class PaginatedEditorWindow(Adw.ApplicationWindow):
             
             // Add page to editor
             editor.appendChild(newPage);
-            
-            // Update pages array
-            pages = document.querySelectorAll('.page');
-        }
-        
-        // Function to check for and remove empty pages
-        function checkForEmptyPages() {
-            // Skip if there's only one page
-            if (pages.length <= 1) return;
-            
-            // Check all pages except the first one
-            for (let i = 1; i < pages.length; i++) {
-                const content = pages[i].querySelector('.page-content');
-                
-                // If this page is empty (no content or just whitespace)
-                if (!content.textContent.trim() && !content.querySelector('br')) {
-                    // Don't remove the very last page if it's the only empty one
-                    if (i === pages.length - 1 && pages.length === 2) {
-                        continue;
-                    }
-                    
-                    // Remove the empty page
-                    editor.removeChild(pages[i]);
-                    
-                    // Update pages array
-                    pages = document.querySelectorAll('.page');
-                    
-                    // Update page numbers
-                    updatePageNumbers();
-                    
-                    // Update active page index if needed
-                    if (activePageIndex >= i) {
-                        activePageIndex = Math.max(0, activePageIndex - 1);
-                    }
-                    
-                    // Check again from the beginning
-                    checkForEmptyPages();
-                    return;
-                }
-            }
-        }
-        
-        // Function to update page numbers
-        function updatePageNumbers() {
-            const pageNumbers = document.querySelectorAll('.page-number');
-            pageNumbers.forEach((num, index) => {
-                num.textContent = index + 1;
-            });
-        }
-        
-        // Debounced version of checkOverflow
-        let overflowTimer = null;
-        function debouncedCheckOverflow() {
-            if (overflowTimer) clearTimeout(overflowTimer);
-            overflowTimer = setTimeout(() => {
-                checkOverflow();
-            }, 100);
         }
         
         // Event handler for input events
         function onInput(event) {
-            // Save which page is active
-            const pageContents = document.querySelectorAll('.page-content');
-            for (let i = 0; i < pageContents.length; i++) {
-                if (pageContents[i] === event.target) {
-                    activePageIndex = i;
-                    break;
-                }
-            }
-            
-            // Save caret position
+            activePageIndex = pageIndexOf(event.target);
             saveCaretPosition();
-            
-            // Trigger reflow check
-            debouncedCheckOverflow();
+            markDirty(activePageIndex);
         }
         
         // Event handler for keydown events
         function onKeyDown(event) {
+            const pages = editor.getElementsByClassName('page');
+            
             // Handle Enter key
             if (event.key === 'Enter') {
                 event.preventDefault();
                 
-                // Save current position
-                saveCaretPosition();
-                
                 // Insert a proper line break
                 const selection = window.getSelection();
                 if (selection.rangeCount > 0) {
@@ -444,8 +522,8 @@ class PaginatedEditorWindow(Adw.ApplicationWindow):
                     selection.removeAllRanges();
                     selection.addRange(range);
                     
-                    // Force reflow
-                    debouncedCheckOverflow();
+                    saveCaretPosition();
+                    markDirty(pageIndexOf(br));
                 }
                 return false;
             }
@@ -496,44 +574,28 @@ class PaginatedEditorWindow(Adw.ApplicationWindow):
                     }
                 }
             }
-            
-            // For all other keys, trigger reflow check after a short delay
-            setTimeout(() => {
-                debouncedCheckOverflow();
-            }, 0);
         }
         
         // Initialize event listeners
         function initializeEditor() {
-            // Add focus event listeners to all pages
-            document.querySelectorAll('.page-content').forEach((content, index) => {
-                content.addEventListener('focus', () => {
-                    activePageIndex = index;
-                });
-                content.addEventListener('click', () => {
-                    activePageIndex = index;
-                    saveCaretPosition();
-                });
-                content.addEventListener('input', onInput);
-                content.addEventListener('keydown', onKeyDown);
+            // One set of listeners for every page, including pages added later
+            editor.addEventListener('focusin', (event) => {
+                if (event.target.classList.contains('page-content')) {
+                    activePageIndex = pageIndexOf(event.target);
+                }
             });
+            editor.addEventListener('click', saveCaretPosition);
+            editor.addEventListener('input', onInput);
+            editor.addEventListener('keydown', onKeyDown);
             
             // Focus the first page
-            document.querySelector('.page-content').focus();
-            
-            // Setup continuous overflow checking
-            setInterval(() => {
-                if (!isReflowing) {
-                    checkOverflow();
-                }
-            }, 2000);
+            pageContents[0].focus();
         }
         
         // Function to get all content as plain text
         window.getEditorContent = function() {
             let content = '';
-            const contents = document.querySelectorAll('.page-content');
-            contents.forEach(page => {
+            Array.prototype.forEach.call(pageContents, page => {
                 content += page.innerText + '\\n\\n';
             });
             return content;
@@ -541,9 +603,15 @@ class PaginatedEditorWindow(Adw.ApplicationWindow):
         
         // Function to set content
         window.setEditorContent = function(content) {
-            const firstContent = document.querySelector('.page-content');
+            const firstContent = pageContents[0];
+            while (pageContents.length > 1) pageContents[1].parentElement.remove();
             firstContent.innerHTML = content.replace(/\\n/g, '<br>');
-            checkOverflow();
+            markDirty(0);
+        };
+        
+        // Timing of the most recent reflows, for checking the per-edit cost
+        window.getPaginationStats = function() {
+            return JSON.stringify(Object.assign({ pages: pageContents.length }, paginator.stats));
         };
         
         // Initialize the editor
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""Reading and writing the document formats Author supports.
+
+These are the rules the editor follows when it opens and saves files:
+encoding detection, <body> extraction, splitting into chunks to stream,
+plain text escaping, the saved HTML wrapper and atomic writes. None of it needs GTK, so the batch converter
+can share it with the editor.
+"""
+
+import codecs
+import contextlib
+import os
+import re
+import shutil
+import tempfile
+
+import conversion_service
+import document_package
+import mhtml_archive
+
+ENCODING_SAMPLE_SIZE = 64 * 1024
+READ_CHUNK_SIZE = 256 * 1024
+BODY_SEARCH_LIMIT = 1024 * 1024  # give up looking for <body> after this much text
+WRITE_BLOCK_SIZE = 1024 * 1024
+# Documents stream into the editor in chunks of about these sizes
+FIRST_CHUNK_SIZE = 32 * 1024     # small, so the first screen renders quickly
+CHUNK_SIZE = 512 * 1024
+
+SAVE_FSYNC_POLICIES = {
+    'none': "Fast (no sync)",
+    'file': "Safe (sync the file)",
+    'full': "Safest (sync the file and its folder)",
+}
+
+HTML_EXTENSIONS = ['.html', '.htm']
+MHTML_EXTENSIONS = ['.mht', '.mhtml']
+MARKDOWN_EXTENSIONS = ['.md', '.markdown']
+TEXT_EXTENSIONS = ['.txt']
+
+_BODY_OPEN_RE = re.compile(r'<body[^>]*>', re.IGNORECASE)
+_BODY_CLOSE_RE = re.compile(r'</body\s*>', re.IGNORECASE)
+_BLOCK_START_RE = re.compile(r'\s*<(div|p|h)', re.IGNORECASE)
+_TOKEN_RE = re.compile(r'<!--.*?-->|<(/?)([a-zA-Z][^\s/>]*)((?:"[^"]*"|\'[^\']*\'|[^\'">])*)>', re.DOTALL)
+_VOID_TAGS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+                        'source', 'track', 'wbr'])
+_RAW_TEXT_TAGS = frozenset(['script', 'style', 'textarea', 'title'])
+_CLOSES_P_TAGS = frozenset(['address', 'article', 'aside', 'blockquote', 'div', 'dl', 'fieldset',
+                            'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr',
+                            'ol', 'p', 'pre', 'section', 'table', 'ul'])
+
+
+def detect_encoding(filepath):
+    """Guess the file encoding from a sample of its first bytes, trying UTF-8 first"""
+    with open(filepath, 'rb') as raw_file:
+        sample = raw_file.read(ENCODING_SAMPLE_SIZE)
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    try:
+        # The sample may end in the middle of a multi-byte character
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    try:
+        import chardet
+        detected = chardet.detect(sample)
+        if detected['encoding'] and detected['confidence'] > 0.7:
+            return detected['encoding']
+    except ImportError:
+        pass  # Fallback to latin-1 if chardet not available
+    return 'latin-1'
+
+
+def read_text_chunks(filepath, encoding):
+    """Yield the decoded text of a file in READ_CHUNK_SIZE pieces"""
+    with open(filepath, 'r', encoding=encoding, errors='replace') as f:
+        while True:
+            text = f.read(READ_CHUNK_SIZE)
+            if not text:
+                return
+            yield text
+
+
+def extract_body(pieces):
+    """Yield only the text between <body> and </body>, or everything if there is no body tag"""
+    # Both loops below resume the same iterator, so a list must not be restarted
+    pieces = iter(pieces)
+    head = ''
+    for text in pieces:
+        head += text
+        match = _BODY_OPEN_RE.search(head)
+        if match:
+            head = head[match.end():].lstrip()
+            break
+        if len(head) > BODY_SEARCH_LIMIT:
+            # A fragment without a body; pass it through untouched
+            yield head
+            yield from pieces
+            return
+    else:
+        if head:
+            yield head
+        return
+
+    # Hold back enough text to recognise a </body> split across two pieces
+    pending = head
+    for text in pieces:
+        pending += text
+        match = _BODY_CLOSE_RE.search(pending)
+        if match:
+            yield pending[:match.start()]
+            return
+        keep = 16
+        if len(pending) > keep:
+            yield pending[:-keep]
+            pending = pending[-keep:]
+    match = _BODY_CLOSE_RE.search(pending)
+    yield pending[:match.start()] if match else pending
+
+
+def split_top_level(pieces):
+    """Regroup HTML text into chunks that end between top-level elements.
+
+    Each chunk can be parsed on its own and appended after the previous one.
+    The first chunk is about FIRST_CHUNK_SIZE and the rest about CHUNK_SIZE,
+    whether the text arrives in many pieces or as one string.
+    Malformed markup that never returns to the top level ends up in one chunk.
+    """
+    buffer = ''
+    start = 0        # where the next chunk begins in buffer
+    pos = 0          # scan position in buffer
+    safe = 0         # last offset at which no element is open
+    stack = []
+    raw_end = None   # closing tag regex while inside <script>, <style>, ...
+    min_size = FIRST_CHUNK_SIZE
+
+    for text in pieces:
+        # Drop what has been yielded before growing the buffer
+        buffer = buffer[start:] + text
+        pos -= start
+        safe -= start
+        start = 0
+        while True:
+            if raw_end is not None:
+                match = raw_end.search(buffer, pos)
+                if match is None:
+                    pos = max(pos, len(buffer) - 16)
+                    break
+                pos = match.end()
+                raw_end = None
+                stack.pop()
+            else:
+                lt = buffer.find('<', pos)
+                if lt < 0:
+                    pos = len(buffer)
+                    break
+                if not stack:
+                    safe = lt
+                if buffer.startswith('<!--', lt) and buffer.find('-->', lt) < 0:
+                    pos = lt
+                    break  # Comment continues in the next piece
+                match = _TOKEN_RE.match(buffer, lt)
+                if match is None:
+                    if buffer.find('>', lt) < 0:
+                        pos = lt
+                        break  # Tag continues in the next piece
+                    pos = lt + 1  # A stray '<' in text
+                    continue
+                pos = match.end()
+                closing, name, attrs = match.groups()
+                if name is not None:
+                    name = name.lower()
+                    if closing:
+                        if name in stack:
+                            # Closing an outer element implicitly closes the inner ones
+                            del stack[len(stack) - 1 - stack[::-1].index(name):]
+                    elif name in _VOID_TAGS or attrs.rstrip().endswith('/'):
+                        pass
+                    else:
+                        if stack and ((stack[-1] == 'p' and name in _CLOSES_P_TAGS) or
+                                      (stack[-1] == name and name in ('li', 'dt', 'dd', 'option'))):
+                            stack.pop()
+                        stack.append(name)
+                        if name in _RAW_TEXT_TAGS:
+                            raw_end = re.compile(rf'</{name}\s*>', re.IGNORECASE)
+            if not stack and raw_end is None:
+                safe = pos
+            if safe - start >= min_size:
+                yield buffer[start:safe]
+                start = safe
+                min_size = CHUNK_SIZE
+
+    if start < len(buffer):
+        yield buffer[start:]
+
+
+def plain_text_chunks(pieces):
+    """Yield plain text as escaped HTML with line breaks"""
+    for text in pieces:
+        text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        yield text.replace(chr(10), '<br>')
+
+
+def needs_wrapper(file_ext, first_html):
+    """True if content must go into a single div: plain text, or markup that isn't block-level"""
+    if file_ext not in HTML_EXTENSIONS + MHTML_EXTENSIONS + MARKDOWN_EXTENSIONS + [document_package.PACKAGE_EXTENSION]:
+        return True
+    return not _BLOCK_START_RE.match(first_html)
+
+
+def load_document_html(filepath, service=None, inline_assets=True):
+    """Read a file into editor HTML in one piece, as the editor would display it.
+
+    Package and MHTML images become data URLs unless inline_assets is
+    false, which is enough for callers that only want the text.
+    """
+    service = service or conversion_service.get_service()
+    file_ext = os.path.splitext(filepath)[1].lower()
+
+    if document_package.is_package(filepath):
+        package = document_package.DocumentPackage(filepath)
+        html = package.read_document()
+        if inline_assets:
+            html = package.inline_assets(html)
+    else:
+        encoding = detect_encoding(filepath)
+        if file_ext in HTML_EXTENSIONS:
+            html = ''.join(extract_body(read_text_chunks(filepath, encoding)))
+        elif file_ext in MHTML_EXTENSIONS:
+            with mhtml_archive.MhtmlArchive(filepath) as archive:
+                html = ''.join(extract_body([archive.read_html()]))
+                if inline_assets:
+                    html = archive.inline_images(html)
+        elif file_ext in MARKDOWN_EXTENSIONS:
+            html = service.convert('md-html', ''.join(read_text_chunks(filepath, encoding)))
+        else:
+            html = ''.join(plain_text_chunks(read_text_chunks(filepath, encoding)))
+
+    if needs_wrapper(file_ext, html):
+        html = f"<div>{html}</div>"
+    return html
+
+
+def html_document(editor_content):
+    """Wrap editor HTML in a complete HTML document"""
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+    <title>HTML Document</title>
+    <meta charset="utf-8">
+</head>
+<body>
+{editor_content}
+</body>
+</html>"""
+
+
+def render_document(editor_content, file_ext, service=None):
+    """Bytes of editor HTML saved as file_ext (.html, .md or .txt)"""
+    service = service or conversion_service.get_service()
+    if file_ext in MARKDOWN_EXTENSIONS:
+        return service.html_to_markdown(editor_content).encode('utf-8')
+    if file_ext in TEXT_EXTENSIONS:
+        return service.html_to_text(editor_content).encode('utf-8')
+    return html_document(editor_content).encode('utf-8')
+
+
+def save_mhtml(path, editor_content, assets, fsync_policy, location=None, progress=None):
+    """Write editor HTML as an MHTML archive, with the images it refers to as assets/<name>.
+
+    assets maps asset names to bytes, or to functions returning them.
+    """
+    html = document_package.ASSET_REF_PATTERN.sub(lambda match: 'cid:' + match.group(1), editor_content)
+    with atomic_file(path, fsync_policy) as f:
+        mhtml_archive.write_mhtml(f, html_document(html), assets.items(), location, progress)
+
+
+def atomic_write(path, data, fsync_policy, progress=None):
+    """Write data to a temporary file beside path and rename it over path"""
+    with atomic_file(path, fsync_policy) as f:
+        view = memoryview(data)
+        for start in range(0, len(view), WRITE_BLOCK_SIZE):
+            f.write(view[start:start + WRITE_BLOCK_SIZE])
+            if progress and len(view) > WRITE_BLOCK_SIZE:
+                progress(min(100, (start + WRITE_BLOCK_SIZE) * 100 // len(view)))
+
+
+@contextlib.contextmanager
+def atomic_file(path, fsync_policy):
+    """Binary file to write in steps; it replaces path only once the block finishes without error"""
+    directory = os.path.dirname(path) or '.'
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+            f.flush()
+            if fsync_policy != 'none':
+                os.fsync(f.fileno())
+        try:
+            shutil.copymode(path, temp_path)
+        except FileNotFoundError:
+            os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    if fsync_policy == 'full':
+        # Make the rename itself durable
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""Full-text index of the user's documents.
+
+Text is extracted with the rules the editor uses to open files
+(document_formats) and stored in an SQLite FTS5 table. update() only
+re-reads files whose modification time or size changed since they were
+indexed, and forgets files that are gone, so refreshing a large
+collection costs little more than a directory walk. Files under a root
+that is missing right now, such as an unmounted drive, are kept until it
+is back. search() returns
+ranked hits with a highlighted snippet.
+
+Each thread gets its own connection; the database runs in WAL mode so
+searches are not blocked while the indexer writes.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+
+import conversion_service
+import document_formats
+import document_package
+
+INDEX_EXTENSIONS = (document_formats.HTML_EXTENSIONS + document_formats.MHTML_EXTENSIONS +
+                    document_formats.MARKDOWN_EXTENSIONS + document_formats.TEXT_EXTENSIONS +
+                    [document_package.PACKAGE_EXTENSION])
+
+# Wrap the matched words in snippets; they never occur in extracted text
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+COMMIT_EVERY = 100  # files per transaction while indexing
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS roots (
+    path TEXT PRIMARY KEY,
+    recursive INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS content USING fts5(
+    title, body, tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+_QUERY_PART_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+SearchHit = namedtuple('SearchHit', ['path', 'title', 'snippet'])
+
+
+def default_index_path():
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cache_dir, 'author', 'search-index.sqlite')
+
+
+def fts_query(text):
+    """FTS5 query for what the user typed: every word must match, "quoted text" as a phrase,
+    and the last word also as a prefix so results appear while typing"""
+    terms = []
+    last_is_word = False
+    for phrase, word in _QUERY_PART_RE.findall(text):
+        term = (phrase or word).replace('"', '').strip()
+        if term:
+            terms.append('"' + term + '"')
+            last_is_word = bool(word)
+    if terms and last_is_word:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def query_terms(text):
+    """The phrases, then the single words, of a query; used to find the hit inside a document"""
+    phrases = [phrase.strip() for phrase, _ in _QUERY_PART_RE.findall(text) if phrase.strip()]
+    words = [word for word in re.findall(r'\w+', text)]
+    return phrases + [word for word in words if word not in phrases]
+
+
+def extract_text(filepath, service=None):
+    """Plain text of a document as the editor would show it"""
+    service = service or conversion_service.get_service()
+    html = document_formats.load_document_html(filepath, service, inline_assets=False)
+    return service.html_to_text(html)
+
+
+class DocumentIndex:
+    def __init__(self, path=None):
+        self.path = path or default_index_path()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        with self.connection() as db:
+            db.executescript(SCHEMA)
+
+    def connection(self):
+        """This thread's connection to the index"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute('PRAGMA journal_mode = WAL')
+            db.execute('PRAGMA synchronous = NORMAL')
+            self._local.db = db
+        return db
+
+    def add_root(self, path, recursive=True):
+        """Index the documents in path (and below it, if recursive) from now on"""
+        with self.connection() as db:
+            db.execute('INSERT INTO roots (path, recursive) VALUES (?, ?) '
+                       'ON CONFLICT (path) DO UPDATE SET recursive = max(recursive, excluded.recursive)',
+                       (os.path.abspath(path), int(recursive)))
+
+    def remove_root(self, path):
+        """Stop indexing path; its documents are dropped on the next update"""
+        with self.connection() as db:
+            db.execute('DELETE FROM roots WHERE path = ?', (os.path.abspath(path),))
+
+    def roots(self):
+        return [(path, bool(recursive)) for path, recursive in
+                self.connection().execute('SELECT path, recursive FROM roots ORDER BY path')]
+
+    def document_paths(self):
+        """Supported, non-hidden files under the roots"""
+        seen = set()
+        for root, recursive in self.roots():
+            if not os.path.isdir(root):
+                continue
+            for directory, dirnames, filenames in os.walk(root):
+                dirnames[:] = sorted(d for d in dirnames if not d.startswith('.')) if recursive else []
+                for filename in sorted(filenames):
+                    if filename.startswith('.') or os.path.splitext(filename)[1].lower() not in INDEX_EXTENSIONS:
+                        continue
+                    path = os.path.join(directory, filename)
+                    if path not in seen:
+                        seen.add(path)
+                        yield path
+
+    def update(self, progress=None, stop=None):
+        """Bring the index up to date with the files under the roots.
+
+        progress(files indexed so far) is called after every transaction;
+        setting the stop event ends the walk early, keeping what was indexed.
+        Returns (files indexed, files removed).
+        """
+        db = self.connection()
+        service = conversion_service.get_service()
+        known = {path: (file_id, mtime_ns, size) for path, file_id, mtime_ns, size in
+                 db.execute('SELECT path, id, mtime_ns, size FROM files')}
+        seen = set()
+        indexed = 0
+        for path in self.document_paths():
+            if stop is not None and stop.is_set():
+                break
+            seen.add(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = known.get(path)
+            if entry is not None and entry[1:] == (stat.st_mtime_ns, stat.st_size):
+                continue
+            try:
+                text = extract_text(path, service)
+            except Exception as e:
+                # Recorded anyway, so the file is retried only once it changes
+                print(f"Could not index {path}: {e}")
+                text = ''
+            self._store(db, path, stat, text, entry)
+            indexed += 1
+            if indexed % COMMIT_EVERY == 0:
+                db.commit()
+                if progress:
+                    progress(indexed)
+
+        removed = 0
+        if stop is None or not stop.is_set():
+            unavailable = tuple(os.path.join(root, '') for root, _ in self.roots() if not os.path.isdir(root))
+            for path, (file_id, _, _) in known.items():
+                if path not in seen and not path.startswith(unavailable):
+                    db.execute('DELETE FROM content WHERE rowid = ?', (file_id,))
+                    db.execute('DELETE FROM files WHERE id = ?', (file_id,))
+                    removed += 1
+        db.commit()
+        if progress:
+            progress(indexed)
+        return indexed, removed
+
+    def _store(self, db, path, stat, text, entry):
+        title = os.path.splitext(os.path.basename(path))[0]
+        if entry is None:
+            file_id = db.execute('INSERT INTO files (path, mtime_ns, size) VALUES (?, ?, ?)',
+                                 (path, stat.st_mtime_ns, stat.st_size)).lastrowid
+        else:
+            file_id = entry[0]
+            db.execute('UPDATE files SET mtime_ns = ?, size = ? WHERE id = ?',
+                       (stat.st_mtime_ns, stat.st_size, file_id))
+            db.execute('DELETE FROM content WHERE rowid = ?', (file_id,))
+        db.execute('INSERT INTO content (rowid, title, body) VALUES (?, ?, ?)', (file_id, title, text))
+
+    def search(self, text, limit=50):
+        """Best matches first; titles weigh more than body text"""
+        query = fts_query(text)
+        if not query:
+            return []
+        rows = self.connection().execute(
+            "SELECT files.path, content.title, snippet(content, 1, ?, ?, '…', 16) "
+            "FROM content JOIN files ON files.id = content.rowid "
+            "WHERE content MATCH ? ORDER BY bm25(content, 5.0, 1.0) LIMIT ?",
+            (MATCH_START, MATCH_END, query, limit))
+        return [SearchHit(*row) for row in rows]
+
+    def document_count(self):
+        return self.connection().execute('SELECT count(*) FROM files').fetchone()[0]
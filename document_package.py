@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""Author document packages (.hdoc).
+
+A package is a zip archive holding the editor HTML and the images it uses.
+Every image is stored once, uncompressed, as assets/<sha256><ext> and the
+HTML refers to it by that name. Images are read from the archive only when
+they are asked for.
+
+Saving appends a new revision document/<n>.html together with the assets
+the archive does not have yet, so unchanged images are never compressed or
+encoded again. The append goes to a copy of the archive that is then moved
+over the original, so a crash mid-save leaves the old package intact and
+readers never see a half-written one. Once old revisions and unused assets
+outweigh the live content the archive is rewritten from scratch instead.
+"""
+
+import base64
+import binascii
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import zipfile
+
+PACKAGE_EXTENSION = ".hdoc"
+PACKAGE_MIME_TYPE = "application/x-author-document"
+ASSET_DIR = "assets/"
+REVISION_DIR = "document/"
+
+ASSET_REF_PATTERN = re.compile(r'assets/([0-9a-f]{64}(?:\.[A-Za-z0-9]+)?)')
+_DATA_URL_PATTERN = re.compile(r'data:(image/[\w.+-]+);base64,([A-Za-z0-9+/=\s]+)')
+_REVISION_PATTERN = re.compile(r'document/(\d+)\.html$')
+
+# Compact once this many superseded revisions have piled up
+MAX_REVISIONS = 20
+
+
+def asset_name(data, mime_type):
+    """Content-addressed file name for image data"""
+    extension = mimetypes.guess_extension(mime_type) or ""
+    return hashlib.sha256(data).hexdigest() + extension
+
+
+def extract_data_urls(html):
+    """Replace base64 data URLs with asset references.
+
+    Returns the new HTML and a dict mapping asset names to their bytes.
+    """
+    assets = {}
+
+    def replace(match):
+        try:
+            data = base64.b64decode(match.group(2))
+        except (binascii.Error, ValueError):
+            return match.group(0)
+        name = asset_name(data, match.group(1))
+        assets[name] = data
+        return ASSET_DIR + name
+
+    return _DATA_URL_PATTERN.sub(replace, html), assets
+
+
+def is_package(path):
+    """True for paths that should be opened as a document package"""
+    return os.path.splitext(path)[1].lower() == PACKAGE_EXTENSION
+
+
+class DocumentPackage:
+    """Reads and incrementally writes one .hdoc archive"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _revisions(self, names):
+        revisions = []
+        for name in names:
+            match = _REVISION_PATTERN.match(name)
+            if match:
+                revisions.append(int(match.group(1)))
+        return sorted(revisions)
+
+    def read_document(self):
+        """Return the HTML of the latest revision"""
+        with zipfile.ZipFile(self.path) as archive:
+            revisions = self._revisions(archive.namelist())
+            if not revisions:
+                raise ValueError(f"{os.path.basename(self.path)} contains no document")
+            return archive.read(f"{REVISION_DIR}{revisions[-1]}.html").decode('utf-8')
+
+    def read_asset(self, name):
+        """Return the bytes of one asset"""
+        with zipfile.ZipFile(self.path) as archive:
+            return archive.read(ASSET_DIR + name)
+
+    def inline_assets(self, html):
+        """Replace asset references in html with data URLs"""
+        with zipfile.ZipFile(self.path) as archive:
+            def replace(match):
+                try:
+                    data = archive.read(ASSET_DIR + match.group(1))
+                except KeyError:
+                    return match.group(0)
+                mime_type = mimetypes.guess_type(match.group(1))[0] or 'application/octet-stream'
+                return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+            return ASSET_REF_PATTERN.sub(replace, html)
+
+    def has_asset(self, name):
+        try:
+            with zipfile.ZipFile(self.path) as archive:
+                archive.getinfo(ASSET_DIR + name)
+                return True
+        except (OSError, KeyError, zipfile.BadZipFile):
+            return False
+
+    def save(self, html, assets, fsync_policy='file'):
+        """Store html as the newest revision.
+
+        assets maps asset names to bytes, or to a callable returning bytes,
+        and only has to cover assets the archive may not contain yet; it is
+        consulted just for names the HTML refers to. fsync_policy is one of
+        document_formats.SAVE_FSYNC_POLICIES. Returns the number of asset
+        bytes written.
+        """
+        referenced = set(ASSET_REF_PATTERN.findall(html))
+        if not os.path.exists(self.path):
+            return self._rewrite(html, referenced, assets, None, fsync_policy)
+
+        with zipfile.ZipFile(self.path) as archive:
+            infos = {info.filename: info for info in archive.infolist()}
+            revisions = self._revisions(infos)
+
+        stored_assets = {name[len(ASSET_DIR):]: info.compress_size
+                         for name, info in infos.items() if name.startswith(ASSET_DIR)}
+        unused = sum(size for name, size in stored_assets.items() if name not in referenced)
+        used = sum(size for name, size in stored_assets.items() if name in referenced)
+        if len(revisions) > MAX_REVISIONS or unused > used:
+            return self._rewrite(html, referenced, assets, self.path, fsync_policy)
+
+        # Append to a copy, so the package on disk is never half written
+        temp_path = self.path + ".tmp"
+        written = 0
+        try:
+            shutil.copyfile(self.path, temp_path)
+            with zipfile.ZipFile(temp_path, 'a') as archive:
+                for name in sorted(referenced - stored_assets.keys()):
+                    data = self._asset_data(name, assets, None)
+                    if data is None:
+                        continue
+                    archive.writestr(ASSET_DIR + name, data, zipfile.ZIP_STORED)
+                    written += len(data)
+                revision = (revisions[-1] if revisions else 0) + 1
+                archive.writestr(f"{REVISION_DIR}{revision}.html", html.encode('utf-8'),
+                                 zipfile.ZIP_DEFLATED)
+            self._replace(temp_path, fsync_policy)
+        except BaseException:
+            self._discard(temp_path)
+            raise
+        return written
+
+    def _asset_data(self, name, assets, source):
+        data = assets.get(name)
+        if callable(data):
+            data = data()
+        if data is None and source is not None:
+            try:
+                with zipfile.ZipFile(source) as archive:
+                    data = archive.read(ASSET_DIR + name)
+            except KeyError:
+                pass
+        if data is None:
+            print(f"Missing package asset: {name}")
+        return data
+
+    def _rewrite(self, html, referenced, assets, source, fsync_policy):
+        """Write a compact archive with one revision and only the used assets"""
+        temp_path = self.path + ".tmp"
+        written = 0
+        try:
+            with zipfile.ZipFile(temp_path, 'w') as archive:
+                archive.writestr("mimetype", PACKAGE_MIME_TYPE, zipfile.ZIP_STORED)
+                for name in sorted(referenced):
+                    data = self._asset_data(name, assets, source)
+                    if data is None:
+                        continue
+                    archive.writestr(ASSET_DIR + name, data, zipfile.ZIP_STORED)
+                    written += len(data)
+                archive.writestr(f"{REVISION_DIR}1.html", html.encode('utf-8'), zipfile.ZIP_DEFLATED)
+            self._replace(temp_path, fsync_policy)
+        except BaseException:
+            self._discard(temp_path)
+            raise
+        return written
+
+    def _replace(self, temp_path, fsync_policy):
+        """Move a finished archive over the package"""
+        if fsync_policy != 'none':
+            with open(temp_path, 'rb+') as f:
+                os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        if fsync_policy == 'full':
+            # Make the rename itself durable
+            dir_fd = os.open(os.path.dirname(self.path) or '.', os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def _discard(self, temp_path):
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
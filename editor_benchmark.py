@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""editor-benchmark: measure the editor on synthetic documents.
+
+Drives the real editor page and script (HTMLEditorApp.get_editor_html()
+and get_editor_js()) and the toolbar scripts of src/author.py, called
+through the same bridge the app uses. Each runs in a WebView in its own
+window. Frames are only painted for mapped views, so on a machine without
+a display run it under a headless server, e.g.
+`xvfb-run python3 editor_benchmark.py`.
+
+For every synthetic document (see synthetic_documents) it measures:
+
+  open          streaming the file into the editor, up to the next paint
+  typing        insertText to the next paint, per character
+  undo/redo     time per step and undo history size, for small edits and
+                for one edit of the whole document
+  find/replace  searching and replacing a common word, and undoing it
+  fonts         font size and family applied to a whole-document selection
+  save          content capture, then writing HTML, text, Markdown and MHTML
+
+Results are written as JSON named after the commit; --compare prints the
+change against a file from an earlier run.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import htmleditor  # selects the GTK and WebKit versions the editor uses
+from gi.repository import Gtk, Gio, GLib, WebKit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+import author
+
+import conversion_service
+import document_formats
+import file_operations
+import synthetic_documents
+
+DEFAULT_SIZES = "10K,1M,10M,50M"
+TYPING_TEXT = "The quick brown fox jumps over the lazy dog. "
+FIND_WORD = "the"
+
+# Resolves after the frame following the current task has been painted
+NEXT_PAINT_JS = "const nextPaint = () => new Promise(resolve => requestAnimationFrame(() => setTimeout(resolve, 0)));\n"
+
+
+def summarize(prefix, samples):
+    """Median, 95th percentile and maximum of samples in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    return {
+        f"{prefix}_p50_ms": ordered[len(ordered) // 2],
+        f"{prefix}_p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        f"{prefix}_max_ms": ordered[-1],
+    }
+
+
+def throughput(size, seconds):
+    return size / (1024 * 1024) / seconds if seconds else None
+
+
+class Page:
+    """A WebView in its own window, driven synchronously"""
+
+    def __init__(self, webview):
+        self.webview = webview
+        self.window = Gtk.Window(title="Author benchmark", default_width=1000, default_height=800)
+        self.window.set_child(webview)
+        self.window.present()
+
+    def wait(self, start):
+        """Call start(callback) and run the main loop until the callback fires; return its arguments"""
+        received = []
+        start(lambda *args: received.append(args))
+        context = GLib.MainContext.default()
+        while not received:
+            context.iteration(True)
+        return received[0]
+
+    def wait_future(self, future):
+        context = GLib.MainContext.default()
+        while not future.done():
+            context.iteration(True)
+        return future.result()
+
+    def load(self, html, base_uri=None):
+        handler_id = None
+
+        def start(callback):
+            nonlocal handler_id
+            def on_load_changed(view, event):
+                if event == WebKit.LoadEvent.FINISHED:
+                    callback()
+            handler_id = self.webview.connect('load-changed', on_load_changed)
+            self.webview.load_html(html, base_uri)
+
+        self.wait(start)
+        self.webview.disconnect(handler_id)
+
+    def run(self, body):
+        """Run body as an async function in the page; returns its result as Python values"""
+        args = self.wait(lambda callback: self.webview.call_async_javascript_function(
+            NEXT_PAINT_JS + body, -1, None, None, None, None, callback))
+        return author.js_to_python(self.webview.call_async_javascript_function_finish(args[1]))
+
+    def close(self):
+        self.window.destroy()
+
+
+def measure_open(page, path):
+    """Stream the file into the editor the way file_operations.load_file does"""
+    start = time.perf_counter()
+    encoding = document_formats.detect_encoding(path)
+    chunks = file_operations._split_top_level(document_formats.extract_body(
+        document_formats.read_text_chunks(path, encoding)))
+    first_chunk = next(chunks, '')
+    wrap = 'true' if document_formats.needs_wrapper('.html', first_chunk) else 'false'
+    page.run(f"beginContentStream({json.dumps(first_chunk)}, {wrap});")
+    for chunk in chunks:
+        page.run(f"appendContentChunk({json.dumps(chunk)}, {wrap});")
+    page.run("endContentStream(); await nextPaint();")
+    seconds = time.perf_counter() - start
+    return {'open_ms': seconds * 1000, 'open_mb_per_s': throughput(os.path.getsize(path), seconds)}
+
+
+def measure_typing(page, count):
+    samples = page.run(f"""
+        const editor = document.getElementById('editor');
+        const range = document.createRange();
+        range.selectNodeContents(editor);
+        range.collapse(false);
+        getSelection().removeAllRanges();
+        getSelection().addRange(range);
+        const text = {json.dumps(TYPING_TEXT)};
+        const samples = [];
+        for (let i = 0; i < {count}; i++) {{
+            const start = performance.now();
+            document.execCommand('insertText', false, text[i % text.length]);
+            await nextPaint();
+            samples.push(performance.now() - start);
+        }}
+        return samples;
+    """)
+    return summarize('typing', samples)
+
+
+def measure_undo(page, steps):
+    result = page.run(f"""
+        saveState();
+        const startBytes = getStackSizes().undoBytes;
+        for (let i = 0; i < {steps}; i++) {{
+            document.execCommand('insertText', false, 'word ');
+            saveState();
+        }}
+        const smallBytes = getStackSizes().undoBytes - startBytes;
+        const undo = [], redo = [];
+        for (let i = 0; i < {steps}; i++) {{
+            const start = performance.now();
+            performUndo();
+            undo.push(performance.now() - start);
+        }}
+        for (let i = 0; i < {steps}; i++) {{
+            const start = performance.now();
+            performRedo();
+            redo.push(performance.now() - start);
+        }}
+
+        // One edit that touches the whole document
+        const range = document.createRange();
+        range.selectNodeContents(document.getElementById('editor'));
+        getSelection().removeAllRanges();
+        getSelection().addRange(range);
+        const beforeBold = getStackSizes().undoBytes;
+        let start = performance.now();
+        document.execCommand('bold', false, null);
+        saveState();
+        await nextPaint();
+        const boldMs = performance.now() - start;
+        const largeBytes = getStackSizes().undoBytes - beforeBold;
+        start = performance.now();
+        performUndo();
+        await nextPaint();
+        const largeUndoMs = performance.now() - start;
+        start = performance.now();
+        performRedo();
+        await nextPaint();
+        const largeRedoMs = performance.now() - start;
+        performUndo();
+        return {{ undo, redo, smallBytes, boldMs, largeBytes, largeUndoMs, largeRedoMs }};
+    """)
+    metrics = summarize('undo', result['undo'])
+    metrics.update(summarize('redo', result['redo']))
+    metrics.update({
+        'undo_bytes_per_small_edit': result['smallBytes'] / steps if steps else None,
+        'bold_all_ms': result['boldMs'],
+        'undo_bytes_bold_all': result['largeBytes'],
+        'undo_bold_all_ms': result['largeUndoMs'],
+        'redo_bold_all_ms': result['largeRedoMs'],
+    })
+    return metrics
+
+
+def measure_save(page, tempdir, name):
+    start = time.perf_counter()
+    html = page.run("return document.getElementById('editor').innerHTML;")
+    metrics = {'capture_ms': (time.perf_counter() - start) * 1000}
+    size = len(html.encode('utf-8'))
+
+    service = conversion_service.get_service()
+    for extension in ('.html', '.txt', '.md'):
+        if extension == '.md' and not conversion_service.HTML2TEXT_AVAILABLE:
+            continue
+        start = time.perf_counter()
+        data = document_formats.render_document(html, extension, service)
+        document_formats.atomic_write(os.path.join(tempdir, name + '-saved' + extension), data, 'none')
+        seconds = time.perf_counter() - start
+        metrics[f"save_{extension[1:]}_ms"] = seconds * 1000
+        metrics[f"save_{extension[1:]}_mb_per_s"] = throughput(size, seconds)
+
+    target = Gio.File.new_for_path(os.path.join(tempdir, name + '-saved.mhtml'))
+    start = time.perf_counter()
+    args = page.wait(lambda callback: page.webview.save_to_file(target, WebKit.SaveMode.MHTML, None, callback))
+    page.webview.save_to_file_finish(args[1])
+    seconds = time.perf_counter() - start
+    metrics['save_mhtml_ms'] = seconds * 1000
+    metrics['save_mhtml_mb_per_s'] = throughput(size, seconds)
+    return metrics
+
+
+def bench_editor(app, path, tempdir, name, args):
+    """The htmleditor page: open, typing, undo/redo and save"""
+    page = Page(WebKit.WebView(user_content_manager=app.user_content_manager, settings=app.webview_settings))
+    try:
+        page.load(app.get_editor_html(1))
+        metrics = measure_open(page, path)
+        metrics.update(measure_typing(page, args.typing))
+        metrics.update(measure_undo(page, args.undo_steps))
+        metrics.update(measure_save(page, tempdir, name))
+        return metrics
+    finally:
+        page.close()
+
+
+def bench_toolbar(html):
+    """The src/author.py toolbar scripts, called through its JsBridge: find/replace and fonts"""
+    webview = WebKit.WebView(editable=True)
+    bridge = author.JsBridge(webview)
+    page = Page(webview)
+    try:
+        page.load(document_formats.html_document(html), "file:///")
+        for script in (author.EditorWindow.rpc_script, author.EditorWindow.formatting_state_script,
+                       author.EditorWindow.virtual_render_script, author.EditorWindow.find_engine_script):
+            page.run(script(None))
+
+        def timed(method, *params):
+            start = time.perf_counter()
+            result = page.wait_future(bridge.call(method, *params))
+            page.run("await nextPaint();")
+            return result, (time.perf_counter() - start) * 1000
+
+        options = {'matchCase': False, 'wholeWord': True, 'regex': False}
+        found, find_ms = timed('find.search', FIND_WORD, options)
+        replaced, replace_ms = timed('find.replaceAll', FIND_WORD, options, FIND_WORD.upper())
+        _, replace_undo_ms = timed('undo')
+        page.wait_future(bridge.call('find.close'))
+
+        page.wait_future(bridge.call('execCommand', 'selectAll'))
+        _, font_size_ms = timed('setFontSize', '14')
+        page.wait_future(bridge.call('execCommand', 'selectAll'))
+        _, font_family_ms = timed('setFontFamily', 'Serif')
+        return {
+            'find_ms': find_ms,
+            'find_matches': found['count'],
+            'replace_all_ms': replace_ms,
+            'replace_all_replaced': replaced.get('replaced'),
+            'replace_undo_ms': replace_undo_ms,
+            'font_size_all_ms': font_size_ms,
+            'font_family_all_ms': font_family_ms,
+        }
+    finally:
+        page.close()
+
+
+def git_commit():
+    """Short hash of HEAD, with -dirty if tracked files have changed; None outside git"""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=directory,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        changes = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=directory,
+                                 capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if changes else '')
+
+
+def print_comparison(baseline, results):
+    """Change of every metric present in both runs; throughputs are better when higher"""
+    print(f"Compared with {baseline.get('commit') or 'baseline'}:")
+    before = {document['name']: document['metrics'] for document in baseline['documents']}
+    for document in results['documents']:
+        old_metrics = before.get(document['name'])
+        if old_metrics is None:
+            continue
+        for metric, value in document['metrics'].items():
+            old = old_metrics.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / old * 100
+            print(f"  {document['name']:<14} {metric:<28} {old:12.2f} -> {value:12.2f}  {change:+7.1f}%")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="editor-benchmark",
+        description="Measure the editor on synthetic documents and store the results as JSON.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"document sizes, e.g. 10K,1M (default: {DEFAULT_SIZES})")
+    parser.add_argument("--kinds", default=','.join(synthetic_documents.KINDS),
+                        help="document kinds (default: all of %(default)s)")
+    parser.add_argument("--typing", type=int, default=200, help="characters typed per document")
+    parser.add_argument("--undo-steps", type=int, default=50, help="edits undone and redone per document")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic documents")
+    parser.add_argument("-o", "--output",
+                        help="results file (default: benchmark-results/<commit>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="results file of an earlier run to compare with")
+    args = parser.parse_args(argv)
+    kinds = [kind.strip() for kind in args.kinds.split(',') if kind.strip()]
+    unknown = [kind for kind in kinds if kind not in synthetic_documents.KINDS]
+    if unknown:
+        parser.error(f"unknown document kind: {', '.join(unknown)}")
+    args.kinds = kinds
+    try:
+        args.sizes = [synthetic_documents.parse_size(size) for size in args.sizes.split(',') if size.strip()]
+    except ValueError:
+        parser.error(f"invalid --sizes: {args.sizes}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    app = htmleditor.HTMLEditorApp()
+    app.setup_web_content()
+    results = {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'webkit': f"{WebKit.get_major_version()}.{WebKit.get_minor_version()}.{WebKit.get_micro_version()}",
+        'documents': [],
+    }
+
+    with tempfile.TemporaryDirectory(prefix="author-benchmark-") as tempdir:
+        for kind in args.kinds:
+            for size in args.sizes:
+                name = f"{kind}-{synthetic_documents.size_name(size)}"
+                html = synthetic_documents.generate(kind, size, args.seed)
+                path = os.path.join(tempdir, name + '.html')
+                document_formats.atomic_write(path, document_formats.html_document(html).encode('utf-8'), 'none')
+
+                metrics = bench_editor(app, path, tempdir, name, args)
+                metrics.update(bench_toolbar(html))
+                results['documents'].append({
+                    'name': name,
+                    'kind': kind,
+                    'bytes': os.path.getsize(path),
+                    'metrics': metrics,
+                })
+                print(f"{name:<14} open {metrics['open_ms']:9.1f} ms  "
+                      f"typing p50 {metrics.get('typing_p50_ms', 0):6.1f} ms  "
+                      f"undo p50 {metrics.get('undo_p50_ms', 0):6.2f} ms  "
+                      f"replace {metrics['replace_all_ms']:8.1f} ms  "
+                      f"save html {metrics['save_html_mb_per_s'] or 0:6.1f} MB/s", flush=True)
+
+    output = args.output or os.path.join('benchmark-results', f"{results['commit'] or 'working-tree'}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}", file=sys.stderr)
+
+    if baseline is not None:
+        print_comparison(baseline, results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Opt-in performance telemetry for the editor.
+
+Start the editor with --telemetry to collect histograms while it runs.
+The page measures keydown-to-paint latency, DOM node count and undo
+history size; Python measures JavaScript round trips and save durations.
+The Performance dialog shows them live, and they are written to a JSON
+file when the editor exits so runs can be compared.
+
+Nothing is measured unless the flag is given.
+"""
+
+import json
+import math
+import os
+import time
+
+TELEMETRY_FLAG = "--telemetry"
+
+# Bucket i holds values up to BUCKET_BASE * 2**i; the last one holds the rest
+BUCKET_BASE = 0.25
+BUCKET_COUNT = 48
+
+# Units of the metrics the page reports; Python callers pass their own
+PAGE_METRIC_UNITS = {
+    'keydown to paint': 'ms',
+    'dom nodes': 'nodes',
+    'undo history': 'bytes',
+    'sanitized nodes': 'nodes',
+}
+
+
+def bucket_index(value):
+    if value <= BUCKET_BASE:
+        return 0
+    return min(BUCKET_COUNT - 1, math.ceil(math.log2(value / BUCKET_BASE)))
+
+
+def bucket_bound(index):
+    return BUCKET_BASE * 2 ** index
+
+
+class Histogram:
+    """Log-scale histogram; percentiles are estimated from bucket bounds"""
+
+    def __init__(self, unit):
+        self.unit = unit
+        self.buckets = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.buckets[bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, delta):
+        """Add a batch the page collected: {buckets: {index: n}, count, sum, min, max}"""
+        if not delta.get('count'):
+            return
+        for index, n in delta['buckets'].items():
+            self.buckets[min(int(index), BUCKET_COUNT - 1)] += n
+        self.count += delta['count']
+        self.total += delta['sum']
+        self.min = delta['min'] if self.min is None else min(self.min, delta['min'])
+        self.max = delta['max'] if self.max is None else max(self.max, delta['max'])
+
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(bucket_bound(index), self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'unit': self.unit,
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'buckets': {f"{bucket_bound(i):g}": n for i, n in enumerate(self.buckets) if n},
+        }
+
+
+class Telemetry:
+    """Histograms by metric name; every call is a no-op unless enabled"""
+
+    def __init__(self):
+        self.enabled = False
+        self.started = time.time()
+        self.histograms = {}
+
+    def enable_from_argv(self, argv):
+        """Turn telemetry on if the flag is present, removing it so GTK does not see it"""
+        if TELEMETRY_FLAG in argv:
+            argv.remove(TELEMETRY_FLAG)
+            self.enabled = True
+        return self.enabled
+
+    def histogram(self, name, unit):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(unit)
+        return histogram
+
+    def record(self, name, value, unit='ms'):
+        if self.enabled:
+            self.histogram(name, unit).add(value)
+
+    def merge_page_report(self, histograms):
+        """Merge the histogram batches a page posted"""
+        if self.enabled:
+            for name, delta in histograms.items():
+                self.histogram(name, PAGE_METRIC_UNITS.get(name, 'ms')).merge(delta)
+
+    def timed(self, name, callback=None):
+        """Wrap an async callback so the time until it runs is recorded under name.
+
+        Without a callback the returned function only finishes a
+        WebView.evaluate_javascript() call. Disabled, callback is returned as is.
+        """
+        if not self.enabled:
+            return callback
+        start = time.perf_counter()
+
+        def finished(*args):
+            self.record(name, (time.perf_counter() - start) * 1000)
+            if callback is not None:
+                return callback(*args)
+            webview, result = args[0], args[1]
+            try:
+                webview.evaluate_javascript_finish(result)
+            except Exception as e:
+                print(f"JavaScript error: {e}")
+        return finished
+
+    def snapshot(self):
+        return {
+            'started': self.started,
+            'duration': time.time() - self.started,
+            'histograms': {name: h.to_dict() for name, h in sorted(self.histograms.items())},
+        }
+
+    def default_dump_path(self):
+        cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started))
+        return os.path.join(cache_dir, 'author', f"telemetry-{stamp}.json")
+
+    def dump(self, path=None):
+        """Write the snapshot as JSON and return the path written"""
+        path = path or self.default_dump_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(temp_path, path)
+        return path
+
+
+telemetry = Telemetry()
@@ -2,25 +2,31 @@
 
 import os
 import re
+import time
+import json
+import base64
+import hashlib
+import mimetypes
+import zipfile
+import concurrent.futures
 import importlib.util
 from datetime import datetime
 from gi.repository import Gtk, GLib, Gio, WebKit
 
-# Check if markdown package is available
-MARKDOWN_AVAILABLE = False
-try:
-    import markdown
-    MARKDOWN_AVAILABLE = True
-except ImportError:
-    pass
-
-# Check if html2text package is available (for HTML to Markdown conversion)
-HTML2TEXT_AVAILABLE = False
-try:
-    import html2text
-    HTML2TEXT_AVAILABLE = True
-except ImportError:
-    pass
+import document_package
+import conversion_service
+import document_formats
+import mhtml_archive
+from conversion_service import MARKDOWN_AVAILABLE, HTML2TEXT_AVAILABLE
+from editor_telemetry import telemetry
+
+# Saves run one at a time on this worker; only content capture uses the main thread
+_save_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="author-save")
+SAVE_FSYNC_POLICIES = document_formats.SAVE_FSYNC_POLICIES
+
+# Images of open document packages and MHTML archives are served lazily under this scheme
+PACKAGE_SCHEME = "author-package"
+_PACKAGE_URL_PATTERN = re.compile(PACKAGE_SCHEME + r'://([0-9a-f]+)/([0-9a-f]{64}(?:\.[A-Za-z0-9]+)?)')
 
 # Open operations
 def on_open_clicked(self, win, button):
@@ -45,11 +51,16 @@ def on_open_clicked(self, win, button):
     filter_txt.set_name("Text files")
     filter_txt.add_pattern("*.txt")
     
+    filter_package = Gtk.FileFilter()
+    filter_package.set_name("Author documents")
+    filter_package.add_pattern("*.hdoc")
+    
     filter_all = Gtk.FileFilter()
     filter_all.set_name("All files")
     filter_all.add_pattern("*")
     
     filter_list = Gio.ListStore.new(Gtk.FileFilter)
+    filter_list.append(filter_package)
     filter_list.append(filter_html)
     filter_list.append(filter_md)
     filter_list.append(filter_txt)
@@ -90,100 +101,76 @@ def on_open_current_window_response(self, win, dialog, result):
         if e.domain != 'gtk-dialog-error-quark' or e.code != 2:  # Ignore cancel
             self.show_error_dialog(f"Error opening file: {e}")
 
-def load_file(self, win, filepath):
-    """Load file content into editor with support for various formats"""
+def load_file(self, win, filepath, after_load=None):
+    """Load file content into editor with support for various formats.
+    
+    after_load() runs once the whole document is in the editor.
+    """
     try:
         # Store the original file path format for reference
         win.original_format = os.path.splitext(filepath)[1].lower()
+        if self.index_opened_folders:
+            self.queue_index_root(os.path.dirname(os.path.abspath(filepath)), recursive=False)
         
-        # Try to detect file encoding
-        encoding = 'utf-8'  # Default encoding
-        try:
-            import chardet
-            with open(filepath, 'rb') as raw_file:
-                raw_content = raw_file.read()
-                detected = chardet.detect(raw_content)
-                if detected['confidence'] > 0.7:
-                    encoding = detected['encoding']
-        except ImportError:
-            pass  # Fallback to utf-8 if chardet not available
-            
-        # Now read the file with the detected encoding
-        try:
-            with open(filepath, 'r', encoding=encoding) as f:
-                content = f.read()
-        except UnicodeDecodeError:
-            # If there's a decode error, try a fallback encoding
-            with open(filepath, 'r', encoding='latin-1') as f:
-                content = f.read()
+        encoding = document_formats.detect_encoding(filepath)
         
         # Determine file type and process accordingly
         file_ext = os.path.splitext(filepath)[1].lower()
         
-        if file_ext in ['.mht', '.mhtml']:
-            # Handle MHTML files - extract the HTML content
-            try:
-                import email
-                message = email.message_from_string(content)
-                for part in message.walk():
-                    if part.get_content_type() == 'text/html':
-                        content = part.get_payload(decode=True).decode(part.get_content_charset() or 'utf-8')
-                        break
-            except ImportError:
-                # Fallback to regex extraction if email module not ideal
-                body_match = re.search(r'Content-Type: text/html.*?charset=["\']?([\w-]+)["\']?.*?(?:\r?\n){2}(.*?)(?:\r?\n){1,2}--', 
-                                       content, re.DOTALL | re.IGNORECASE)
-                if body_match:
-                    charset, html_content = body_match.groups()
-                    content = html_content
-                    
-            # Extract body content from the HTML
-            body_match = re.search(r'<body[^>]*>(.*?)</body>', content, re.DOTALL | re.IGNORECASE)
-            if body_match:
-                content = body_match.group(1).strip()
-                    
+        converted = None
+        if document_package.is_package(filepath):
+            # Images stay in the archive until the WebView requests them
+            package = self.open_document_package(filepath)
+            html = document_package.ASSET_REF_PATTERN.sub(
+                lambda match: f"{PACKAGE_SCHEME}://{package.token}/{match.group(1)}", package.read_document())
+            chunks = document_formats.split_top_level([html])
         elif file_ext in ['.html', '.htm']:
-            # Handle HTML content
-            body_match = re.search(r'<body[^>]*>(.*?)</body>', content, re.DOTALL | re.IGNORECASE)
-            if body_match:
-                content = body_match.group(1).strip()
-                
-        elif file_ext in ['.md', '.markdown']:
-            # Convert markdown to HTML
-            if MARKDOWN_AVAILABLE:
-                try:
-                    # Get available extensions
-                    available_extensions = []
-                    for ext in ['tables', 'fenced_code', 'codehilite', 'nl2br', 'sane_lists', 'smarty', 'attr_list']:
-                        try:
-                            # Test if extension can be loaded
-                            markdown.markdown("test", extensions=[ext])
-                            available_extensions.append(ext)
-                        except (ImportError, ValueError):
-                            pass
-                    
-                    # Convert markdown to HTML
-                    content = markdown.markdown(content, extensions=available_extensions)
-                except Exception as e:
-                    print(f"Error converting markdown: {e}")
-                    # Fallback to simple conversion
-                    content = _simple_markdown_to_html(content)
-            else:
-                # Use simplified markdown conversion
-                content = _simple_markdown_to_html(content)
-        else:  # .txt or other plain text
-            # Convert plain text to HTML
-            content = content.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-            content = f"<div>{content.replace(chr(10), '<br>')}</div>"
+            # Stream the body of HTML files without reading the whole file first
+            chunks = document_formats.split_top_level(document_formats.extract_body(
+                document_formats.read_text_chunks(filepath, encoding)))
+        elif file_ext in ['.mht', '.mhtml']:
+            # Only the HTML part is read now; images are found in the archive when the WebView asks for them
+            archive = self.open_document_package(filepath, reopen=True, win=win)
+            converted = conversion_service.get_service().run(
+                _mhtml_editor_html, archive, lambda name: f"{PACKAGE_SCHEME}://{archive.token}/{name}")
+            chunks = None
+        elif file_ext not in ['.md', '.markdown', '.hdoc']:
+            # Convert plain text to HTML piece by piece
+            chunks = document_formats.plain_text_chunks(document_formats.read_text_chunks(filepath, encoding))
+        else:
+            # Markdown converts as a whole, on the conversion service's workers
+            with open(filepath, 'r', encoding=encoding, errors='replace') as f:
+                content = f.read()
+            converted = conversion_service.get_service().submit('md-html', content)
+            chunks = None
         
-        # Ensure content is properly wrapped in a div if not already
-        if not (content.strip().startswith('<div') or content.strip().startswith('<p') or 
-                content.strip().startswith('<h')):
-            content = f"<div>{content}</div>"
+        win.load_generation = getattr(win, 'load_generation', 0) + 1
+        generation = win.load_generation
         
-        # Escape for JavaScript
-        content = content.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
-        js_code = f'setContent("{content}");'
+        def on_loaded():
+            win.statusbar.set_text(f"Opened {os.path.basename(filepath)}")
+            self.check_autosave_recovery(win, filepath)
+            if after_load:
+                after_load()
+        
+        def start_stream():
+            if win.load_generation != generation:
+                return False
+            if converted is not None and not converted.done():
+                converted.add_done_callback(lambda future: GLib.idle_add(start_stream))
+                return False
+            try:
+                stream_chunks = chunks if converted is None else document_formats.split_top_level([converted.result()])
+                first_chunk = next(stream_chunks, '')
+            except Exception as e:
+                print(f"Error loading file: {e}")
+                win.statusbar.set_text(f"Error loading file: {e}")
+                self.show_error_dialog(f"Error loading file: {e}")
+                return False
+            # Plain text always goes into a single div; other content only if it isn't block-level
+            wrap = document_formats.needs_wrapper(file_ext, first_chunk)
+            self.stream_content(win, generation, first_chunk, stream_chunks, wrap, on_loaded)
+            return False
         
         # Check WebView load status and execute JS accordingly
         def execute_when_ready():
@@ -191,14 +178,13 @@ def load_file(self, win, filepath):
             load_status = win.webview.get_estimated_load_progress()
             
             if load_status == 1.0:  # Fully loaded
-                # Execute directly
-                self.execute_js(win, js_code)
+                start_stream()
                 return False  # Stop the timeout
             else:
                 # Set up a handler for when loading finishes
                 def on_load_changed(webview, event):
                     if event == WebKit.LoadEvent.FINISHED:
-                        self.execute_js(win, js_code)
+                        start_stream()
                         webview.disconnect_by_func(on_load_changed)
                 
                 win.webview.connect("load-changed", on_load_changed)
@@ -211,37 +197,96 @@ def load_file(self, win, filepath):
         win.current_file = Gio.File.new_for_path(filepath)
         win.modified = False
         self.update_window_title(win)
-        win.statusbar.set_text(f"Opened {os.path.basename(filepath)}")
+        win.statusbar.set_text(f"Opening {os.path.basename(filepath)}…")
     except Exception as e:
         print(f"Error loading file: {str(e)}")
         win.statusbar.set_text(f"Error loading file: {str(e)}")
         # Call show_error_dialog if it exists
         self.show_error_dialog(f"Error loading file: {e}")
 
-def _simple_markdown_to_html(content):
-    """Static method for simple markdown to HTML conversion as fallback"""
-    html = content
-    
-    # Basic markdown conversions
-    html = re.sub(r'^# (.*?)$', r'<h1>\1</h1>', html, flags=re.MULTILINE)
-    html = re.sub(r'^## (.*?)$', r'<h2>\1</h2>', html, flags=re.MULTILINE)
-    html = re.sub(r'^### (.*?)$', r'<h3>\1</h3>', html, flags=re.MULTILINE)
-    html = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', html)
-    html = re.sub(r'\*(.*?)\*', r'<em>\1</em>', html)
-    html = re.sub(r'`(.*?)`', r'<code>\1</code>', html)
-    html = re.sub(r'\[(.*?)\]\((.*?)\)', r'<a href="\2">\1</a>', html)
-    
-    # Convert paragraphs
-    paragraphs = re.split(r'\n\s*\n', html)
-    processed_paragraphs = []
-    for p in paragraphs:
-        if p.strip() and not p.strip().startswith('<'):
-            processed_paragraphs.append(f'<p>{p}</p>')
-        else:
-            processed_paragraphs.append(p)
+def stream_content(self, win, generation, first_chunk, chunks, wrap, on_finished):
+    """Send document chunks to the editor one at a time, waiting for each to be applied"""
+    wrap_js = 'true' if wrap else 'false'
+    
+    def send_next(webview=None, result=None, user_data=None):
+        if result is not None:
+            try:
+                webview.evaluate_javascript_finish(result)
+            except GLib.Error as e:
+                print(f"Error appending content: {e}")
+        # A newer load_file call owns the editor now
+        if win.load_generation != generation:
+            return
+        try:
+            chunk = next(chunks, None)
+        except Exception as e:
+            print(f"Error loading file: {e}")
+            win.statusbar.set_text(f"Error loading file: {e}")
+            chunk = None
+        if chunk is None:
+            self.execute_js(win, "endContentStream();")
+            on_finished()
+            return
+        win.webview.evaluate_javascript(f"appendContentChunk({json.dumps(chunk)}, {wrap_js});",
+                                        -1, None, None, None, telemetry.timed('js: append chunk', send_next), None)
+    
+    win.webview.evaluate_javascript(f"beginContentStream({json.dumps(first_chunk)}, {wrap_js});",
+                                    -1, None, None, None, telemetry.timed('js: append chunk', send_next), None)
+
+def open_document_package(self, filepath, reopen=False, win=None):
+    """Return the package or MHTML archive for a path, registering it for asset requests.
     
-    html = '\n'.join(processed_paragraphs)
-    return html
+    reopen replaces an MHTML archive opened before, which may be outdated, for
+    loading into win. The old archive is closed unless another window still
+    shows its document.
+    """
+    realpath = os.path.realpath(filepath)
+    token = hashlib.sha1(realpath.encode('utf-8')).hexdigest()[:16]
+    package = self.document_packages.get(token)
+    if package is None or reopen:
+        previous = package
+        if document_package.is_package(filepath):
+            package = document_package.DocumentPackage(filepath)
+        else:
+            package = mhtml_archive.MhtmlArchive(filepath)
+        package.token = token
+        self.document_packages[token] = package
+        if isinstance(previous, mhtml_archive.MhtmlArchive) and not any(
+                other is not win and other.current_file and other.current_file.get_path()
+                and os.path.realpath(other.current_file.get_path()) == realpath
+                for other in self.windows):
+            previous.close()
+    return package
+
+def on_package_asset_request(self, request):
+    """Serve an image of an open document package or MHTML archive to the WebView"""
+    match = _PACKAGE_URL_PATTERN.match(request.get_uri())
+    try:
+        if match is None:
+            raise KeyError(request.get_uri())
+        data = self.document_packages[match.group(1)].read_asset(match.group(2))
+        mime_type = mimetypes.guess_type(match.group(2))[0] or 'application/octet-stream'
+        request.finish(Gio.MemoryInputStream.new_from_bytes(GLib.Bytes.new(data)), len(data), mime_type)
+    except (KeyError, OSError, ValueError, zipfile.BadZipFile) as e:
+        request.finish_error(GLib.Error.new_literal(Gio.io_error_quark(), f"Image not available: {e}",
+                                                    Gio.IOErrorEnum.NOT_FOUND))
+
+def inline_package_assets(self, html):
+    """Turn package image URLs into data URLs for formats that cannot refer to the archive"""
+    def replace(match):
+        try:
+            data = self.document_packages[match.group(1)].read_asset(match.group(2))
+        except (KeyError, OSError, ValueError, zipfile.BadZipFile):
+            return match.group(0)
+        mime_type = mimetypes.guess_type(match.group(2))[0] or 'application/octet-stream'
+        return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+    return _PACKAGE_URL_PATTERN.sub(replace, html)
+
+# Kept for callers that split documents directly, such as the benchmark
+_split_top_level = document_formats.split_top_level
+
+# Kept for callers that bind the fallback converter directly
+_simple_markdown_to_html = conversion_service.simple_markdown_to_html
 
 # Save operations
 def on_save_clicked(self, win, button):
@@ -260,6 +305,8 @@ def on_save_clicked(self, win, button):
             self.save_as_markdown(win, win.current_file)
         elif file_ext in ['.txt']:
             self.save_as_text(win, win.current_file)
+        elif file_ext == document_package.PACKAGE_EXTENSION:
+            self.save_as_package(win, win.current_file)
         else:
             # For unknown extensions, save as MHTML by default
             self.save_as_mhtml(win, win.current_file)
@@ -291,10 +338,15 @@ def show_save_dialog(self, win, is_save_as=False):
     filter_txt.set_name("Text files (*.txt)")
     filter_txt.add_pattern("*.txt")
     
+    filter_package = Gtk.FileFilter()
+    filter_package.set_name("Author documents (*.hdoc)")
+    filter_package.add_pattern("*.hdoc")
+    
     filters = Gio.ListStore.new(Gtk.FileFilter)
     filters.append(filter_mht)  # MHT first as default
     filters.append(filter_html)
     filters.append(filter_txt)
+    filters.append(filter_package)
     
     # Only add markdown filter if html2text is available
     if HTML2TEXT_AVAILABLE:
@@ -344,6 +396,8 @@ def save_dialog_callback(self, win, dialog, result):
                 self.save_as_markdown(win, file)
             elif file_ext in ['.txt']:
                 self.save_as_text(win, file)
+            elif file_ext == document_package.PACKAGE_EXTENSION:
+                self.save_as_package(win, file)
             else:
                 # For unknown extensions, save as MHTML by default
                 self.save_as_mhtml(win, file)
@@ -368,62 +422,25 @@ def save_dialog_callback(self, win, dialog, result):
 
 
 def save_as_mhtml(self, win, file):
-    """Save document as MHTML using WebKit's save method"""
-    try:
-        # Get the file URI
-        file_uri = file.get_uri()
-        
-        # Check which WebKit version and methods are available
-        if hasattr(win.webview, 'save_to_file'):
-            # WebKit 6.0+ method
-            win.webview.save_to_file(file, WebKit.SaveMode.MHTML, None, 
-                                  lambda webview, result: self.save_webkit_callback(win, file, result))
-        elif hasattr(win.webview, 'save'):
-            # Older WebKit method
-            win.webview.save(WebKit.SaveMode.MHTML, None,  # No cancellable
-                          lambda webview, result: self.save_webkit_callback(win, file, result))
-        else:
-            # Fallback for even older WebKit versions
-            print("WebKit save methods not available, falling back to HTML")
-            self.save_as_html(win, file)
-            return
-            
-        win.statusbar.set_text(f"Saving MHTML file: {file.get_path()}")
-    except Exception as e:
-        print(f"Error saving as MHTML: {e}")
-        win.statusbar.set_text(f"Error saving MHTML: {e}")
-        # Fallback to manual saving
-        self.save_as_html(win, file)
+    """Save document and its images as an MHTML archive, written part by part on the save worker"""
+    win.webview.evaluate_javascript(
+        "document.getElementById('editor').innerHTML",
+        -1, None, None, None,
+        telemetry.timed('js: capture content', lambda webview, result, data: self.save_mhtml_callback(win, webview, result, file)),
+        None
+    )
+    win.statusbar.set_text(f"Saving MHTML file: {file.get_path()}")
 
-def save_webkit_callback(self, win, file, result):
-    """Handle WebKit save result"""
+def save_mhtml_callback(self, win, webview, result, file):
+    """Hand the editor HTML to the save worker for the MHTML archive"""
     try:
-        # Check if this is a WebKit 6.0+ result with get_web_error
-        if hasattr(result, 'get_web_error'):
-            error = result.get_web_error()
-            if error is None:
-                # Successful WebKit save
-                win.current_file = file
-                win.modified = False
-                self.update_window_title(win)
-                win.statusbar.set_text(f"Saved: {file.get_path()}")
-            else:
-                # WebKit save failed
-                print(f"WebKit save error: {error.get_message()}")
-                win.statusbar.set_text(f"Error: {error.get_message()}")
-                # Fallback to manual saving
-                self.save_as_html(win, file)
-        else:
-            # For older WebKit versions without detailed error info
-            # Just assume success and update the UI
-            win.current_file = file
-            win.modified = False
-            self.update_window_title(win)
-            win.statusbar.set_text(f"Saved: {file.get_path()}")
+        js_result = webview.evaluate_javascript_finish(result)
+        if js_result:
+            editor_content = js_result.get_js_value().to_string() if hasattr(js_result, 'get_js_value') else js_result.to_string()
+            self.save_content(win, file, editor_content, _mhtml_converter(self, file))
     except Exception as e:
-        print(f"Error in WebKit save callback: {e}")
-        # Fallback to manual saving
-        self.save_as_html(win, file)
+        print(f"Error processing MHTML for save: {e}")
+        win.statusbar.set_text(f"Error saving MHTML: {e}")
 
 def save_as_html(self, win, file):
     """Save document as HTML by extracting just the editor content"""
@@ -431,13 +448,13 @@ def save_as_html(self, win, file):
     win.webview.evaluate_javascript(
         "document.getElementById('editor').innerHTML",
         -1, None, None, None,
-        lambda webview, result, data: self.save_html_callback(win, webview, result, file),
+        telemetry.timed('js: capture content', lambda webview, result, data: self.save_html_callback(win, webview, result, file)),
         None
     )
     win.statusbar.set_text(f"Saving HTML file: {file.get_path()}")
 
 def save_html_callback(self, win, webview, result, file):
-    """Process HTML content from webview and save to file"""
+    """Hand the editor HTML to the save worker"""
     try:
         js_result = webview.evaluate_javascript_finish(result)
         if js_result:
@@ -446,44 +463,7 @@ def save_html_callback(self, win, webview, result, file):
                 editor_content = js_result.get_js_value().to_string()
             else:
                 editor_content = js_result.to_string()
-            
-            # Wrap the content in a proper HTML document
-            html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <title>HTML Document</title>
-    <meta charset="utf-8">
-</head>
-<body>
-{editor_content}
-</body>
-</html>"""
-
-            # Convert the string to bytes
-            content_bytes = html_content.encode('utf-8')
-            
-            # Use the synchronous replace_contents method
-            try:
-                success, etag = file.replace_contents(
-                    content_bytes,
-                    None,  # etag
-                    False,  # make_backup
-                    Gio.FileCreateFlags.REPLACE_DESTINATION,
-                    None   # cancellable
-                )
-                
-                if success:
-                    win.current_file = file
-                    win.modified = False
-                    self.update_window_title(win)
-                    win.statusbar.set_text(f"Saved: {file.get_path()}")
-                else:
-                    win.statusbar.set_text("File save was not successful")
-                    
-            except GLib.Error as e:
-                print(f"Error writing file: {e.message if hasattr(e, 'message') else str(e)}")
-                win.statusbar.set_text(f"Error writing file: {str(e)}")
-                
+            self.save_html_content(win, editor_content, file)
     except Exception as e:
         print(f"Error processing HTML for save: {e}")
         win.statusbar.set_text(f"Error saving HTML: {e}")
@@ -504,7 +484,7 @@ def save_as_html_fallback(self, win, file):
         self.show_error_dialog(win, f"Could not save file: {e}")
 
 def save_html_body_callback(self, win, webview, result, file):
-    """Process HTML body content and save to file"""
+    """Hand the HTML body content to the save worker"""
     try:
         js_result = webview.evaluate_javascript_finish(result)
         if js_result:
@@ -513,44 +493,8 @@ def save_html_body_callback(self, win, webview, result, file):
                 body_content = js_result.get_js_value().to_string()
             else:
                 body_content = js_result.to_string()
-            
-            # Create a complete HTML document
-            html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <title>HTML Document</title>
-    <meta charset="utf-8">
-</head>
-<body>
-{body_content}
-</body>
-</html>"""
-
-            # Convert the string to bytes
-            content_bytes = html_content.encode('utf-8')
-            
-            # Use the simpler replace_contents method
-            try:
-                success, etag = file.replace_contents(
-                    content_bytes,
-                    None,  # etag
-                    False,  # make_backup
-                    Gio.FileCreateFlags.REPLACE_DESTINATION,
-                    None   # cancellable
-                )
-                
-                if success:
-                    win.current_file = file
-                    win.modified = False
-                    self.update_window_title(win)
-                    win.statusbar.set_text(f"Saved: {file.get_path()}")
-                else:
-                    win.statusbar.set_text("File save was not successful")
-                    
-            except GLib.Error as e:
-                print(f"Error writing file: {e.message}")
-                win.statusbar.set_text(f"Error writing file: {e.message}")
-                
+            self.save_content(win, file, body_content,
+                              lambda content: document_formats.html_document(self.inline_package_assets(content)).encode('utf-8'))
         else:
             print("Failed to get HTML content from webview")
             win.statusbar.set_text("Failed to get HTML content for saving")
@@ -558,32 +502,45 @@ def save_html_body_callback(self, win, webview, result, file):
         print(f"Error processing HTML body for save: {e}")
         win.statusbar.set_text(f"Error saving HTML: {e}")
 
+def save_as_package(self, win, file):
+    """Save document as an Author package, writing only images the archive lacks"""
+    win.webview.evaluate_javascript(
+        "document.getElementById('editor').innerHTML",
+        -1, None, None, None,
+        telemetry.timed('js: capture content', lambda webview, result, data: self.save_package_callback(win, webview, result, file)),
+        None
+    )
+    win.statusbar.set_text(f"Saving document package: {file.get_path()}")
+
+def save_package_callback(self, win, webview, result, file):
+    """Hand the editor HTML to the save worker for the package"""
+    try:
+        js_result = webview.evaluate_javascript_finish(result)
+        if js_result:
+            editor_content = js_result.get_js_value().to_string() if hasattr(js_result, 'get_js_value') else js_result.to_string()
+            self.save_html_content(win, editor_content, file)
+    except Exception as e:
+        print(f"Error processing document package for save: {e}")
+        win.statusbar.set_text(f"Error saving document package: {e}")
+
 def save_as_text(self, win, file):
     """Save document as plain text by extracting text content from the webview"""
     win.webview.evaluate_javascript(
-        "document.body.innerText || document.body.textContent",
+        # Long tables may hide their off-screen rows, which innerText would leave out
+        "withAllTableRows(() => document.body.innerText) || document.body.textContent",
         -1, None, None, None,
-        lambda webview, result, data: self.save_text_callback(win, webview, result, file),
+        telemetry.timed('js: capture content', lambda webview, result, data: self.save_text_callback(win, webview, result, file)),
         None
     )
     win.statusbar.set_text(f"Saving text file: {file.get_path()}")
 
 def save_text_callback(self, win, webview, result, file):
-    """Process text content from webview and save to file"""
+    """Hand the text content to the save worker"""
     try:
         js_result = webview.evaluate_javascript_finish(result)
         if js_result:
             text_content = js_result.get_js_value().to_string() if hasattr(js_result, 'get_js_value') else js_result.to_string()
-            
-            # Replace the file with the new content
-            file.replace_contents_async(
-                text_content.encode('utf-8'),
-                None,
-                False,
-                Gio.FileCreateFlags.REPLACE_DESTINATION,
-                None,
-                lambda file, result: self.save_completion_callback(win, file, result)
-            )
+            self.save_content(win, file, text_content, lambda text: text.encode('utf-8'))
     except Exception as e:
         print(f"Error processing text for save: {e}")
         win.statusbar.set_text(f"Error saving text: {e}")
@@ -597,45 +554,134 @@ def save_as_markdown(self, win, file):
         return
         
     win.webview.evaluate_javascript(
-        "document.documentElement.outerHTML",
+        "document.getElementById('editor').innerHTML",
         -1, None, None, None,
-        lambda webview, result, data: self.save_markdown_callback(win, webview, result, file),
+        telemetry.timed('js: capture content', lambda webview, result, data: self.save_markdown_callback(win, webview, result, file)),
         None
     )
     win.statusbar.set_text(f"Saving Markdown file: {file.get_path()}")
 
 def save_markdown_callback(self, win, webview, result, file):
-    """Convert HTML to Markdown and save to file"""
+    """Hand the editor HTML to the save worker for Markdown conversion"""
     try:
         js_result = webview.evaluate_javascript_finish(result)
         if js_result and HTML2TEXT_AVAILABLE:
             html_content = js_result.get_js_value().to_string() if hasattr(js_result, 'get_js_value') else js_result.to_string()
-            
-            # Convert HTML to Markdown
-            h2t = html2text.HTML2Text()
-            h2t.unicode_snob = True        # Use Unicode
-            h2t.body_width = 0             # Don't wrap lines
-            h2t.ignore_links = False       # Preserve links
-            h2t.ignore_images = False      # Preserve images
-            h2t.ignore_tables = False      # Try to handle tables
-            
-            markdown_content = h2t.handle(html_content)
-            
-            # Replace the file with the new content
-            file.replace_contents_async(
-                markdown_content.encode('utf-8'),
-                None,
-                False,
-                Gio.FileCreateFlags.REPLACE_DESTINATION,
-                None,
-                lambda file, result: self.save_completion_callback(win, file, result)
-            )
+            self.save_html_content(win, html_content, file)
     except Exception as e:
         print(f"Error converting to Markdown for save: {e}")
         win.statusbar.set_text(f"Error saving Markdown: {e}")
         # Fallback to HTML
         self.save_as_html(win, file)
 
+def save_html_content(self, win, editor_content, file, on_finished=None):
+    """Save captured editor HTML in the format given by the file extension"""
+    file_ext = os.path.splitext(file.get_path())[1].lower()
+    
+    if file_ext == document_package.PACKAGE_EXTENSION:
+        package = self.open_document_package(file.get_path())
+        fsync_policy = self.save_fsync_policy
+        convert = lambda content: _save_package(self, package, content, fsync_policy)
+    elif file_ext in document_formats.MHTML_EXTENSIONS:
+        convert = _mhtml_converter(self, file)
+    elif file_ext in ['.md', '.markdown'] and HTML2TEXT_AVAILABLE:
+        service = conversion_service.get_service()
+        convert = lambda content: service.html_to_markdown(self.inline_package_assets(content)).encode('utf-8')
+    elif file_ext in ['.txt']:
+        service = conversion_service.get_service()
+        convert = lambda content: service.html_to_text(content).encode('utf-8')
+    else:
+        convert = lambda content: document_formats.html_document(self.inline_package_assets(content)).encode('utf-8')
+    self.save_content(win, file, editor_content, convert, on_finished)
+
+def save_content(self, win, file, content, convert, on_finished=None):
+    """Convert and write captured content on the save worker.
+    
+    convert(content) runs off the main thread and returns the bytes to write,
+    or None if it stored the file itself. Progress and the outcome are passed
+    back through GLib.idle_add; on_finished(error) then runs on the main thread.
+    """
+    path = file.get_path()
+    name = os.path.basename(path)
+    fsync_policy = self.save_fsync_policy
+    # Edits made while the worker runs must keep the document modified
+    change_serial = win.change_serial
+    started = time.perf_counter()
+    
+    def report(text):
+        GLib.idle_add(lambda: win.statusbar.set_text(text) and False)
+    
+    def job():
+        report(f"Saving {name}: converting…")
+        data = convert(content)
+        if data is not None:
+            document_formats.atomic_write(path, data, fsync_policy,
+                                          lambda percent: report(f"Saving {name}: {percent}%"))
+    
+    def finish(error):
+        telemetry.record(f"save: {os.path.splitext(path)[1].lower() or 'file'}",
+                         (time.perf_counter() - started) * 1000)
+        if error is None:
+            win.current_file = file
+            if win.change_serial == change_serial:
+                win.modified = False
+                self.discard_autosave_journal(win)
+            self.update_window_title(win)
+            win.statusbar.set_text(f"Saved: {path}")
+        else:
+            print(f"Error saving {path}: {error}")
+            win.statusbar.set_text(f"Error saving file: {error}")
+            self.show_error_dialog(f"Error saving file: {error}")
+        if on_finished:
+            on_finished(error)
+        return False
+    
+    win.statusbar.set_text(f"Saving {name}…")
+    future = _save_executor.submit(job)
+    future.add_done_callback(lambda future: GLib.idle_add(finish, future.exception()))
+
+def _save_package(self, package, editor_content, fsync_policy):
+    """Store editor HTML as the newest package revision; runs on the save worker"""
+    html, assets = document_package.extract_data_urls(editor_content)
+    
+    def to_asset_ref(match):
+        token, name = match.groups()
+        source = self.document_packages.get(token)
+        if source is not None and source is not package:
+            # Images from another package are copied over only if missing
+            assets.setdefault(name, lambda: source.read_asset(name))
+        return document_package.ASSET_DIR + name
+    
+    package.save(_PACKAGE_URL_PATTERN.sub(to_asset_ref, html), assets, fsync_policy)
+    return None
+
+def _mhtml_converter(self, file):
+    """save_content() conversion that writes editor HTML and its images as an MHTML archive itself"""
+    path = file.get_path()
+    fsync_policy = self.save_fsync_policy
+    
+    def convert(editor_content):
+        html, assets = document_package.extract_data_urls(editor_content)
+        
+        def to_asset_ref(match):
+            token, name = match.groups()
+            source = self.document_packages.get(token)
+            if source is None:
+                return match.group(0)
+            # Read from the package or archive only while its part is written
+            assets.setdefault(name, lambda: source.read_asset(name))
+            return document_package.ASSET_DIR + name
+        
+        document_formats.save_mhtml(path, _PACKAGE_URL_PATTERN.sub(to_asset_ref, html), assets, fsync_policy,
+                                    location=GLib.filename_to_uri(path, None))
+        return None
+    return convert
+
+def _mhtml_editor_html(archive, url_for):
+    """Body of an archived page with its images linked to the archive; runs on a conversion worker"""
+    html = ''.join(document_formats.extract_body([archive.read_html()]))
+    return archive.link_images(html, url_for)
+
 def save_completion_callback(self, win, file, result):
     """Handle save completion"""
     try:
@@ -668,6 +714,7 @@ def save_completion_callback(self, win, file, result):
         if success:
             win.current_file = file
             win.modified = False
+            self.discard_autosave_journal(win)
             self.update_window_title(win)
             win.statusbar.set_text(f"Saved: {file.get_path()}")
         else:
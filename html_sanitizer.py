@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""What HTML the editor keeps from pasted and inserted content.
+
+The allowlists here are the only copy of the rules. The editor page
+compiles them into lookup tables once (tables_json()) and applies them to
+each subtree an edit inserts or changes; sanitize_html() applies them to
+large pastes on a worker thread before they reach the page.
+
+Elements that are not allowed give way to their children, except the ones
+in DROP_CONTENT_TAGS, which go with everything inside them. Attributes
+and style properties that are not allowed are removed, as are style
+values in BLOCKED_STYLE_VALUES and URLs with schemes other than
+SAFE_URL_SCHEMES.
+"""
+
+import html
+import json
+import re
+from html.parser import HTMLParser
+
+ALLOWED_TAGS = frozenset([
+    'a', 'abbr', 'b', 'blockquote', 'br', 'caption', 'cite', 'code', 'col', 'colgroup', 'dd', 'del',
+    'div', 'dl', 'dt', 'em', 'figcaption', 'figure', 'font', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr',
+    'i', 'img', 'ins', 'kbd', 'li', 'mark', 'ol', 'p', 'pre', 'q', 's', 'samp', 'small', 'span',
+    'strike', 'strong', 'sub', 'sup', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'u', 'ul',
+])
+
+DROP_CONTENT_TAGS = frozenset([
+    'applet', 'audio', 'button', 'canvas', 'embed', 'frame', 'frameset', 'head', 'iframe', 'input',
+    'link', 'math', 'meta', 'noscript', 'object', 'script', 'select', 'style', 'svg', 'template',
+    'textarea', 'title', 'video',
+])
+
+GLOBAL_ATTRIBUTES = frozenset(['class', 'dir', 'lang', 'style', 'title'])
+
+TAG_ATTRIBUTES = {
+    'a': frozenset(['href', 'name', 'target']),
+    'col': frozenset(['span', 'width']),
+    'colgroup': frozenset(['span', 'width']),
+    'font': frozenset(['color', 'face', 'size']),
+    'img': frozenset(['alt', 'height', 'src', 'width']),
+    'li': frozenset(['value']),
+    'ol': frozenset(['start', 'type']),
+    'table': frozenset(['border', 'cellpadding', 'cellspacing', 'width']),
+    'td': frozenset(['colspan', 'rowspan', 'valign', 'width']),
+    'th': frozenset(['colspan', 'rowspan', 'valign', 'width']),
+}
+
+URL_ATTRIBUTES = frozenset(['href', 'src'])
+SAFE_URL_SCHEMES = frozenset(['author-package', 'cid', 'file', 'ftp', 'http', 'https', 'mailto', 'tel'])
+
+STYLE_PROPERTIES = frozenset([
+    'background-color', 'border', 'border-collapse', 'border-color', 'border-spacing', 'border-style',
+    'border-width', 'color', 'float', 'font', 'height', 'line-height', 'list-style', 'margin', 'max-width',
+    'padding', 'text-align', 'text-decoration', 'text-indent', 'vertical-align', 'white-space', 'width',
+])
+# Longhands of the shorthands above, such as border-top-width or text-decoration-line
+STYLE_PREFIXES = ('border-', 'font-', 'list-style-', 'margin-', 'padding-', 'text-decoration-')
+# Style values containing any of these are removed: they load URLs (border-image-source,
+# list-style-image) or hide them behind CSS escapes
+BLOCKED_STYLE_VALUES = ('url(', 'image-set(', '\\')
+
+# Pastes of more HTML than this are cleaned off the page, on a worker thread
+PASTE_WORKER_THRESHOLD = 256 * 1024
+
+_VOID_TAGS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+                        'source', 'track', 'wbr'])
+# Browsers drop tabs and line breaks anywhere in a URL, and control characters and
+# spaces before it, so "java&#9;script:" is a javascript: URL
+URL_IGNORED_PATTERN = r'[\t\n\r]'
+SCHEME_PATTERN = r'^[\x00-\x20]*([a-zA-Z][a-zA-Z0-9+.-]*):'
+_URL_IGNORED_RE = re.compile(URL_IGNORED_PATTERN)
+_SCHEME_RE = re.compile(SCHEME_PATTERN)
+
+
+def style_allowed(name):
+    return name in STYLE_PROPERTIES or name.startswith(STYLE_PREFIXES)
+
+
+def style_value_allowed(value):
+    value = value.lower()
+    return not any(blocked in value for blocked in BLOCKED_STYLE_VALUES)
+
+
+def url_allowed(tag, value):
+    value = _URL_IGNORED_RE.sub('', value)
+    match = _SCHEME_RE.match(value)
+    if match is None:
+        return True  # relative
+    scheme = match.group(1).lower()
+    if scheme == 'data':
+        return tag == 'img' and value[match.end():].lower().startswith('image/')
+    return scheme in SAFE_URL_SCHEMES
+
+
+def clean_style(value):
+    """The declarations of a style attribute whose properties are allowed"""
+    kept = []
+    for declaration in value.split(';'):
+        name, colon, rest = declaration.partition(':')
+        name = name.strip().lower()
+        if colon and name and style_allowed(name) and style_value_allowed(rest):
+            kept.append(f"{name}: {rest.strip()}")
+    return '; '.join(kept)
+
+
+def tables_json():
+    """The allowlists as JSON, for the editor page to compile"""
+    return json.dumps({
+        'tags': sorted(ALLOWED_TAGS),
+        'dropContent': sorted(DROP_CONTENT_TAGS),
+        'globalAttributes': sorted(GLOBAL_ATTRIBUTES),
+        'tagAttributes': {tag: sorted(names) for tag, names in TAG_ATTRIBUTES.items()},
+        'urlAttributes': sorted(URL_ATTRIBUTES),
+        'schemes': sorted(SAFE_URL_SCHEMES),
+        'styles': sorted(STYLE_PROPERTIES),
+        'stylePrefixes': list(STYLE_PREFIXES),
+        'blockedStyleValues': list(BLOCKED_STYLE_VALUES),
+        'urlIgnoredPattern': URL_IGNORED_PATTERN,
+        'schemePattern': SCHEME_PATTERN,
+        'pasteThreshold': PASTE_WORKER_THRESHOLD,
+    })
+
+
+class _Sanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.open_tags = []
+        self.skipping = None   # tag whose content is being dropped
+        self.skip_depth = 0
+        self.stats = {'elements': 0, 'removed': 0, 'unwrapped': 0, 'attributes_removed': 0}
+
+    def handle_starttag(self, tag, attrs):
+        if self.skipping is not None:
+            if tag == self.skipping:
+                self.skip_depth += 1
+            return
+        self.stats['elements'] += 1
+        if tag in DROP_CONTENT_TAGS:
+            self.stats['removed'] += 1
+            if tag not in _VOID_TAGS:
+                self.skipping = tag
+                self.skip_depth = 1
+            return
+        if tag not in ALLOWED_TAGS:
+            self.stats['unwrapped'] += 1
+            return
+        allowed = TAG_ATTRIBUTES.get(tag, frozenset())
+        attributes = []
+        for name, value in attrs:
+            value = value or ''
+            if name == 'style':
+                value = clean_style(value)
+                if not value:
+                    self.stats['attributes_removed'] += 1
+                    continue
+            elif ((name not in GLOBAL_ATTRIBUTES and name not in allowed) or
+                  (name in URL_ATTRIBUTES and not url_allowed(tag, value))):
+                self.stats['attributes_removed'] += 1
+                continue
+            attributes.append(f' {name}="{html.escape(value)}"')
+        self.parts.append(f"<{tag}{''.join(attributes)}>")
+        if tag not in _VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in _VOID_TAGS and self.open_tags and self.open_tags[-1] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self.skipping is not None:
+            if tag == self.skipping:
+                self.skip_depth -= 1
+                if self.skip_depth == 0:
+                    self.skipping = None
+            return
+        if tag in self.open_tags:
+            while self.open_tags:
+                open_tag = self.open_tags.pop()
+                self.parts.append(f"</{open_tag}>")
+                if open_tag == tag:
+                    break
+
+    def handle_data(self, data):
+        if self.skipping is None:
+            self.parts.append(html.escape(data, quote=False))
+
+    def close(self):
+        super().close()
+        while self.open_tags:
+            self.parts.append(f"</{self.open_tags.pop()}>")
+
+
+def sanitize_html(text, stats=None):
+    """text with everything the allowlists do not permit removed.
+
+    If stats is a dict, counts of elements seen, removed and unwrapped and
+    of attributes removed are added to it.
+    """
+    sanitizer = _Sanitizer()
+    sanitizer.feed(text)
+    sanitizer.close()
+    if stats is not None:
+        for name, count in sanitizer.stats.items():
+            stats[name] = stats.get(name, 0) + count
+    return ''.join(sanitizer.parts)
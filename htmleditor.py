@@ -1,20 +1,47 @@
 #!/usr/bin/env python3
 import sys
-import gi
+import time
+from startup_profile import profiler  # first, so the profile starts as early as possible
 import re
 import os
+from startup_profile import lazy_import
 
 # Hardware Acclerated Rendering (0); Software Rendering (1)
 os.environ['WEBKIT_DISABLE_COMPOSITING_MODE'] = '0'
 
-gi.require_version('Gtk', '4.0')
-gi.require_version('Adw', '1')
-gi.require_version('WebKit', '6.0')
-
-from gi.repository import Gtk, Adw, Gdk, WebKit, GLib, Gio
+with profiler.span('imports', 'gi: Gtk, Adw, WebKit'):
+    import gi
+    gi.require_version('Gtk', '4.0')
+    gi.require_version('Adw', '1')
+    gi.require_version('WebKit', '6.0')
+    gi.require_version('Pango', '1.0')
+    
+    from gi.repository import Gtk, Adw, Gdk, WebKit, GLib, Gio, Pango
 
 # Import file operation functions directly
-import file_operations # open, save, save as
+with profiler.span('imports', 'file_operations'):
+    import file_operations # open, save, save as
+    import autosave_journal
+    import editor_telemetry
+    from editor_telemetry import telemetry
+
+# Only needed once the indexer starts, something is pasted, a table is imported or a page is set up
+sqlite3 = lazy_import('sqlite3')
+threading = lazy_import('threading')
+document_index = lazy_import('document_index')
+html_sanitizer = lazy_import('html_sanitizer')
+conversion_service = lazy_import('conversion_service')
+table_import = lazy_import('table_import')
+
+# Ready-to-type editor WebViews kept loaded in the background for new windows
+EDITOR_POOL_SIZE = 2
+
+# Tables of this many rows get fixed column widths, measured once and cached
+TABLE_FIXED_LAYOUT_ROWS = 200
+# With table virtualization on, body rows this far beyond the viewport are hidden
+TABLE_VIRTUAL_ROWS = 500
+TABLE_OVERSCAN_PX = 800
+TABLE_IMPORT_BATCH_ROWS = 500
 
 class HTMLEditorApp(Adw.Application):
     def __init__(self, **kwargs):
@@ -32,6 +59,26 @@ class HTMLEditorApp(Adw.Application):
         self.auto_save_interval = 60
         self.current_file = None
         self.auto_save_source_id = None
+        self.undo_memory_budget = 64 * 1024 * 1024  # bytes of undo history per window
+        self.document_packages = {}  # open .hdoc packages and MHTML archives by URL token
+        self.save_fsync_policy = 'file'  # one of file_operations.SAVE_FSYNC_POLICIES
+        self.table_virtualization = False  # hide the off-screen rows of long tables while editing
+        
+        # Shared by every editor WebView; set up in do_startup
+        self.user_content_manager = None
+        self.webview_settings = None
+        self.webview_pool = []  # preloaded editor WebViews not yet given to a window
+        self.pool_fill_source_id = None
+        self.editor_views = {}  # {view_id: window}, to route script messages
+        self.next_view_id = 1
+        
+        # Full-text index of the user's documents, refreshed on a background thread
+        self.document_index = None
+        self.index_thread = None
+        self.index_stop = None  # set to end the running refresh early
+        self.index_roots_pending = []  # (path, recursive) to add on the next refresh
+        self.index_opened_folders = False  # also index the folder of every document opened
+        self.search_dialog_refresh = None  # set while the search dialog is open
         
         # Add modular methods from file_operations to the class
         # File opening methods
@@ -39,6 +86,10 @@ class HTMLEditorApp(Adw.Application):
         self.on_open_new_window_response = file_operations.on_open_new_window_response.__get__(self, HTMLEditorApp)
         self.on_open_current_window_response = file_operations.on_open_current_window_response.__get__(self, HTMLEditorApp)
         self.load_file = file_operations.load_file.__get__(self, HTMLEditorApp)
+        self.stream_content = file_operations.stream_content.__get__(self, HTMLEditorApp)
+        self.open_document_package = file_operations.open_document_package.__get__(self, HTMLEditorApp)
+        self.on_package_asset_request = file_operations.on_package_asset_request.__get__(self, HTMLEditorApp)
+        self.inline_package_assets = file_operations.inline_package_assets.__get__(self, HTMLEditorApp)
         
         # File saving methods from the updated implementation
         self.on_save_clicked = file_operations.on_save_clicked.__get__(self, HTMLEditorApp)
@@ -48,15 +99,19 @@ class HTMLEditorApp(Adw.Application):
         
         # Format-specific save methods
         self.save_as_mhtml = file_operations.save_as_mhtml.__get__(self, HTMLEditorApp)
-        self.save_webkit_callback = file_operations.save_webkit_callback.__get__(self, HTMLEditorApp)
+        self.save_mhtml_callback = file_operations.save_mhtml_callback.__get__(self, HTMLEditorApp)
         self.save_as_html = file_operations.save_as_html.__get__(self, HTMLEditorApp)
         self.save_as_text = file_operations.save_as_text.__get__(self, HTMLEditorApp)
         self.save_as_markdown = file_operations.save_as_markdown.__get__(self, HTMLEditorApp)
+        self.save_as_package = file_operations.save_as_package.__get__(self, HTMLEditorApp)
         
         # Callback handlers
         self.save_html_callback = file_operations.save_html_callback.__get__(self, HTMLEditorApp)
         self.save_text_callback = file_operations.save_text_callback.__get__(self, HTMLEditorApp)
         self.save_markdown_callback = file_operations.save_markdown_callback.__get__(self, HTMLEditorApp)
+        self.save_package_callback = file_operations.save_package_callback.__get__(self, HTMLEditorApp)
+        self.save_html_content = file_operations.save_html_content.__get__(self, HTMLEditorApp)
+        self.save_content = file_operations.save_content.__get__(self, HTMLEditorApp)
         self.save_completion_callback = file_operations.save_completion_callback.__get__(self, HTMLEditorApp)
         
         # Legacy methods for backward compatibility
@@ -71,14 +126,106 @@ class HTMLEditorApp(Adw.Application):
     def do_startup(self):
         Adw.Application.do_startup(self)
         self.create_actions()
+        WebKit.WebContext.get_default().register_uri_scheme(
+            file_operations.PACKAGE_SCHEME, self.on_package_asset_request)
+        self.setup_web_content()
+        # Index in the background once startup is over
+        documents_dir = GLib.get_user_special_dir(GLib.UserDirectory.DIRECTORY_DOCUMENTS)
+        if documents_dir:
+            self.queue_index_root(documents_dir, recursive=True)
+        GLib.timeout_add_seconds(10, lambda: self.refresh_document_index() and False)
+
+    def do_shutdown(self):
+        # Stop the indexer between two files rather than mid-write at interpreter exit
+        if self.index_thread is not None:
+            self.index_stop.set()
+            self.index_thread.join()
+        Adw.Application.do_shutdown(self)
+
+    def setup_web_content(self):
+        """Register the editor script and message handler once for all WebViews"""
+        self.user_content_manager = WebKit.UserContentManager()
+        self.user_content_manager.add_script(WebKit.UserScript.new(
+            self.get_editor_js(),
+            WebKit.UserContentInjectedFrames.TOP_FRAME,
+            WebKit.UserScriptInjectionTime.START,
+            None, None))
+        try:
+            self.user_content_manager.register_script_message_handler("editorStatus")
+            self.user_content_manager.connect("script-message-received::editorStatus", self.on_editor_status)
+            self.user_content_manager.register_script_message_handler("editorPaste")
+            self.user_content_manager.connect("script-message-received::editorPaste", self.on_editor_paste)
+            if telemetry.enabled:
+                self.user_content_manager.register_script_message_handler("editorTelemetry")
+                self.user_content_manager.connect("script-message-received::editorTelemetry",
+                                                  self.on_editor_telemetry)
+        except Exception:
+            print("Warning: Could not set up JavaScript message handlers")
+        
+        self.webview_settings = WebKit.Settings()
+        try:
+            self.webview_settings.set_enable_developer_extras(True)
+        except Exception:
+            pass
+
+    def create_editor_webview(self):
+        """Create an editor WebView on the shared context and start loading the editor page"""
+        view_id = self.next_view_id
+        self.next_view_id += 1
+        webview = WebKit.WebView(user_content_manager=self.user_content_manager,
+                                 web_context=WebKit.WebContext.get_default(),
+                                 network_session=WebKit.NetworkSession.get_default(),
+                                 settings=self.webview_settings)
+        webview.set_vexpand(True)
+        webview.set_hexpand(True)
+        webview.view_id = view_id
+        webview.editor_ready = False
+        load_start = time.perf_counter()
+        
+        def on_load_changed(view, event):
+            if event == WebKit.LoadEvent.FINISHED:
+                view.editor_ready = True
+                view.disconnect_by_func(on_load_changed)
+                profiler.record('webview load', f"editor page, view {view_id}", time.perf_counter() - load_start)
+                win = self.editor_views.get(view_id)
+                if win is not None and win.get_mapped():
+                    profiler.mark('editable')
+        
+        webview.connect("load-changed", on_load_changed)
+        webview.load_html(self.get_editor_html(view_id), None)
+        return webview
+
+    def take_editor_webview(self):
+        """Hand out a preloaded editor WebView, preferring one that has finished loading"""
+        webview = next((view for view in self.webview_pool if view.editor_ready), None)
+        if webview is None and self.webview_pool:
+            webview = self.webview_pool[0]
+        if webview is not None:
+            self.webview_pool.remove(webview)
+        else:
+            webview = self.create_editor_webview()
+        self.schedule_webview_pool_fill()
+        return webview
+
+    def schedule_webview_pool_fill(self):
+        if self.pool_fill_source_id is None and len(self.webview_pool) < EDITOR_POOL_SIZE:
+            self.pool_fill_source_id = GLib.idle_add(self.fill_webview_pool, priority=GLib.PRIORITY_LOW)
+
+    def fill_webview_pool(self):
+        """Add one WebView per idle callback so refilling never holds up the UI"""
+        if len(self.webview_pool) >= EDITOR_POOL_SIZE:
+            self.pool_fill_source_id = None
+            return False
+        self.webview_pool.append(self.create_editor_webview())
+        return True
 
     def on_activate(self, app):
         """Handle application activation (new window)"""
         win = self.create_window()
         win.present()
         
-        # Set focus after window is shown - this is crucial
-        GLib.timeout_add(500, lambda: self.set_initial_focus(win))
+        # Set focus after window is shown - this is crucial; a preloaded view is ready at once
+        GLib.timeout_add(0 if win.webview.editor_ready else 500, lambda: self.set_initial_focus(win))
         
         self.update_window_menu()
 
@@ -108,6 +255,7 @@ class HTMLEditorApp(Adw.Application):
             
     def create_window(self):
         """Create a new window with all initialization (former HTMLEditorWindow.__init__)"""
+        build_start = time.perf_counter()
         win = Adw.ApplicationWindow(application=self)
         
         # Set window properties
@@ -116,6 +264,9 @@ class HTMLEditorApp(Adw.Application):
         win.auto_save_interval = 60
         win.current_file = None
         win.auto_save_source_id = None
+        win.autosave_journal = None
+        win.change_serial = 0  # bumped on every reported edit
+        win.importing_table = False
         
         win.set_default_size(900, 700)
         win.set_title("Untitled - HTML Editor")
@@ -151,31 +302,9 @@ class HTMLEditorApp(Adw.Application):
         win.formatting_toolbar_revealer.set_child(win.toolbar)
         content_box.append(win.formatting_toolbar_revealer)
 
-        # Create webview
-        win.webview = WebKit.WebView()
-        win.webview.set_vexpand(True)
-        win.webview.set_hexpand(True) 
-        win.webview.load_html(self.get_editor_html(), None)
-        settings = win.webview.get_settings()
-        try:
-            settings.set_enable_developer_extras(True)
-        except:
-            pass
-        
-        try:
-            user_content_manager = win.webview.get_user_content_manager()
-            user_content_manager.register_script_message_handler("contentChanged")
-            user_content_manager.connect("script-message-received::contentChanged", 
-                                        lambda mgr, res: self.on_content_changed(win, mgr, res))
-            
-            # Add handler for formatting changes
-            user_content_manager.register_script_message_handler("formattingChanged")
-            user_content_manager.connect("script-message-received::formattingChanged", 
-                                        lambda mgr, res: self.on_formatting_changed(win, mgr, res))
-        except:
-            print("Warning: Could not set up JavaScript message handlers")
-                    
-        win.webview.load_html(self.get_initial_html(), None)
+        # Take a preloaded webview; it shares the editor script and context with every window
+        win.webview = self.take_editor_webview()
+        self.editor_views[win.webview.view_id] = win
         content_box.append(win.webview)
         
         
@@ -185,26 +314,44 @@ class HTMLEditorApp(Adw.Application):
         win.statusbar_revealer.set_transition_duration(250)
         win.statusbar_revealer.set_reveal_child(True)  # Visible by default
         
+        statusbar_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
+        statusbar_box.set_margin_start(10)
+        statusbar_box.set_margin_end(10)
+        statusbar_box.set_margin_top(5)
+        statusbar_box.set_margin_bottom(5)
+        
         win.statusbar = Gtk.Label(label="Ready")
         win.statusbar.set_halign(Gtk.Align.START)
-        win.statusbar.set_margin_start(10)
-        win.statusbar.set_margin_end(10)
-        win.statusbar.set_margin_top(5)
-        win.statusbar.set_margin_bottom(5)
-        win.statusbar_revealer.set_child(win.statusbar)
+        win.statusbar.set_hexpand(True)
+        statusbar_box.append(win.statusbar)
+        
+        win.word_count_label = Gtk.Label(label="0 words")
+        win.word_count_label.set_halign(Gtk.Align.END)
+        statusbar_box.append(win.word_count_label)
+        win.statusbar_revealer.set_child(statusbar_box)
         content_box.append(win.statusbar_revealer)
         
         win.main_box.append(content_box)
         win.set_content(win.main_box)
         
         self.setup_keyboard_shortcuts(win)
+        if self.table_virtualization:
+            self.apply_table_preferences(win)
         
         win.connect("close-request", self.on_window_close_request)
         
+        win.connect("map", self.on_window_mapped)
+        
         # Add to windows list
         self.windows.append(win)
         
+        profiler.record('widget construction', 'create_window', time.perf_counter() - build_start)
         return win
+
+    def on_window_mapped(self, win):
+        profiler.mark('window')
+        if win.webview.editor_ready:
+            profiler.mark('editable')
         
     def setup_headerbar_content(self, win):
         """Create buttons for the header bar"""
@@ -242,7 +389,12 @@ class HTMLEditorApp(Adw.Application):
         menu_button.set_icon_name("open-menu-symbolic")
         
         menu = Gio.Menu()
+        menu.append("Insert Table…", "app.insert-table")
+        menu.append("Import Table…", "app.import-table")
+        menu.append("Search Documents…", "app.search-documents")
         menu.append("Preferences", "app.preferences")
+        if telemetry.enabled:
+            menu.append("Performance", "app.telemetry")
         menu.append("About", "app.about")
         menu.append("Quit", "app.quit")
         
@@ -386,7 +538,9 @@ class HTMLEditorApp(Adw.Application):
         """Handle Ctrl+B shortcut for bold formatting"""
         # Execute the bold command directly in JavaScript
         self.execute_js(win, """
+            saveState();
             document.execCommand('bold', false, null);
+            saveState();
             // Return the current state so we can update the button
             document.queryCommandState('bold');
         """)
@@ -404,7 +558,9 @@ class HTMLEditorApp(Adw.Application):
         """Handle Ctrl+I shortcut for italic formatting"""
         # Execute the italic command directly in JavaScript
         self.execute_js(win, """
+            saveState();
             document.execCommand('italic', false, null);
+            saveState();
             // Return the current state so we can update the button
             document.queryCommandState('italic');
         """)
@@ -422,7 +578,9 @@ class HTMLEditorApp(Adw.Application):
         """Handle Ctrl+U shortcut for underline formatting"""
         # Execute the underline command directly in JavaScript
         self.execute_js(win, """
+            saveState();
             document.execCommand('underline', false, null);
+            saveState();
             // Return the current state so we can update the button
             document.queryCommandState('underline');
         """)
@@ -470,11 +628,11 @@ class HTMLEditorApp(Adw.Application):
         self.on_close_other_windows(None, None)
         return True
 
-    def get_editor_html(self, content=""):
-        content = content.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    def get_editor_html(self, view_id=0):
+        """The editor page; its script comes from the shared user content manager"""
         return f"""
     <!DOCTYPE html>
-    <html style="height: 100%;">
+    <html style="height: 100%;" data-view="{view_id}">
     <head>
         <title>HTML Editor</title>
         <style>
@@ -518,10 +676,6 @@ class HTMLEditorApp(Adw.Application):
                 }}
             }}
         </style>
-        <script>
-            window.initialContent = "{content or '<div><br></div>'}";
-            {self.get_editor_js()}
-        </script>
     </head>
     <body>
         <div id="editor" contenteditable="true"></div>
@@ -532,11 +686,25 @@ class HTMLEditorApp(Adw.Application):
     def get_editor_js(self):
         """Return the combined JavaScript logic for the editor."""
         return f"""
+        window.initialContent = "<div><br></div>";
+        
         // Global scope for persistence
-        window.undoStack = [];
-        window.redoStack = [];
+        window.undoManager = {{
+            undoStack: [],        // sealed transactions, oldest first
+            redoStack: [],
+            pending: [],          // mutation records of the open transaction
+            pendingBytes: 0,
+            totalBytes: 0,        // estimated bytes held by both stacks
+            maxBytes: {self.undo_memory_budget},
+            cleanDepth: 0,        // undo depth that matches the loaded document
+            sealDelay: 500,
+            sealTimer: null,
+            sealHeld: false,      // set while a table import keeps its transaction open
+            selectionBefore: null,
+            lastInputType: null,
+            observer: null
+        }};
         window.isUndoRedo = false;
-        window.lastContent = "";
 
         {self.save_state_js()}
         {self.perform_undo_js()}
@@ -544,91 +712,264 @@ class HTMLEditorApp(Adw.Application):
         {self.find_last_text_node_js()}
         {self.get_stack_sizes_js()}
         {self.set_content_js()}
+        {self.status_channel_js()}
+        {self.journal_tracker_js()}
+        {self.sanitizer_js()}
+        {self.tables_js()}
         {self.selection_change_js()}
+        {self.reveal_text_js()}
+        {self.telemetry_js() if telemetry.enabled else ''}
         {self.init_editor_js()}
         """
 
     def save_state_js(self):
-        """JavaScript to save the editor state to the undo stack."""
+        """JavaScript to record DOM mutations into undo transactions."""
         return """
+        function undoNodeBytes(node) {
+            if (node.nodeType === Node.ELEMENT_NODE) return node.outerHTML.length * 2;
+            if (node.nodeValue !== null) return node.nodeValue.length * 2;
+            return 0;
+        }
+
+        function recordMutations(mutations) {
+            const undo = window.undoManager;
+            if (window.isUndoRedo || mutations.length === 0) return;
+
+            // A new edit makes the redo history unreachable
+            if (undo.redoStack.length > 0) {
+                undo.redoStack.forEach(t => undo.totalBytes -= t.bytes);
+                undo.redoStack = [];
+                if (undo.cleanDepth > undo.undoStack.length) undo.cleanDepth = -1;
+            }
+
+            for (const m of mutations) {
+                let record;
+                let bytes = 64;
+                if (m.type === 'characterData') {
+                    // newValue is filled in when the record is reverted
+                    record = { type: 'characterData', target: m.target, oldValue: m.oldValue, newValue: null };
+                    bytes += ((m.oldValue || '').length + (m.target.nodeValue || '').length) * 2;
+                } else if (m.type === 'attributes') {
+                    record = { type: 'attributes', target: m.target, name: m.attributeName,
+                               oldValue: m.oldValue, newValue: null };
+                    const current = m.target.getAttribute(m.attributeName);
+                    bytes += ((m.oldValue || '').length + (current || '').length) * 2;
+                } else {
+                    record = { type: 'childList', target: m.target, nextSibling: m.nextSibling,
+                               added: Array.from(m.addedNodes), removed: Array.from(m.removedNodes) };
+                    record.added.forEach(node => bytes += undoNodeBytes(node));
+                    record.removed.forEach(node => bytes += undoNodeBytes(node));
+                }
+                undo.pending.push(record);
+                undo.pendingBytes += bytes;
+            }
+        }
+
+        function captureUndoSelection() {
+            const selection = window.getSelection();
+            if (!selection.rangeCount) return null;
+            const range = selection.getRangeAt(0);
+            if (!document.getElementById('editor').contains(range.startContainer)) return null;
+            return { node: range.startContainer, offset: range.startOffset };
+        }
+
+        function scheduleSeal() {
+            const undo = window.undoManager;
+            if (undo.sealHeld) return;
+            if (undo.sealTimer) clearTimeout(undo.sealTimer);
+            undo.sealTimer = setTimeout(saveState, undo.sealDelay);
+        }
+
+        function enforceUndoBudget() {
+            const undo = window.undoManager;
+            // Always keep the newest transaction, even if it alone exceeds the budget
+            while (undo.totalBytes > undo.maxBytes && undo.undoStack.length > 1) {
+                const dropped = undo.undoStack.shift();
+                undo.totalBytes -= dropped.bytes;
+                undo.cleanDepth -= 1;  // negative means the loaded state is gone
+            }
+        }
+
+        // Close the open transaction and push it onto the undo stack
         function saveState() {
-            window.undoStack.push(document.getElementById('editor').innerHTML);
-            if (window.undoStack.length > 100) {
-                window.undoStack.shift();
+            const undo = window.undoManager;
+            if (undo.observer) recordMutations(undo.observer.takeRecords());
+            if (undo.sealTimer) {
+                clearTimeout(undo.sealTimer);
+                undo.sealTimer = null;
             }
+            undo.lastInputType = null;
+            if (undo.pending.length === 0) return false;
+
+            undo.undoStack.push({
+                records: undo.pending,
+                bytes: undo.pendingBytes,
+                selectionBefore: undo.selectionBefore,
+                selectionAfter: captureUndoSelection()
+            });
+            undo.totalBytes += undo.pendingBytes;
+            undo.pending = [];
+            undo.pendingBytes = 0;
+            undo.selectionBefore = null;
+            enforceUndoBudget();
+            return true;
+        }
+
+        function resetUndoHistory() {
+            const undo = window.undoManager;
+            if (undo.observer) undo.observer.takeRecords();
+            if (undo.sealTimer) clearTimeout(undo.sealTimer);
+            undo.undoStack = [];
+            undo.redoStack = [];
+            undo.pending = [];
+            undo.pendingBytes = 0;
+            undo.totalBytes = 0;
+            undo.cleanDepth = 0;
+            undo.sealTimer = null;
+            undo.selectionBefore = null;
+            undo.lastInputType = null;
+        }
+
+        function restoreUndoSelection(saved, fallbackNode) {
+            const editor = document.getElementById('editor');
+            editor.focus();
+            try {
+                const range = document.createRange();
+                if (saved && saved.node.isConnected && editor.contains(saved.node)) {
+                    const max = saved.node.nodeType === Node.TEXT_NODE ?
+                        saved.node.length : saved.node.childNodes.length;
+                    range.setStart(saved.node, Math.min(saved.offset, max));
+                } else {
+                    const node = (fallbackNode && fallbackNode.isConnected && editor.contains(fallbackNode)) ?
+                        fallbackNode : editor;
+                    const textNode = findLastTextNode(node) || node;
+                    range.setStart(textNode, textNode.nodeType === Node.TEXT_NODE ? textNode.length : 0);
+                }
+                range.collapse(true);
+                const sel = window.getSelection();
+                sel.removeAllRanges();
+                sel.addRange(range);
+            } catch (e) {
+                console.log("Could not restore cursor position:", e);
+            }
+        }
+
+        // Group typing into one transaction; start a new one when the kind of edit changes
+        function onBeforeInputForUndo(e) {
+            const undo = window.undoManager;
+            if (e.inputType === 'historyUndo' || e.inputType === 'historyRedo') {
+                e.preventDefault();
+                e.inputType === 'historyUndo' ? performUndo() : performRedo();
+                return;
+            }
+            const kind = e.inputType.startsWith('insertText') ? 'insertText' :
+                         e.inputType.startsWith('delete') ? 'delete' : e.inputType;
+            if (undo.lastInputType !== null && (kind !== undo.lastInputType ||
+                                                (kind !== 'insertText' && kind !== 'delete'))) {
+                saveState();
+            }
+            if (undo.pending.length === 0 && undo.selectionBefore === null) {
+                undo.selectionBefore = captureUndoSelection();
+            }
+            undo.lastInputType = kind;
         }
         """
 
     def perform_undo_js(self):
         """JavaScript to perform an undo operation."""
         return """
+        function revertRecord(record) {
+            const target = record.target;
+            if (record.type === 'characterData') {
+                record.newValue = target.nodeValue;
+                target.nodeValue = record.oldValue;
+            } else if (record.type === 'attributes') {
+                record.newValue = target.getAttribute(record.name);
+                if (record.oldValue === null) target.removeAttribute(record.name);
+                else target.setAttribute(record.name, record.oldValue);
+            } else {
+                for (const node of record.added) {
+                    if (node.parentNode === target) target.removeChild(node);
+                }
+                const ref = (record.nextSibling && record.nextSibling.parentNode === target) ?
+                    record.nextSibling : null;
+                for (const node of record.removed) {
+                    target.insertBefore(node, ref);
+                }
+            }
+        }
+
         function performUndo() {
-            const editor = document.getElementById('editor');
-            if (window.undoStack.length > 1) {
-                let selection = window.getSelection();
-                let range = selection.rangeCount > 0 ? selection.getRangeAt(0) : null;
-                let cursorNode = range ? range.startContainer : null;
-                let cursorOffset = range ? range.startOffset : 0;
-
-                window.redoStack.push(window.undoStack.pop());
-                window.isUndoRedo = true;
-                editor.innerHTML = window.undoStack[window.undoStack.length - 1];
-                window.lastContent = editor.innerHTML;
-                window.isUndoRedo = false;
+            const undo = window.undoManager;
+            saveState();
+            const transaction = undo.undoStack.pop();
+            if (!transaction) {
+                return { success: false, isInitialState: undo.cleanDepth === 0 };
+            }
 
-                editor.focus();
-                try {
-                    const newRange = document.createRange();
-                    const sel = window.getSelection();
-                    const textNode = findLastTextNode(editor) || editor;
-                    const offset = textNode.nodeType === 3 ? textNode.length : 0;
-                    newRange.setStart(textNode, offset);
-                    newRange.setEnd(textNode, offset);
-                    sel.removeAllRanges();
-                    sel.addRange(newRange);
-                } catch (e) {
-                    console.log("Could not restore cursor position:", e);
+            window.isUndoRedo = true;
+            try {
+                for (let i = transaction.records.length - 1; i >= 0; i--) {
+                    revertRecord(transaction.records[i]);
                 }
-                return { success: true, isInitialState: window.undoStack.length === 1 };
+            } finally {
+                // Drop the mutations we just caused before they reach recordMutations
+                undo.observer.takeRecords();
+                if (window.editorSanitizer.observer) window.editorSanitizer.observer.takeRecords();
+                window.isUndoRedo = false;
             }
-            return { success: false, isInitialState: window.undoStack.length === 1 };
+            undo.redoStack.push(transaction);
+            restoreUndoSelection(transaction.selectionBefore, transaction.records[0].target);
+            scheduleStatusUpdate();
+            return { success: true, isInitialState: undo.undoStack.length === undo.cleanDepth };
         }
         """
 
     def perform_redo_js(self):
         """JavaScript to perform a redo operation."""
         return """
+        function replayRecord(record) {
+            const target = record.target;
+            if (record.type === 'characterData') {
+                target.nodeValue = record.newValue;
+            } else if (record.type === 'attributes') {
+                if (record.newValue === null) target.removeAttribute(record.name);
+                else target.setAttribute(record.name, record.newValue);
+            } else {
+                for (const node of record.removed) {
+                    if (node.parentNode === target) target.removeChild(node);
+                }
+                const ref = (record.nextSibling && record.nextSibling.parentNode === target) ?
+                    record.nextSibling : null;
+                for (const node of record.added) {
+                    target.insertBefore(node, ref);
+                }
+            }
+        }
+
         function performRedo() {
-            const editor = document.getElementById('editor');
-            if (window.redoStack.length > 0) {
-                let selection = window.getSelection();
-                let range = selection.rangeCount > 0 ? selection.getRangeAt(0) : null;
-                let cursorNode = range ? range.startContainer : null;
-                let cursorOffset = range ? range.startOffset : 0;
-
-                const state = window.redoStack.pop();
-                window.undoStack.push(state);
-                window.isUndoRedo = true;
-                editor.innerHTML = state;
-                window.lastContent = editor.innerHTML;
-                window.isUndoRedo = false;
+            const undo = window.undoManager;
+            saveState();
+            const transaction = undo.redoStack.pop();
+            if (!transaction) {
+                return { success: false, isInitialState: undo.undoStack.length === undo.cleanDepth };
+            }
 
-                editor.focus();
-                try {
-                    const newRange = document.createRange();
-                    const sel = window.getSelection();
-                    const textNode = findLastTextNode(editor) || editor;
-                    const offset = textNode.nodeType === 3 ? textNode.length : 0;
-                    newRange.setStart(textNode, offset);
-                    newRange.setEnd(textNode, offset);
-                    sel.removeAllRanges();
-                    sel.addRange(newRange);
-                } catch (e) {
-                    console.log("Could not restore cursor position:", e);
+            window.isUndoRedo = true;
+            try {
+                for (const record of transaction.records) {
+                    replayRecord(record);
                 }
-                return { success: true, isInitialState: window.undoStack.length === 1 };
+            } finally {
+                undo.observer.takeRecords();
+                if (window.editorSanitizer.observer) window.editorSanitizer.observer.takeRecords();
+                window.isUndoRedo = false;
             }
-            return { success: false, isInitialState: window.undoStack.length === 1 };
+            undo.undoStack.push(transaction);
+            const last = transaction.records[transaction.records.length - 1];
+            restoreUndoSelection(transaction.selectionAfter, last.target);
+            scheduleStatusUpdate();
+            return { success: true, isInitialState: undo.undoStack.length === undo.cleanDepth };
         }
         """
 
@@ -649,9 +990,11 @@ class HTMLEditorApp(Adw.Application):
         """JavaScript to get the sizes of undo and redo stacks."""
         return """
         function getStackSizes() {
+            const undo = window.undoManager;
             return {
-                undoSize: window.undoStack.length,
-                redoSize: window.redoStack.length
+                undoSize: undo.undoStack.length + (undo.pending.length > 0 ? 1 : 0),
+                redoSize: undo.redoStack.length,
+                undoBytes: undo.totalBytes + undo.pendingBytes
             };
         }
         """
@@ -668,31 +1011,404 @@ class HTMLEditorApp(Adw.Application):
             } else {
                 editor.innerHTML = html;
             }
-            window.lastContent = editor.innerHTML;
-            window.undoStack = [window.lastContent];
-            window.redoStack = [];
+            if (window.editorSanitizer.observer) window.editorSanitizer.observer.takeRecords();
+            resetUndoHistory();
             editor.focus();
+            scheduleWordCount();
+            scheduleStatusUpdate();
+        }
+
+        // Large documents arrive in chunks of complete top-level elements
+        function beginContentStream(html, wrap) {
+            window.contentStreaming = true;
+            const editor = document.getElementById('editor');
+            editor.innerHTML = wrap ? '<div></div>' : '';
+            appendContentChunk(html, wrap);
+        }
+
+        function appendContentChunk(html, wrap) {
+            const editor = document.getElementById('editor');
+            const target = wrap && editor.lastElementChild ? editor.lastElementChild : editor;
+            target.insertAdjacentHTML('beforeend', html);
+        }
+
+        function endContentStream() {
+            const editor = document.getElementById('editor');
+            if (!editor.textContent.trim() && !editor.querySelector('img, table, hr')) {
+                editor.innerHTML = '<div><br></div>';
+            }
+            window.contentStreaming = false;
+            resetUndoHistory();
+            if (window.editorJournal.observer) window.editorJournal.observer.takeRecords();
+            if (window.editorSanitizer.observer) window.editorSanitizer.observer.takeRecords();
+            editor.focus();
+            scheduleWordCount();
+            scheduleStatusUpdate();
         }
         """
 
-    def selection_change_js(self):
-        """JavaScript to track selection changes and update formatting buttons"""
-        return """
-        function updateFormattingState() {
+    def sanitizer_js(self):
+        """JavaScript that cleans only the subtrees each edit inserts or changes, using the html_sanitizer allowlists."""
+        return f"""
+        const SANITIZER_TABLES = {html_sanitizer.tables_json()};
+        """ + """
+        // The allowlists compiled once into lookups; style decisions are memoized per property
+        const sanitizerRules = (function() {
+            const tables = SANITIZER_TABLES;
+            const attributes = new Map();  // allowed tag -> its allowed attributes
+            for (const tag of tables.tags) {
+                attributes.set(tag, new Set(tables.globalAttributes.concat(tables.tagAttributes[tag] || [])));
+            }
+            return {
+                attributes: attributes,
+                dropContent: new Set(tables.dropContent),
+                urlAttributes: new Set(tables.urlAttributes),
+                schemes: new Set(tables.schemes),
+                styles: new Map(tables.styles.map(name => [name, true])),
+                stylePrefixes: tables.stylePrefixes,
+                blockedStyleValues: tables.blockedStyleValues,
+                urlIgnoredPattern: new RegExp(tables.urlIgnoredPattern, 'g'),
+                schemePattern: new RegExp(tables.schemePattern)
+            };
+        })();
+
+        window.editorSanitizer = {
+            observer: null,
+            pasteThreshold: SANITIZER_TABLES.pasteThreshold,
+            pendingPastes: new Map(),   // paste id -> where it goes, while a worker cleans it
+            nextPasteId: 1,
+            stats: {
+                passes: 0,
+                roots: 0,               // inserted subtrees walked
+                nodesVisited: 0,
+                nodesRemoved: 0,
+                nodesUnwrapped: 0,
+                attributesRemoved: 0,
+                spansMerged: 0,
+                workerPastes: 0,
+                lastPassMs: 0,
+                totalMs: 0
+            }
+        };
+
+        function sanitizerStyleAllowed(name) {
+            let allowed = sanitizerRules.styles.get(name);
+            if (allowed === undefined) {
+                allowed = sanitizerRules.stylePrefixes.some(prefix => name.startsWith(prefix));
+                sanitizerRules.styles.set(name, allowed);
+            }
+            return allowed;
+        }
+
+        function sanitizerStyleValueAllowed(value) {
+            value = value.toLowerCase();
+            return !sanitizerRules.blockedStyleValues.some(blocked => value.includes(blocked));
+        }
+
+        function sanitizerUrlAllowed(tag, value) {
+            value = value.replace(sanitizerRules.urlIgnoredPattern, '');
+            const match = sanitizerRules.schemePattern.exec(value);
+            if (!match) return true;  // relative
+            const scheme = match[1].toLowerCase();
+            if (scheme === 'data') return tag === 'img' && value.slice(match[0].length).toLowerCase().startsWith('image/');
+            return sanitizerRules.schemes.has(scheme);
+        }
+
+        function sanitizeAttributes(element, allowed, stats) {
+            const attributes = element.attributes;
+            for (let i = attributes.length - 1; i >= 0; i--) {
+                const name = attributes[i].name;
+                if (!allowed.has(name) || (sanitizerRules.urlAttributes.has(name) &&
+                                           !sanitizerUrlAllowed(element.localName, attributes[i].value))) {
+                    element.removeAttribute(name);
+                    stats.attributesRemoved++;
+                }
+            }
+            if (element.hasAttribute('style')) {
+                const style = element.style;
+                for (let i = style.length - 1; i >= 0; i--) {
+                    if (!sanitizerStyleAllowed(style[i]) || !sanitizerStyleValueAllowed(style.getPropertyValue(style[i]))) {
+                        style.removeProperty(style[i]);
+                        stats.attributesRemoved++;
+                    }
+                }
+                if (style.length === 0) element.removeAttribute('style');
+            }
+        }
+
+        function sameAttributes(a, b) {
+            if (a.attributes.length !== b.attributes.length) return false;
+            for (const attribute of a.attributes) {
+                if (b.getAttribute(attribute.name) !== attribute.value) return false;
+            }
+            return true;
+        }
+
+        // Drop an empty span, or fold it into an identical span right before it
+        function tidySpan(span, stats) {
+            if (!span.firstChild) {
+                if (window.getSelection().anchorNode === span) return;  // typing may be about to fill it
+                span.remove();
+                stats.nodesRemoved++;
+                return;
+            }
+            const previous = span.previousSibling;
+            if (previous && previous.nodeType === Node.ELEMENT_NODE && previous.localName === 'span' &&
+                sameAttributes(previous, span)) {
+                while (span.firstChild) previous.appendChild(span.firstChild);
+                span.remove();
+                stats.spansMerged++;
+            }
+        }
+
+        // Clean root and everything below it
+        function sanitizeSubtree(root, stats) {
+            const stack = [root];
+            while (stack.length > 0) {
+                const node = stack.pop();
+                stats.nodesVisited++;
+                if (node.nodeType === Node.COMMENT_NODE) {
+                    node.remove();
+                    stats.nodesRemoved++;
+                    continue;
+                }
+                if (node.nodeType !== Node.ELEMENT_NODE) continue;
+                const allowed = sanitizerRules.attributes.get(node.localName);
+                if (allowed === undefined) {
+                    if (sanitizerRules.dropContent.has(node.localName)) {
+                        node.remove();
+                        stats.nodesRemoved++;
+                    } else {
+                        // Unknown elements give way to their children, which are still checked
+                        const parent = node.parentNode;
+                        while (node.firstChild) {
+                            stack.push(node.firstChild);
+                            parent.insertBefore(node.firstChild, node);
+                        }
+                        node.remove();
+                        stats.nodesUnwrapped++;
+                    }
+                    continue;
+                }
+                sanitizeAttributes(node, allowed, stats);
+                for (let child = node.lastChild; child; child = child.previousSibling) stack.push(child);
+                if (node.localName === 'span') tidySpan(node, stats);
+            }
+        }
+
+        function saveSanitizerSelection() {
+            const selection = window.getSelection();
+            if (!selection.rangeCount) return null;
+            return [selection.anchorNode, selection.anchorOffset, selection.focusNode, selection.focusOffset];
+        }
+
+        // Moving text nodes collapses a selection inside them; put it back where it was
+        function restoreSanitizerSelection(saved) {
+            if (!saved || !saved[0].isConnected || !saved[2].isConnected) return;
+            const selection = window.getSelection();
+            if (selection.anchorNode === saved[0] && selection.anchorOffset === saved[1] &&
+                selection.focusNode === saved[2] && selection.focusOffset === saved[3]) return;
             try {
-                const isBold = document.queryCommandState('bold');
-                const isItalic = document.queryCommandState('italic');
-                const isUnderline = document.queryCommandState('underline');
-                
-                // Send the state to Python
-                window.webkit.messageHandlers.formattingChanged.postMessage(
-                    JSON.stringify({bold: isBold, italic: isItalic, underline: isUnderline})
-                );
-            } catch(e) {
-                console.log("Error updating formatting state:", e);
+                selection.setBaseAndExtent(saved[0], saved[1], saved[2], saved[3]);
+            } catch (e) {
+                console.log("Could not restore the selection after sanitizing:", e);
             }
         }
-        
+
+        function onSanitizerMutations(mutations) {
+            if (window.contentStreaming || window.isUndoRedo) return;
+            const editor = document.getElementById('editor');
+            const roots = new Set();      // inserted subtrees
+            const changed = new Set();    // elements whose attributes changed
+            const neighbours = new Set(); // spans that may now be empty or mergeable
+            for (const m of mutations) {
+                if (m.type === 'childList') {
+                    m.addedNodes.forEach(node => {
+                        if (node.nodeType !== Node.TEXT_NODE) roots.add(node);
+                    });
+                    if (m.previousSibling) neighbours.add(m.previousSibling);
+                    if (m.nextSibling) neighbours.add(m.nextSibling);
+                } else if (m.type === 'attributes') {
+                    changed.add(m.target);
+                    neighbours.add(m.target);
+                    if (m.target.nextSibling) neighbours.add(m.target.nextSibling);
+                }
+            }
+            if (roots.size === 0 && changed.size === 0 && neighbours.size === 0) return;
+
+            const sanitizer = window.editorSanitizer;
+            const stats = sanitizer.stats;
+            const start = performance.now();
+            const visitedBefore = stats.nodesVisited;
+            const saved = saveSanitizerSelection();
+            for (const node of roots) {
+                if (!node.isConnected || node === editor || !editor.contains(node)) continue;
+                // A subtree inside another inserted one is covered by that walk
+                let covered = false;
+                for (let parent = node.parentNode; parent && parent !== editor; parent = parent.parentNode) {
+                    if (roots.has(parent)) {
+                        covered = true;
+                        break;
+                    }
+                }
+                if (covered) continue;
+                stats.roots++;
+                sanitizeSubtree(node, stats);
+            }
+            for (const element of changed) {
+                if (roots.has(element) || !element.isConnected || element === editor || !editor.contains(element)) continue;
+                const allowed = sanitizerRules.attributes.get(element.localName);
+                if (allowed === undefined) {
+                    sanitizeSubtree(element, stats);
+                } else {
+                    sanitizeAttributes(element, allowed, stats);
+                }
+            }
+            for (const node of neighbours) {
+                if (node.nodeType === Node.ELEMENT_NODE && node.localName === 'span' &&
+                    node.isConnected && editor.contains(node)) {
+                    tidySpan(node, stats);
+                }
+            }
+            restoreSanitizerSelection(saved);
+            // Our own changes need no second look
+            sanitizer.observer.takeRecords();
+
+            const elapsed = performance.now() - start;
+            stats.passes++;
+            stats.lastPassMs = elapsed;
+            stats.totalMs += elapsed;
+            if (typeof recordTelemetry === 'function') {
+                recordTelemetry('sanitize', elapsed);
+                recordTelemetry('sanitized nodes', stats.nodesVisited - visitedBefore);
+            }
+        }
+
+        // Large HTML pastes are cleaned by Python on a worker thread, then inserted by insertSanitizedPaste()
+        function onSanitizerPaste(e) {
+            const sanitizer = window.editorSanitizer;
+            const html = e.clipboardData ? e.clipboardData.getData('text/html') : '';
+            if (!html || html.length < sanitizer.pasteThreshold) return;
+            e.preventDefault();
+            const selection = window.getSelection();
+            const id = sanitizer.nextPasteId++;
+            sanitizer.pendingPastes.set(id, selection.rangeCount ? selection.getRangeAt(0).cloneRange() : null);
+            try {
+                window.webkit.messageHandlers.editorPaste.postMessage(JSON.stringify({
+                    view: Number(document.documentElement.dataset.view), id: id, html: html
+                }));
+            } catch(err) {
+                console.log("Could not hand the paste over for cleaning:", err);
+                sanitizer.pendingPastes.delete(id);
+            }
+        }
+
+        function insertSanitizedPaste(id, html) {
+            const sanitizer = window.editorSanitizer;
+            const range = sanitizer.pendingPastes.get(id);
+            sanitizer.pendingPastes.delete(id);
+            const editor = document.getElementById('editor');
+            editor.focus();
+            if (range && editor.contains(range.startContainer) && editor.contains(range.endContainer)) {
+                const selection = window.getSelection();
+                selection.removeAllRanges();
+                selection.addRange(range);
+            }
+            // Finish with earlier edits so the paste is a step of its own
+            onSanitizerMutations(sanitizer.observer.takeRecords());
+            saveState();
+            window.undoManager.selectionBefore = captureUndoSelection();
+            document.execCommand('insertHTML', false, html);
+            sanitizer.observer.takeRecords();  // already clean
+            saveState();
+            sanitizer.stats.workerPastes++;
+        }
+        """
+
+    def journal_tracker_js(self):
+        """JavaScript that tracks which top-level blocks changed for the autosave journal."""
+        return """
+        window.editorJournal = {
+            dirty: new Set(),   // top-level nodes touched since the last collection
+            full: false,        // set when no neighbour survived a removal
+            observer: null
+        };
+
+        function trackJournalMutations(mutations) {
+            if (window.contentStreaming) return;
+            const journal = window.editorJournal;
+            const editor = document.getElementById('editor');
+            for (const m of mutations) {
+                if (m.target === editor) {
+                    if (m.type !== 'childList') continue;
+                    m.addedNodes.forEach(node => journal.dirty.add(node));
+                    if (m.removedNodes.length > 0) {
+                        // Marking a neighbour keeps the removal point inside the changed range
+                        const neighbour = m.nextSibling || m.previousSibling;
+                        if (neighbour) journal.dirty.add(neighbour);
+                        else journal.full = true;
+                    }
+                } else {
+                    let node = m.target;
+                    while (node && node.parentNode !== editor) node = node.parentNode;
+                    if (node) journal.dirty.add(node);
+                }
+            }
+        }
+
+        function serializeJournalBlock(node) {
+            if (node.nodeType === Node.ELEMENT_NODE) return node.outerHTML;
+            if (node.nodeType === Node.TEXT_NODE) {
+                return node.data.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+            }
+            if (node.nodeType === Node.COMMENT_NODE) return '<!--' + node.data + '-->';
+            return '';
+        }
+
+        // Changed blocks since the last collection, as an unchanged prefix/suffix and the middle
+        function collectJournalDelta() {
+            const journal = window.editorJournal;
+            if (journal.observer) trackJournalMutations(journal.observer.takeRecords());
+            const nodes = document.getElementById('editor').childNodes;
+
+            let first = -1;
+            let last = -1;
+            if (!journal.full) {
+                for (let i = 0; i < nodes.length; i++) {
+                    if (journal.dirty.has(nodes[i])) {
+                        if (first < 0) first = i;
+                        last = i;
+                    }
+                }
+            }
+            if (first < 0 && !journal.full && journal.dirty.size === 0) return null;
+
+            let delta;
+            if (first < 0) {
+                delta = { prefix: 0, suffix: 0, blocks: Array.from(nodes, serializeJournalBlock) };
+            } else {
+                const blocks = [];
+                for (let i = first; i <= last; i++) blocks.push(serializeJournalBlock(nodes[i]));
+                delta = { prefix: first, suffix: nodes.length - 1 - last, blocks: blocks };
+            }
+            journal.dirty.clear();
+            journal.full = false;
+            return JSON.stringify(delta);
+        }
+
+        function collectJournalCheckpoint() {
+            const journal = window.editorJournal;
+            if (journal.observer) journal.observer.takeRecords();
+            journal.dirty.clear();
+            journal.full = false;
+            const nodes = document.getElementById('editor').childNodes;
+            return JSON.stringify({ blocks: Array.from(nodes, serializeJournalBlock) });
+        }
+        """
+
+    def selection_change_js(self):
+        """JavaScript to track selection changes and update formatting buttons"""
+        return """
         document.addEventListener('selectionchange', function() {
             // Only update if the selection is in our editor
             const selection = window.getSelection();
@@ -702,12 +1418,572 @@ class HTMLEditorApp(Adw.Application):
                 
                 // Check if the selection is within our editor
                 if (editor.contains(range.commonAncestorContainer)) {
-                    updateFormattingState();
+                    scheduleStatusUpdate();
                 }
             }
         });
         """
 
+    def status_channel_js(self):
+        """JavaScript that reports editor state to Python, at most once per frame."""
+        return """
+        window.editorStatus = {
+            frameRequested: false,
+            changed: false,         // content edited since the last report
+            overrides: {},
+            words: 0,
+            wordsTimer: null,
+            lastPosted: null
+        };
+
+        function countWords() {
+            const status = window.editorStatus;
+            status.wordsTimer = null;
+            // textContent avoids the layout that innerText would force
+            const text = document.getElementById('editor').textContent;
+            const matches = text.match(/\\S+/g);
+            status.words = matches ? matches.length : 0;
+            scheduleStatusUpdate();
+        }
+
+        function scheduleWordCount() {
+            const status = window.editorStatus;
+            if (status.wordsTimer) clearTimeout(status.wordsTimer);
+            // Recount only once typing pauses, and then only when the page is idle
+            status.wordsTimer = setTimeout(function() {
+                if (window.requestIdleCallback) {
+                    window.requestIdleCallback(countWords, { timeout: 2000 });
+                } else {
+                    countWords();
+                }
+            }, 750);
+        }
+
+        function postStatus() {
+            const status = window.editorStatus;
+            status.frameRequested = false;
+            const sizes = getStackSizes();
+            const message = {
+                view: Number(document.documentElement.dataset.view),
+                changed: status.changed,
+                undoSize: sizes.undoSize,
+                redoSize: sizes.redoSize,
+                bold: document.queryCommandState('bold'),
+                italic: document.queryCommandState('italic'),
+                underline: document.queryCommandState('underline'),
+                words: status.words
+            };
+            Object.assign(message, status.overrides);
+            status.overrides = {};
+            status.changed = false;
+
+            // Edits are always reported: Python may have cleared its modified flag on save
+            const serialized = JSON.stringify(message);
+            if (!message.changed && serialized === status.lastPosted) return;
+            status.lastPosted = serialized;
+            try {
+                window.webkit.messageHandlers.editorStatus.postMessage(serialized);
+            } catch(e) {
+                console.log("Could not post editor status:", e);
+            }
+        }
+
+        function scheduleStatusUpdate(options) {
+            const status = window.editorStatus;
+            if (options && options.changed) {
+                status.changed = true;
+                scheduleWordCount();
+            }
+            if (options && options.overrides) {
+                Object.assign(status.overrides, options.overrides);
+            }
+            if (!status.frameRequested) {
+                status.frameRequested = true;
+                window.requestAnimationFrame(postStatus);
+            }
+        }
+        """
+
+    def reveal_text_js(self):
+        """JavaScript that selects and scrolls to the first occurrence of any of a list of terms."""
+        return """
+        function revealText(terms) {
+            const editor = document.getElementById('editor');
+            const needles = terms.map(term => term.toLowerCase()).filter(Boolean);
+            // Terms are tried in order, so a whole phrase wins over its single words
+            for (const needle of needles) {
+                const walker = document.createTreeWalker(editor, NodeFilter.SHOW_TEXT);
+                for (let node = walker.nextNode(); node; node = walker.nextNode()) {
+                    const index = node.nodeValue.toLowerCase().indexOf(needle);
+                    if (index < 0) continue;
+                    const range = document.createRange();
+                    range.setStart(node, index);
+                    range.setEnd(node, index + needle.length);
+                    const selection = window.getSelection();
+                    selection.removeAllRanges();
+                    selection.addRange(range);
+                    showTableRowsAround(node);
+                    node.parentElement.scrollIntoView({ block: 'center' });
+                    editor.focus();
+                    return true;
+                }
+            }
+            return false;
+        }
+        """
+
+    def tables_js(self):
+        """JavaScript for tables: delegated cell navigation, rows built in batches, and cached
+        column widths and optional row virtualization for long tables, in a stylesheet the saved
+        document never sees."""
+        return f"""
+        window.editorTables = {{
+            states: new Map(),      // table of at least {TABLE_FIXED_LAYOUT_ROWS} rows -> cached layout
+            sheet: null,            // rules for those tables, kept out of the document and its saves
+            rulesText: '',
+            virtualize: false,
+            frameRequested: false,
+            importing: null         // table a CSV/TSV import is filling
+        }};
+
+        // CSS path to a table from the editor, so rules can reach it without marking the markup
+        function tableSelector(table) {{
+            const parts = [];
+            for (let node = table; node && node.id !== 'editor'; node = node.parentElement) {{
+                let index = 1;
+                for (let sibling = node.previousElementSibling; sibling; sibling = sibling.previousElementSibling) index++;
+                parts.unshift(':nth-child(' + index + ')');
+            }}
+            return '#editor > ' + parts.join(' > ');
+        }}
+
+        function tableBody(table) {{
+            return table.tBodies.length === 1 ? table.tBodies[0] : null;
+        }}
+
+        // Widths of the first row's cells, taken once while the table lays itself out
+        function measureColumns(table, state) {{
+            const first = table.rows[0];
+            state.columns = first ? first.cells.length : 0;
+            state.widths = [];
+            if (!first || Array.prototype.some.call(first.cells, cell => cell.colSpan > 1)) return;
+            state.tableWidth = table.getBoundingClientRect().width;
+            state.widths = Array.from(first.cells, cell => cell.getBoundingClientRect().width);
+        }}
+
+        // Pick the body rows near the viewport; the rest are hidden and stand in as margins
+        function updateRowWindow(table, state) {{
+            const body = tableBody(table);
+            const rows = body ? body.rows : null;
+            if (!rows || rows.length < {TABLE_VIRTUAL_ROWS} || state.widths.length === 0) {{
+                state.virtual = false;
+                state.before = state.after = 0;
+                return;
+            }}
+            const n = rows.length;
+            if (!state.heights || state.heights.length !== n) {{
+                state.heights = new Float64Array(n);    // 0 until a row has been seen
+            }}
+            const heights = state.heights;
+            const renderedFirst = state.virtual ? state.first : 0;
+            const renderedLast = state.virtual ? Math.min(state.last, n - 1) : n - 1;
+            for (let i = renderedFirst; i <= renderedLast; i++) {{
+                const height = rows[i].getBoundingClientRect().height;
+                if (height > 0) heights[i] = height;
+            }}
+            let known = 0;
+            let knownCount = 0;
+            for (let i = 0; i < n; i++) {{
+                if (heights[i] > 0) {{
+                    known += heights[i];
+                    knownCount++;
+                }}
+            }}
+            const estimate = knownCount > 0 ? known / knownCount : 24;
+
+            // Where row 0 would start with nothing hidden
+            let y = body.getBoundingClientRect().top - (state.virtual ? state.before : 0);
+            const viewTop = -{TABLE_OVERSCAN_PX};
+            const viewBottom = window.innerHeight + {TABLE_OVERSCAN_PX};
+            let first = n;
+            let last = -1;
+            for (let i = 0; i < n; i++) {{
+                const height = heights[i] || estimate;
+                if (y + height >= viewTop && y <= viewBottom) {{
+                    if (first === n) first = i;
+                    last = i;
+                }}
+                y += height;
+            }}
+            if (last < 0) {{
+                // Entirely off screen: keep one row, at the end nearest the viewport
+                first = last = y < viewTop ? n - 1 : 0;
+            }}
+            let before = 0;
+            let after = 0;
+            for (let i = 0; i < first; i++) before += heights[i] || estimate;
+            for (let i = last + 1; i < n; i++) after += heights[i] || estimate;
+            Object.assign(state, {{ virtual: true, first: first, last: last, before: before, after: after }});
+        }}
+
+        function applyTableRules() {{
+            const tables = window.editorTables;
+            const rules = [];
+            tables.states.forEach((state, table) => {{
+                if (!state.widths || state.widths.length === 0) return;
+                const selector = tableSelector(table);
+                rules.push(selector + ' {{ table-layout: fixed; width: ' + state.tableWidth + 'px; }}');
+                state.widths.forEach((width, i) => {{
+                    rules.push(selector + ' > * > tr > :nth-child(' + (i + 1) + ') {{ box-sizing: border-box; width: ' +
+                               width + 'px; }}');
+                }});
+                if (state.virtual) {{
+                    if (state.first > 0) {{
+                        rules.push(selector + ' > tbody > tr:nth-child(-n+' + state.first + ') {{ display: none; }}');
+                    }}
+                    rules.push(selector + ' > tbody > tr:nth-child(n+' + (state.last + 2) + ') {{ display: none; }}');
+                    rules.push(selector + ' {{ margin-top: ' + state.before + 'px !important; margin-bottom: ' +
+                               state.after + 'px !important; }}');
+                }}
+            }});
+            const text = rules.join(' ');
+            if (text === tables.rulesText) return;
+            tables.rulesText = text;
+            if (tables.sheet.replaceSync) tables.sheet.replaceSync(text);
+            else tables.sheet.textContent = text;
+        }}
+
+        function refreshTables() {{
+            const tables = window.editorTables;
+            tables.frameRequested = false;
+            const editor = document.getElementById('editor');
+            for (const table of Array.from(tables.states.keys())) {{
+                if (!table.isConnected || table.rows.length < {TABLE_FIXED_LAYOUT_ROWS}) tables.states.delete(table);
+            }}
+            for (const table of editor.getElementsByTagName('table')) {{
+                if (!tables.states.has(table) && table.rows.length >= {TABLE_FIXED_LAYOUT_ROWS}) {{
+                    tables.states.set(table, {{ widths: null, columns: 0, tableWidth: 0, heights: null,
+                                               virtual: false, first: 0, last: 0, before: 0, after: 0 }});
+                }}
+            }}
+
+            // New tables, and tables whose first row changed, are measured with their rules lifted
+            const unmeasured = [];
+            tables.states.forEach((state, table) => {{
+                const first = table.rows[0];
+                if (!state.widths || (first && first.cells.length !== state.columns)) {{
+                    state.widths = null;
+                    unmeasured.push(table);
+                }}
+            }});
+            if (unmeasured.length > 0) {{
+                applyTableRules();
+                unmeasured.forEach(table => measureColumns(table, tables.states.get(table)));
+            }}
+            if (tables.virtualize) tables.states.forEach((state, table) => updateRowWindow(table, state));
+            applyTableRules();
+        }}
+
+        function scheduleTableRefresh() {{
+            const tables = window.editorTables;
+            if (tables.frameRequested) return;
+            tables.frameRequested = true;
+            window.requestAnimationFrame(refreshTables);
+        }}
+
+        function setTableVirtualization(enabled) {{
+            const tables = window.editorTables;
+            tables.virtualize = enabled;
+            if (!enabled) {{
+                tables.states.forEach(state => {{
+                    state.virtual = false;
+                    state.before = state.after = 0;
+                }});
+            }}
+            scheduleTableRefresh();
+        }}
+
+        // Render every row of the table around node, e.g. before scrolling to it
+        function showTableRowsAround(node) {{
+            const tables = window.editorTables;
+            const element = node.nodeType === Node.ELEMENT_NODE ? node : node.parentElement;
+            for (let table = element && element.closest('table'); table;
+                 table = table.parentElement && table.parentElement.closest('table')) {{
+                const state = tables.states.get(table);
+                if (state && state.virtual) {{
+                    state.virtual = false;
+                    state.before = state.after = 0;
+                    applyTableRules();
+                }}
+            }}
+            scheduleTableRefresh();
+        }}
+
+        function tableRowsHidden() {{
+            for (const state of window.editorTables.states.values()) {{
+                if (state.virtual) return true;
+            }}
+            return false;
+        }}
+
+        // Run fn with every table row shown, for text that layout decides, such as innerText
+        function withAllTableRows(fn) {{
+            const sheet = window.editorTables.sheet;
+            if (!sheet || sheet.disabled || !tableRowsHidden()) return fn();
+            sheet.disabled = true;
+            try {{
+                return fn();
+            }} finally {{
+                sheet.disabled = false;
+            }}
+        }}
+
+        function onTableMutations(mutations) {{
+            const tables = window.editorTables;
+            for (const m of mutations) {{
+                // Typing in a long table may change a row's height; other edits may move the tables
+                if (tables.states.size > 0) {{
+                    scheduleTableRefresh();
+                    return;
+                }}
+                for (const node of m.addedNodes) {{
+                    if (node.nodeName === 'TABLE' || node.nodeName === 'TR' ||
+                        (node.getElementsByTagName && node.getElementsByTagName('table').length > 0)) {{
+                        scheduleTableRefresh();
+                        return;
+                    }}
+                }}
+            }}
+        }}
+
+        function createTableRow(columnCount, values) {{
+            const row = document.createElement('tr');
+            for (let i = 0; i < columnCount; i++) {{
+                const cell = document.createElement('td');
+                const value = values ? values[i] : '';
+                if (value) cell.textContent = value;
+                else cell.appendChild(document.createElement('br'));
+                row.appendChild(cell);
+            }}
+            return row;
+        }}
+
+        // Rows are built off the document and go in with a single insertion
+        function appendTableRows(body, count, columnCount, rowValues) {{
+            const fragment = document.createDocumentFragment();
+            for (let i = 0; i < count; i++) {{
+                const values = rowValues ? rowValues[i] : null;
+                fragment.appendChild(createTableRow(values ? Math.max(columnCount, values.length) : columnCount, values));
+            }}
+            const firstAdded = fragment.firstChild;
+            body.appendChild(fragment);
+            return firstAdded;
+        }}
+
+        function createEditorTable() {{
+            const table = document.createElement('table');
+            table.setAttribute('border', '1');
+            table.setAttribute('cellpadding', '4');
+            table.style.borderCollapse = 'collapse';
+            table.appendChild(document.createElement('tbody'));
+            return table;
+        }}
+
+        // After the top-level block holding the caret, or instead of it if that block is empty
+        function insertBlockAtCaret(block) {{
+            const editor = document.getElementById('editor');
+            const selection = window.getSelection();
+            let anchor = selection.rangeCount ? selection.getRangeAt(0).startContainer : null;
+            if (!anchor || !editor.contains(anchor) || anchor === editor) anchor = editor.lastChild;
+            while (anchor && anchor.parentNode !== editor) anchor = anchor.parentNode;
+            if (anchor && !anchor.textContent.trim() && !(anchor.querySelector && anchor.querySelector('img, table, hr'))) {{
+                editor.replaceChild(block, anchor);
+            }} else {{
+                editor.insertBefore(block, anchor ? anchor.nextSibling : null);
+            }}
+            if (!block.nextSibling) {{
+                const line = document.createElement('div');
+                line.appendChild(document.createElement('br'));
+                editor.appendChild(line);
+            }}
+        }}
+
+        function selectTableCell(cell, collapse) {{
+            const range = document.createRange();
+            range.selectNodeContents(cell);
+            if (collapse) range.collapse(true);
+            const selection = window.getSelection();
+            selection.removeAllRanges();
+            selection.addRange(range);
+            cell.scrollIntoView({{ block: 'nearest' }});
+        }}
+
+        function insertTable(rowCount, columnCount) {{
+            saveState();
+            const table = createEditorTable();
+            appendTableRows(table.tBodies[0], rowCount, columnCount, null);
+            insertBlockAtCaret(table);
+            saveState();
+            selectTableCell(table.rows[0].cells[0], true);
+            scheduleStatusUpdate({{ changed: true }});
+        }}
+
+        // Tab and Shift+Tab move between cells; Tab in the last cell adds a row
+        function onTableKeydown(e) {{
+            if (e.key !== 'Tab' || e.ctrlKey || e.altKey || e.metaKey) return;
+            const selection = window.getSelection();
+            const node = selection.rangeCount ? selection.anchorNode : null;
+            const element = node && (node.nodeType === Node.ELEMENT_NODE ? node : node.parentElement);
+            const cell = element && element.closest('td, th');
+            if (!cell || !document.getElementById('editor').contains(cell)) return;
+            e.preventDefault();
+            const table = cell.closest('table');
+            const rowIndex = cell.parentElement.rowIndex;
+            let target;
+            if (e.shiftKey) {{
+                const previousRow = table.rows[rowIndex - 1];
+                target = cell.previousElementSibling || (previousRow && previousRow.lastElementChild);
+            }} else {{
+                const nextRow = table.rows[rowIndex + 1];
+                target = cell.nextElementSibling || (nextRow && nextRow.firstElementChild);
+                if (!target) {{
+                    saveState();
+                    const row = appendTableRows(cell.parentElement.parentElement, 1, cell.parentElement.cells.length, null);
+                    saveState();
+                    target = row.firstElementChild;
+                    scheduleStatusUpdate({{ changed: true }});
+                }}
+            }}
+            if (target) selectTableCell(target, false);
+        }}
+
+        // A CSV/TSV import streams its rows in batches and undoes as one step
+        function beginTableImport() {{
+            const tables = window.editorTables;
+            saveState();
+            window.undoManager.sealHeld = true;
+            tables.importing = createEditorTable();
+            insertBlockAtCaret(tables.importing);
+        }}
+
+        function appendTableImport(rows) {{
+            const table = window.editorTables.importing;
+            if (!table || rows.length === 0) return 0;
+            appendTableRows(table.tBodies[0], rows.length, rows[0].length, rows);
+            return table.rows.length;
+        }}
+
+        function endTableImport() {{
+            const tables = window.editorTables;
+            const table = tables.importing;
+            tables.importing = null;
+            if (table && table.rows.length === 0) table.remove();
+            window.undoManager.sealHeld = false;
+            saveState();
+            if (table && table.isConnected) selectTableCell(table.rows[0].cells[0], true);
+            scheduleStatusUpdate({{ changed: true }});
+            return table && table.isConnected ? table.rows.length : 0;
+        }}
+
+        function setupTables(editor) {{
+            const tables = window.editorTables;
+            if ('adoptedStyleSheets' in document && window.CSSStyleSheet) {{
+                tables.sheet = new CSSStyleSheet();
+                document.adoptedStyleSheets = [...document.adoptedStyleSheets, tables.sheet];
+            }} else {{
+                tables.sheet = document.createElement('style');
+                document.head.appendChild(tables.sheet);
+            }}
+            new MutationObserver(onTableMutations).observe(editor, {{
+                childList: true,
+                subtree: true,
+                characterData: true
+            }});
+            editor.addEventListener('keydown', onTableKeydown);
+            // The clipboard's plain text is laid out after these handlers; show hidden rows until then
+            for (const type of ['copy', 'cut']) {{
+                document.addEventListener(type, function() {{
+                    if (tables.sheet.disabled || !tableRowsHidden()) return;
+                    tables.sheet.disabled = true;
+                    setTimeout(() => {{ tables.sheet.disabled = false; }}, 0);
+                }}, true);
+            }}
+            window.addEventListener('scroll', function() {{
+                if (tables.virtualize && tables.states.size > 0) scheduleTableRefresh();
+            }}, {{ passive: true }});
+            window.addEventListener('resize', function() {{
+                // Column widths follow the window; measure them again
+                tables.states.forEach(state => state.widths = null);
+                scheduleTableRefresh();
+            }});
+        }}
+        """
+
+    def telemetry_js(self):
+        """JavaScript that collects --telemetry histograms in the page and posts them once a second."""
+        return f"""
+        window.editorTelemetry = {{
+            pending: {{}},         // metric -> histogram batch not yet posted
+            flushTimer: null
+        }};
+
+        function recordTelemetry(name, value) {{
+            const telemetry = window.editorTelemetry;
+            let batch = telemetry.pending[name];
+            if (!batch) {{
+                batch = telemetry.pending[name] = {{ buckets: {{}}, count: 0, sum: 0, min: value, max: value }};
+            }}
+            // Same log-scale buckets as editor_telemetry.Histogram
+            const index = value <= {editor_telemetry.BUCKET_BASE} ? 0 :
+                Math.min({editor_telemetry.BUCKET_COUNT - 1}, Math.ceil(Math.log2(value / {editor_telemetry.BUCKET_BASE})));
+            batch.buckets[index] = (batch.buckets[index] || 0) + 1;
+            batch.count++;
+            batch.sum += value;
+            batch.min = Math.min(batch.min, value);
+            batch.max = Math.max(batch.max, value);
+            if (!telemetry.flushTimer) telemetry.flushTimer = setTimeout(flushTelemetry, 1000);
+        }}
+
+        function flushTelemetry() {{
+            const telemetry = window.editorTelemetry;
+            telemetry.flushTimer = null;
+            const message = {{ view: Number(document.documentElement.dataset.view), histograms: telemetry.pending }};
+            telemetry.pending = {{}};
+            try {{
+                window.webkit.messageHandlers.editorTelemetry.postMessage(JSON.stringify(message));
+            }} catch(e) {{
+                console.log("Could not post telemetry:", e);
+            }}
+        }}
+
+        // Keydown to the first task after the next frame, which runs once that frame is painted
+        document.addEventListener('keydown', function(e) {{
+            const start = e.timeStamp;
+            requestAnimationFrame(function() {{
+                const channel = new MessageChannel();
+                channel.port1.onmessage = function() {{
+                    recordTelemetry('keydown to paint', performance.now() - start);
+                }};
+                channel.port2.postMessage(null);
+            }});
+        }}, true);
+
+        // Document size is sampled when the page is idle, not on every edit
+        setInterval(function() {{
+            const sample = function() {{
+                const editor = document.getElementById('editor');
+                if (!editor) return;
+                recordTelemetry('dom nodes', editor.getElementsByTagName('*').length);
+                recordTelemetry('undo history', getStackSizes().undoBytes);
+            }};
+            if (window.requestIdleCallback) {{
+                window.requestIdleCallback(sample, {{ timeout: 2000 }});
+            }} else {{
+                sample();
+            }}
+        }}, 5000);
+        """
+
     def init_editor_js(self):
         """JavaScript to initialize the editor and set up event listeners."""
         return """
@@ -717,6 +1993,7 @@ class HTMLEditorApp(Adw.Application):
             editor.addEventListener('focus', function onFirstFocus(e) {
                 if (!editor.textContent.trim() && editor.innerHTML === '') {
                     editor.innerHTML = '<div><br></div>';
+                    if (window.undoManager.observer) window.undoManager.observer.takeRecords();
                     const range = document.createRange();
                     const sel = window.getSelection();
                     const firstDiv = editor.querySelector('div');
@@ -730,8 +2007,39 @@ class HTMLEditorApp(Adw.Application):
                 }
             });
 
-            window.lastContent = editor.innerHTML;
-            saveState();
+            window.undoManager.observer = new MutationObserver(function(mutations) {
+                if (window.contentStreaming) return;
+                recordMutations(mutations);
+                if (!window.isUndoRedo && window.undoManager.pending.length > 0) {
+                    scheduleSeal();
+                }
+            });
+            window.undoManager.observer.observe(editor, {
+                childList: true,
+                subtree: true,
+                characterData: true,
+                characterDataOldValue: true,
+                attributes: true,
+                attributeOldValue: true
+            });
+            editor.addEventListener('beforeinput', onBeforeInputForUndo);
+
+            window.editorJournal.observer = new MutationObserver(trackJournalMutations);
+            window.editorJournal.observer.observe(editor, {
+                childList: true,
+                subtree: true,
+                characterData: true,
+                attributes: true
+            });
+
+            window.editorSanitizer.observer = new MutationObserver(onSanitizerMutations);
+            window.editorSanitizer.observer.observe(editor, {
+                childList: true,
+                subtree: true,
+                attributes: true
+            });
+            editor.addEventListener('paste', onSanitizerPaste);
+            setupTables(editor);
             editor.focus();
             
             // Track our own formatting state
@@ -742,17 +2050,7 @@ class HTMLEditorApp(Adw.Application):
                     document.execCommand('formatBlock', false, 'div');
                 }
                 if (!window.isUndoRedo) {
-                    const currentContent = editor.innerHTML;
-                    if (currentContent !== window.lastContent) {
-                        saveState();
-                        window.lastContent = currentContent;
-                        window.redoStack = [];
-                        try {
-                            window.webkit.messageHandlers.contentChanged.postMessage("changed");
-                        } catch(e) {
-                            console.log("Could not notify about changes:", e);
-                        }
-                    }
+                    scheduleStatusUpdate({ changed: true });
                 }
             });
             
@@ -768,15 +2066,7 @@ class HTMLEditorApp(Adw.Application):
                         // If underline was turned off before Enter, make sure it stays off
                         if (!underlineWasActive) {
                             // Force update the state display
-                            const formatState = {
-                                bold: document.queryCommandState('bold'),
-                                italic: document.queryCommandState('italic'),
-                                underline: false
-                            };
-                            
-                            window.webkit.messageHandlers.formattingChanged.postMessage(
-                                JSON.stringify(formatState)
-                            );
+                            scheduleStatusUpdate({ overrides: { underline: false } });
                         }
                     }, 10);
                 }
@@ -793,7 +2083,7 @@ class HTMLEditorApp(Adw.Application):
     
     def execute_js(self, win, script):
         """Execute JavaScript in the WebView"""
-        win.webview.evaluate_javascript(script, -1, None, None, None, None, None)
+        win.webview.evaluate_javascript(script, -1, None, None, None, telemetry.timed('js: execute'), None)
     
     def extract_body_content(self, html):
         """Extract content from the body or just return the HTML if parsing fails"""
@@ -808,80 +2098,92 @@ class HTMLEditorApp(Adw.Application):
             # In case of any error, return the original HTML
             return html
     
-    # Undo/Redo related methods
-    def on_content_changed(self, win, manager, result):
-        # Check current modified state before changing it
-        was_modified = win.modified
-        
-        # Set new state and update window title
-        win.modified = True
-        self.update_window_title(win)
-        self.update_undo_redo_state(win)
-        
-        # Only update window menu if the modified state changed
-        if not was_modified:  # If it wasn't modified before but now is
-            self.update_window_menu()
-        
-    def update_undo_redo_state(self, win):
+    def _js_message_to_string(self, result):
+        """Extract the string payload of a script message across WebKit versions"""
+        if hasattr(result, 'get_js_value'):
+            return result.get_js_value().to_string()
+        elif hasattr(result, 'to_string'):
+            return result.to_string()
+        elif hasattr(result, 'get_value'):
+            return result.get_value().get_string()
+        return str(result)
+
+    def on_editor_paste(self, manager, result):
+        """Clean a large HTML paste on a worker thread, then insert it where it was pasted"""
+        import json
         try:
-            # Get stack sizes to update button states
-            win.webview.evaluate_javascript(
-                "JSON.stringify(getStackSizes());",  # Ensure we get a proper JSON string
-                -1, None, None, None,
-                lambda webview, result, data: self._on_get_stack_sizes(win, webview, result, data), 
-                None
-            )
+            paste = json.loads(self._js_message_to_string(result))
         except Exception as e:
-            print(f"Error updating undo/redo state: {e}")
-            # Fallback - enable buttons
-            win.undo_button.set_sensitive(True)
-            win.redo_button.set_sensitive(False)
+            print(f"Error reading pasted content: {e}")
+            return
+        win = self.editor_views.get(paste.get('view'))
+        if win is None:
+            return
+        win.statusbar.set_text("Cleaning pasted content…")
+        future = conversion_service.get_service().run(html_sanitizer.sanitize_html, paste['html'])
+        
+        def insert():
+            if win not in self.windows:
+                return False
+            try:
+                html = future.result()
+            except Exception as e:
+                print(f"Error cleaning pasted content: {e}")
+                win.statusbar.set_text(f"Could not paste: {e}")
+                return False
+            self.execute_js(win, f"insertSanitizedPaste({int(paste['id'])}, {json.dumps(html)});")
+            win.statusbar.set_text("Pasted")
+            return False
         
-    def _on_get_stack_sizes(self, win, webview, result, user_data):
+        future.add_done_callback(lambda future: GLib.idle_add(insert))
+
+    def on_editor_telemetry(self, manager, result):
+        """Merge the histograms a page collected into the application's"""
         try:
-            js_result = webview.evaluate_javascript_finish(result)
-            if js_result:
-                # Try different approaches to get the result based on WebKit version
-                try:
-                    # Newer WebKit APIs
-                    if hasattr(js_result, 'get_js_value'):
-                        stack_sizes = js_result.get_js_value().to_string()
-                    # Direct value access - works in some WebKit versions
-                    elif hasattr(js_result, 'to_string'):
-                        stack_sizes = js_result.to_string()
-                    elif hasattr(js_result, 'get_string'):
-                        stack_sizes = js_result.get_string()
-                    else:
-                        # Fallback - try converting to string directly
-                        stack_sizes = str(js_result)
-                    
-                    # Parse the JSON result
-                    import json
-                    try:
-                        # Remove any surrounding quotes if present
-                        if stack_sizes.startswith('"') and stack_sizes.endswith('"'):
-                            stack_sizes = stack_sizes[1:-1]
-                        
-                        # Try to parse as JSON
-                        sizes = json.loads(stack_sizes)
-                        # Update button states
-                        win.undo_button.set_sensitive(sizes.get('undoSize', 0) > 1)
-                        win.redo_button.set_sensitive(sizes.get('redoSize', 0) > 0)
-                    except json.JSONDecodeError as je:
-                        print(f"Error parsing JSON: {je}, value was: {stack_sizes}")
-                        # Set reasonable defaults
-                        win.undo_button.set_sensitive(True)
-                        win.redo_button.set_sensitive(False)
-                except Exception as inner_e:
-                    print(f"Inner error processing JS result: {inner_e}")
-                    # Set reasonable defaults
-                    win.undo_button.set_sensitive(True)
-                    win.redo_button.set_sensitive(False)
+            import json
+            telemetry.merge_page_report(json.loads(self._js_message_to_string(result))['histograms'])
         except Exception as e:
-            print(f"Error getting stack sizes: {e}")
-            # Set reasonable defaults in case of error
-            win.undo_button.set_sensitive(True)
-            win.redo_button.set_sensitive(False)
+            print(f"Error reading editor telemetry: {e}")
+
+    # Undo/Redo related methods
+    def on_editor_status(self, manager, result):
+        """Apply a coalesced status report (modified flag, undo/redo, formatting, word count)"""
+        try:
+            import json
+            status = json.loads(self._js_message_to_string(result))
+        except Exception as e:
+            print(f"Error reading editor status: {e}")
+            return
+        
+        # All WebViews share one message handler; the page says which one it is
+        win = self.editor_views.get(status.get('view'))
+        if win is None:
+            return  # a pooled view that no window owns yet
+        
+        if status.get('changed'):
+            win.change_serial += 1
+        
+        # Only touch the title and window menu when the modified state flips
+        if status.get('changed') and not win.modified:
+            win.modified = True
+            self.update_window_title(win)
+            self.update_window_menu()
+        
+        win.undo_button.set_sensitive(status.get('undoSize', 0) > 0)
+        win.redo_button.set_sensitive(status.get('redoSize', 0) > 0)
+        
+        # Update button states without triggering their handlers
+        for name in ('bold', 'italic', 'underline'):
+            button = getattr(win, f"{name}_button")
+            handler_id = getattr(win, f"{name}_handler_id")
+            active = bool(status.get(name, False))
+            if handler_id is not None and button.get_active() != active:
+                button.handler_block(handler_id)
+                button.set_active(active)
+                button.handler_unblock(handler_id)
+        
+        words = status.get('words', 0)
+        win.word_count_label.set_text(f"{words} word{'s' if words != 1 else ''}")
             
     def on_undo_clicked(self, win, button):
         self.perform_undo(win)
@@ -902,7 +2204,7 @@ class HTMLEditorApp(Adw.Application):
             win.webview.evaluate_javascript(
                 "JSON.stringify(performUndo());",
                 -1, None, None, None,
-                lambda webview, result, data: self._on_undo_redo_performed(win, webview, result, data),
+                telemetry.timed('js: undo', lambda webview, result, data: self._on_undo_redo_performed(win, webview, result, data)),
                 "undo"
             )
             win.statusbar.set_text("Undo performed")
@@ -915,7 +2217,7 @@ class HTMLEditorApp(Adw.Application):
             win.webview.evaluate_javascript(
                 "JSON.stringify(performRedo());",
                 -1, None, None, None,
-                lambda webview, result, data: self._on_undo_redo_performed(win, webview, result, data),
+                telemetry.timed('js: redo', lambda webview, result, data: self._on_undo_redo_performed(win, webview, result, data)),
                 "redo"
             )
             win.statusbar.set_text("Redo performed")
@@ -950,8 +2252,6 @@ class HTMLEditorApp(Adw.Application):
                         
                         # Only update window menu if modified state changed
                         self.update_window_menu()
-                    
-                    self.update_undo_redo_state(win)
                 else:
                     win.statusbar.set_text(f"No more {operation} actions available")
         except Exception as e:
@@ -963,7 +2263,7 @@ class HTMLEditorApp(Adw.Application):
         # Create a new window with a blank document
         new_win = self.create_window()
         new_win.present()
-        GLib.timeout_add(500, lambda: self.set_initial_focus(new_win))
+        GLib.timeout_add(0 if new_win.webview.editor_ready else 500, lambda: self.set_initial_focus(new_win))
         self.update_window_menu()
         new_win.statusbar.set_text("New document created")
     
@@ -1003,7 +2303,7 @@ class HTMLEditorApp(Adw.Application):
         
         try:
             # Apply formatting
-            self.execute_js(win, "document.execCommand('bold', false, null);")
+            self.execute_js(win, "saveState(); document.execCommand('bold', false, null); saveState();")
             # Force focus back to the webview after a small delay
             GLib.timeout_add(50, lambda: win.webview.grab_focus())
         finally:
@@ -1019,7 +2319,7 @@ class HTMLEditorApp(Adw.Application):
         
         try:
             # Apply formatting
-            self.execute_js(win, "document.execCommand('italic', false, null);")
+            self.execute_js(win, "saveState(); document.execCommand('italic', false, null); saveState();")
             # Force focus back to the webview after a small delay
             GLib.timeout_add(50, lambda: win.webview.grab_focus())
         finally:
@@ -1035,7 +2335,7 @@ class HTMLEditorApp(Adw.Application):
         
         try:
             # Apply formatting
-            self.execute_js(win, "document.execCommand('underline', false, null);")
+            self.execute_js(win, "saveState(); document.execCommand('underline', false, null); saveState();")
             # Force focus back to the webview after a small delay
             GLib.timeout_add(50, lambda: win.webview.grab_focus())
         finally:
@@ -1043,49 +2343,6 @@ class HTMLEditorApp(Adw.Application):
             if win.underline_handler_id is not None:
                 button.handler_unblock(win.underline_handler_id)
 
-    def on_formatting_changed(self, win, manager, result):
-        """Update toggle button states based on current formatting"""
-        try:
-            # Extract the message differently based on WebKit version
-            message = None
-            if hasattr(result, 'get_js_value'):
-                message = result.get_js_value().to_string()
-            elif hasattr(result, 'to_string'):
-                message = result.to_string()
-            elif hasattr(result, 'get_value'):
-                message = result.get_value().get_string()
-            else:
-                # Try to get the value directly
-                try:
-                    message = str(result)
-                except:
-                    print("Could not extract message from result")
-                    return
-            
-            # Parse the JSON
-            import json
-            format_state = json.loads(message)
-            
-            # Update button states without triggering their handlers
-            if win.bold_handler_id is not None:
-                win.bold_button.handler_block(win.bold_handler_id)
-                win.bold_button.set_active(format_state.get('bold', False))
-                win.bold_button.handler_unblock(win.bold_handler_id)
-            
-            if win.italic_handler_id is not None:
-                win.italic_button.handler_block(win.italic_handler_id)
-                win.italic_button.set_active(format_state.get('italic', False))
-                win.italic_button.handler_unblock(win.italic_handler_id)
-            
-            if win.underline_handler_id is not None:
-                win.underline_button.handler_block(win.underline_handler_id)
-                win.underline_button.set_active(format_state.get('underline', False))
-                win.underline_button.handler_unblock(win.underline_handler_id)
-                
-        except Exception as e:
-            print(f"Error updating formatting buttons: {e}")
-
-
     # Window Close Request
     def on_window_close_request(self, win, *args):
         """Handle window close request with save confirmation if needed"""
@@ -1129,6 +2386,7 @@ class HTMLEditorApp(Adw.Application):
         elif response == "discard":
             # Mark as unmodified before closing
             win.modified = False
+            self.discard_autosave_journal(win)
             
             # Close without saving
             self.remove_window(win)
@@ -1144,18 +2402,9 @@ class HTMLEditorApp(Adw.Application):
                                js_result.to_string() if hasattr(js_result, 'to_string') else str(js_result))
                 
                 # Define a callback that will close the window after saving
-                def after_save(file, result):
-                    try:
-                        success, _ = file.replace_contents_finish(result)
-                        if success:
-                            win.modified = False  # Mark as unmodified
-                            self.update_window_title(win)
-                            # Now close the window
-                            self.remove_window(win)
-                            win.close()
-                    except Exception as e:
-                        print(f"Error during save before close: {e}")
-                        # Close anyway in case of error
+                def after_save(error):
+                    if error is None:
+                        # Now close the window
                         self.remove_window(win)
                         win.close()
                 
@@ -1276,6 +2525,24 @@ class HTMLEditorApp(Adw.Application):
         preferences_action.connect("activate", self.on_preferences)
         self.add_action(preferences_action)
         
+        insert_table_action = Gio.SimpleAction.new("insert-table", None)
+        insert_table_action.connect("activate", self.on_insert_table)
+        self.add_action(insert_table_action)
+        
+        import_table_action = Gio.SimpleAction.new("import-table", None)
+        import_table_action.connect("activate", self.on_import_table)
+        self.add_action(import_table_action)
+        
+        search_action = Gio.SimpleAction.new("search-documents", None)
+        search_action.connect("activate", self.on_search_documents)
+        self.add_action(search_action)
+        self.set_accels_for_action("app.search-documents", ["<Control><Shift>f"])
+        
+        if telemetry.enabled:
+            telemetry_action = Gio.SimpleAction.new("telemetry", None)
+            telemetry_action.connect("activate", self.on_show_telemetry)
+            self.add_action(telemetry_action)
+        
         # New window action
         new_window_action = Gio.SimpleAction.new("new-window", None)
         new_window_action.connect("activate", self.on_new_window)
@@ -1493,6 +2760,7 @@ class HTMLEditorApp(Adw.Application):
             # Clean up button reference
             if id(window) in self.window_buttons:
                 del self.window_buttons[id(window)]
+            self.editor_views.pop(window.webview.view_id, None)
             # Update menus in all remaining windows
             self.update_window_menu()
             
@@ -1576,6 +2844,7 @@ class HTMLEditorApp(Adw.Application):
         elif response == "discard":
             # Explicitly mark as unmodified before closing
             win.modified = False
+            self.discard_autosave_journal(win)
             
             # Close this window without saving and continue with the next
             self.remove_window(win)
@@ -1602,37 +2871,22 @@ class HTMLEditorApp(Adw.Application):
                                js_result.to_string() if hasattr(js_result, 'to_string') else str(js_result))
                 
                 # Define a callback for after saving
-                def after_save(file, result):
-                    try:
-                        success, _ = file.replace_contents_finish(result)
-                        if success:
-                            win.modified = False  # Mark as unmodified
-                            self.update_window_title(win)
-                        
-                        # Close this window
-                        self.remove_window(win)
-                        win.close()
-                        
-                        # Continue with remaining windows
-                        remaining_windows = windows_with_changes[1:]
-                        if remaining_windows:
-                            GLib.idle_add(lambda: self._handle_quit_with_unsaved_changes(remaining_windows))
-                        elif not self.windows:
-                            # If all windows are closed, quit the application
-                            self.quit()
-                    except Exception as e:
-                        print(f"Error saving during quit: {e}")
-                        # Close anyway and continue
-                        self.remove_window(win)
-                        win.close()
-                        
-                        # Continue with remaining windows
-                        remaining_windows = windows_with_changes[1:]
-                        if remaining_windows:
-                            GLib.idle_add(lambda: self._handle_quit_with_unsaved_changes(remaining_windows))
-                        elif not self.windows:
-                            # If all windows are closed, quit the application
-                            self.quit()
+                def after_save(error):
+                    if error is not None:
+                        # Keep the window and stop quitting so the changes aren't lost
+                        return
+                    
+                    # Close this window
+                    self.remove_window(win)
+                    win.close()
+                    
+                    # Continue with remaining windows
+                    remaining_windows = windows_with_changes[1:]
+                    if remaining_windows:
+                        GLib.idle_add(lambda: self._handle_quit_with_unsaved_changes(remaining_windows))
+                    elif not self.windows:
+                        # If all windows are closed, quit the application
+                        self.quit()
                 
                 # Save with our callback
                 self.save_html_content(win, editor_content, win.current_file, after_save)
@@ -1691,6 +2945,370 @@ class HTMLEditorApp(Adw.Application):
         )
         about.present()
     
+    def on_insert_table(self, action, param):
+        """Ask for the size of a new table and insert it after the block holding the caret"""
+        if not self.windows:
+            return
+        active_win = next((win for win in self.windows if win.is_active()), self.windows[0])
+        
+        dialog = Adw.Dialog.new()
+        dialog.set_title("Insert Table")
+        dialog.set_content_width(320)
+        
+        content_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=12)
+        content_box.set_margin_top(24)
+        content_box.set_margin_bottom(24)
+        content_box.set_margin_start(24)
+        content_box.set_margin_end(24)
+        
+        spinners = []
+        for label_text, value, upper in (("Rows:", 3, 10000), ("Columns:", 3, 50)):
+            row_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
+            label = Gtk.Label(label=label_text)
+            label.set_halign(Gtk.Align.START)
+            label.set_hexpand(True)
+            spinner = Gtk.SpinButton()
+            spinner.set_adjustment(Gtk.Adjustment(value=value, lower=1, upper=upper, step_increment=1))
+            spinner.set_valign(Gtk.Align.CENTER)
+            row_box.append(label)
+            row_box.append(spinner)
+            content_box.append(row_box)
+            spinners.append(spinner)
+        
+        def insert(btn):
+            rows, columns = (spinner.get_value_as_int() for spinner in spinners)
+            dialog.close()
+            self.execute_js(active_win, f"insertTable({rows}, {columns});")
+        
+        button_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+        button_box.set_halign(Gtk.Align.END)
+        button_box.set_margin_top(12)
+        cancel_button = Gtk.Button(label="Cancel")
+        cancel_button.connect("clicked", lambda btn: dialog.close())
+        insert_button = Gtk.Button(label="Insert")
+        insert_button.add_css_class("suggested-action")
+        insert_button.connect("clicked", insert)
+        button_box.append(cancel_button)
+        button_box.append(insert_button)
+        content_box.append(button_box)
+        
+        dialog.set_child(content_box)
+        dialog.present(active_win)
+
+    def on_import_table(self, action, param):
+        """Choose a CSV or TSV file to bring into the document as a table"""
+        if not self.windows:
+            return
+        active_win = next((win for win in self.windows if win.is_active()), self.windows[0])
+        dialog = Gtk.FileDialog()
+        dialog.set_title("Import Table")
+        
+        filter_table = Gtk.FileFilter()
+        filter_table.set_name("CSV and TSV files")
+        for extension in table_import.TABLE_EXTENSIONS:
+            filter_table.add_pattern(f"*{extension}")
+        filter_list = Gio.ListStore.new(Gtk.FileFilter)
+        filter_list.append(filter_table)
+        dialog.set_filters(filter_list)
+        
+        dialog.open(active_win, None, lambda dialog, result: self.on_import_table_response(active_win, dialog, result))
+
+    def on_import_table_response(self, win, dialog, result):
+        try:
+            file = dialog.open_finish(result)
+        except GLib.Error:
+            return  # cancelled
+        if file and win in self.windows:
+            self.import_table(win, file.get_path())
+
+    def import_table(self, win, path):
+        """Stream the rows of a CSV or TSV file into a new table, one batch per round trip"""
+        import json
+        if win.importing_table:
+            win.statusbar.set_text("A table is still being imported")
+            return
+        name = os.path.basename(path)
+        batches = table_import.row_batches(path, TABLE_IMPORT_BATCH_ROWS)
+        imported = 0
+        
+        def send_next(webview=None, result=None, user_data=None):
+            nonlocal imported
+            if result is not None:
+                try:
+                    webview.evaluate_javascript_finish(result)
+                except GLib.Error as e:
+                    print(f"Error adding table rows: {e}")
+            if win not in self.windows:
+                batches.close()
+                return
+            error = None
+            try:
+                batch = next(batches, None)
+            except Exception as e:
+                print(f"Error importing table: {e}")
+                error = e
+                batch = None
+            if batch is None:
+                self.execute_js(win, "endTableImport();")
+                win.importing_table = False
+                if error is not None:
+                    win.statusbar.set_text(f"Could not import all of {name}: {error}")
+                else:
+                    win.statusbar.set_text(f"Imported {imported} row{'s' if imported != 1 else ''} from {name}")
+                return
+            imported += len(batch)
+            win.statusbar.set_text(f"Importing {name}… {imported} rows")
+            win.webview.evaluate_javascript(f"appendTableImport({json.dumps(batch)});",
+                                            -1, None, None, None, telemetry.timed('js: append rows', send_next), None)
+        
+        win.importing_table = True
+        self.execute_js(win, "beginTableImport();")
+        send_next()
+
+    def apply_table_preferences(self, win):
+        """Tell a window's editor page whether to virtualize long tables, once it has loaded"""
+        script = f"setTableVirtualization({'true' if self.table_virtualization else 'false'});"
+        if win.webview.editor_ready:
+            self.execute_js(win, script)
+            return
+        
+        def on_load_changed(view, event):
+            if event == WebKit.LoadEvent.FINISHED:
+                view.disconnect_by_func(on_load_changed)
+                self.execute_js(win, script)
+        
+        win.webview.connect("load-changed", on_load_changed)
+
+    def queue_index_root(self, path, recursive):
+        """Have the next index refresh cover the documents in path"""
+        self.index_roots_pending.append((path, recursive))
+
+    def refresh_document_index(self):
+        """Update the search index on a background thread; False if indexing is unavailable"""
+        if self.index_thread is not None:
+            return True
+        if self.document_index is None:
+            try:
+                self.document_index = document_index.DocumentIndex()
+            except (sqlite3.Error, OSError) as e:
+                print(f"Document search unavailable: {e}")
+                return False
+        roots, self.index_roots_pending = self.index_roots_pending, []
+        self.index_stop = threading.Event()
+        self.index_thread = threading.Thread(target=self.run_document_indexer, args=(roots,),
+                                             name="author-index", daemon=True)
+        self.index_thread.start()
+        return True
+
+    def run_document_indexer(self, roots):
+        """Body of the index thread; results reach the UI through GLib.idle_add"""
+        try:
+            if not self.index_opened_folders:
+                # Folders of opened documents are the only roots not indexed recursively
+                for path, recursive in self.document_index.roots():
+                    if not recursive:
+                        self.document_index.remove_root(path)
+            for path, recursive in roots:
+                self.document_index.add_root(path, recursive)
+            self.document_index.update(progress=lambda count: GLib.idle_add(self.on_index_progress, count),
+                                       stop=self.index_stop)
+        except sqlite3.Error as e:
+            print(f"Error updating the document index: {e}")
+        finally:
+            GLib.idle_add(self.on_index_finished)
+
+    def on_index_progress(self, count):
+        if self.search_dialog_refresh:
+            self.search_dialog_refresh(f"Indexing… {count} documents updated")
+        return False
+
+    def on_index_finished(self):
+        self.index_thread = None
+        if self.search_dialog_refresh:
+            self.search_dialog_refresh(None)
+        return False
+
+    def on_search_documents(self, action, param):
+        """Search the text of every indexed document and open the chosen hit at the match"""
+        if not self.windows:
+            return
+        active_win = next((win for win in self.windows if win.is_active()), self.windows[0])
+        if not self.refresh_document_index():
+            self.show_error_dialog("Document search needs SQLite with full-text search (FTS5).")
+            return
+
+        dialog = Adw.Dialog.new()
+        dialog.set_title("Search Documents")
+        dialog.set_content_width(560)
+        dialog.set_content_height(480)
+
+        content_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=12)
+        content_box.set_margin_top(12)
+        content_box.set_margin_bottom(12)
+        content_box.set_margin_start(12)
+        content_box.set_margin_end(12)
+
+        entry = Gtk.SearchEntry(placeholder_text="Search all documents", hexpand=True)
+        status_label = Gtk.Label(xalign=0)
+        status_label.add_css_class("dim-label")
+        results = Gtk.ListBox(selection_mode=Gtk.SelectionMode.BROWSE)
+        results.add_css_class("boxed-list")
+        scrolled = Gtk.ScrolledWindow(vexpand=True, child=results)
+        content_box.append(entry)
+        content_box.append(status_label)
+        content_box.append(scrolled)
+
+        def snippet_markup(snippet):
+            markup = []
+            for piece in re.split(f"([{document_index.MATCH_START}{document_index.MATCH_END}])", snippet):
+                if piece == document_index.MATCH_START:
+                    markup.append("<b>")
+                elif piece == document_index.MATCH_END:
+                    markup.append("</b>")
+                else:
+                    markup.append(GLib.markup_escape_text(piece.replace("\n", " ")))
+            return "".join(markup)
+
+        def make_row(hit):
+            row_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=2)
+            row_box.set_margin_top(6)
+            row_box.set_margin_bottom(6)
+            row_box.set_margin_start(12)
+            row_box.set_margin_end(12)
+            title = Gtk.Label(xalign=0)
+            title.set_markup(f"<b>{GLib.markup_escape_text(hit.title)}</b>")
+            snippet = Gtk.Label(xalign=0, wrap=True)
+            snippet.set_markup(snippet_markup(hit.snippet))
+            path = Gtk.Label(label=hit.path, xalign=0, ellipsize=Pango.EllipsizeMode.START)
+            path.add_css_class("dim-label")
+            path.add_css_class("caption")
+            for label in (title, snippet, path):
+                row_box.append(label)
+            row = Gtk.ListBoxRow(child=row_box)
+            row.hit = hit
+            return row
+
+        search_time = None
+
+        def show_status(progress_text=None):
+            if progress_text is not None:
+                status_label.set_text(progress_text)
+            elif entry.get_text().strip() and search_time is not None:
+                count = results.observe_children().get_n_items()
+                status_label.set_text(f"{count} result{'s' if count != 1 else ''} in {search_time:.1f} ms")
+            elif self.index_thread is not None:
+                status_label.set_text("Indexing…")
+            else:
+                status_label.set_text(f"{self.document_index.document_count()} documents indexed")
+
+        def run_search(*args):
+            nonlocal search_time
+            results.remove_all()
+            search_time = None
+            text = entry.get_text().strip()
+            if text:
+                start = time.perf_counter()
+                try:
+                    hits = self.document_index.search(text)
+                except sqlite3.Error as e:
+                    status_label.set_text(f"Search failed: {e}")
+                    return
+                search_time = (time.perf_counter() - start) * 1000
+                for hit in hits:
+                    results.append(make_row(hit))
+            show_status()
+
+        def refresh(progress_text):
+            # New documents may match once indexing finishes
+            if progress_text is None:
+                run_search()
+            else:
+                show_status(progress_text)
+
+        def open_row(row):
+            if row is None:
+                return
+            terms = document_index.query_terms(entry.get_text())
+            dialog.close()
+            self.open_search_hit(row.hit, terms)
+
+        entry.connect("search-changed", run_search)
+        entry.connect("activate", lambda e: open_row(results.get_selected_row() or results.get_row_at_index(0)))
+        entry.connect("stop-search", lambda e: dialog.close())
+        results.connect("row-activated", lambda listbox, row: open_row(row))
+
+        self.search_dialog_refresh = refresh
+        dialog.connect("closed", lambda d: setattr(self, 'search_dialog_refresh', None))
+        show_status()
+        dialog.set_child(content_box)
+        dialog.present(active_win)
+        entry.grab_focus()
+
+    def open_search_hit(self, hit, terms):
+        """Open a hit's document, or switch to the window that has it, and select the match"""
+        import json
+        script = f"revealText({json.dumps(terms)});"
+        for win in self.windows:
+            if win.current_file and win.current_file.get_path() == hit.path:
+                win.present()
+                self.execute_js(win, script)
+                return
+        win = self.create_window()
+        win.present()
+        self.load_file(win, hit.path, after_load=lambda: self.execute_js(win, script))
+        self.update_window_menu()
+
+    def on_show_telemetry(self, action, param):
+        """Show the --telemetry histograms, refreshed every second while open"""
+        if not self.windows:
+            return
+        active_win = next((win for win in self.windows if win.is_active()), self.windows[0])
+
+        dialog = Adw.Dialog.new()
+        dialog.set_title("Performance")
+        dialog.set_content_width(640)
+
+        grid = Gtk.Grid(column_spacing=18, row_spacing=6)
+        grid.set_margin_top(24)
+        grid.set_margin_bottom(24)
+        grid.set_margin_start(24)
+        grid.set_margin_end(24)
+        scrolled = Gtk.ScrolledWindow(child=grid, propagate_natural_height=True, max_content_height=480)
+
+        def cell(text, column, row, bold=False):
+            label = Gtk.Label(halign=Gtk.Align.START if column == 0 else Gtk.Align.END)
+            if bold:
+                label.set_markup(f"<b>{GLib.markup_escape_text(text)}</b>")
+            else:
+                label.set_text(text)
+            grid.attach(label, column, row, 1, 1)
+
+        def format_value(value, unit):
+            if value is None:
+                return "–"
+            if unit == 'ms':
+                return f"{value:.1f} ms"
+            return f"{value:,.0f} {unit}"
+
+        def refresh():
+            while (child := grid.get_first_child()) is not None:
+                grid.remove(child)
+            for column, title in enumerate(("Metric", "Count", "Median", "p90", "p99", "Max")):
+                cell(title, column, 0, bold=True)
+            for row, (name, histogram) in enumerate(sorted(telemetry.histograms.items()), start=1):
+                cell(name, 0, row)
+                cell(f"{histogram.count:,}", 1, row)
+                for column, value in enumerate((histogram.percentile(0.5), histogram.percentile(0.9),
+                                                histogram.percentile(0.99), histogram.max), start=2):
+                    cell(format_value(value, histogram.unit), column, row)
+            return True
+
+        refresh()
+        source_id = GLib.timeout_add_seconds(1, refresh)
+        dialog.connect("closed", lambda d: GLib.source_remove(source_id))
+        dialog.set_child(scrolled)
+        dialog.present(active_win)
+
     def on_preferences(self, action, param):
         """Show preferences dialog"""
         if not self.windows:
@@ -1834,6 +3452,70 @@ class HTMLEditorApp(Adw.Application):
         interval_box.append(spinner)
         content_box.append(interval_box)
         
+        # Durability of saves
+        fsync_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
+        fsync_box.set_margin_start(12)
+        fsync_box.set_margin_top(12)
+        
+        fsync_label = Gtk.Label(label="Save Durability:")
+        fsync_label.set_halign(Gtk.Align.START)
+        fsync_label.set_hexpand(True)
+        
+        fsync_policies = list(file_operations.SAVE_FSYNC_POLICIES)
+        fsync_dropdown = Gtk.DropDown.new_from_strings(list(file_operations.SAVE_FSYNC_POLICIES.values()))
+        fsync_dropdown.set_selected(fsync_policies.index(self.save_fsync_policy))
+        fsync_dropdown.set_valign(Gtk.Align.CENTER)
+        
+        fsync_box.append(fsync_label)
+        fsync_box.append(fsync_dropdown)
+        content_box.append(fsync_box)
+        
+        # Document search
+        search_section = Gtk.Label()
+        search_section.set_markup("<b>Document Search</b>")
+        search_section.set_halign(Gtk.Align.START)
+        search_section.set_margin_bottom(12)
+        search_section.set_margin_top(24)
+        content_box.append(search_section)
+        
+        index_folders_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
+        index_folders_box.set_margin_start(12)
+        
+        index_folders_label = Gtk.Label(label="Also Index Folders of Opened Documents:")
+        index_folders_label.set_halign(Gtk.Align.START)
+        index_folders_label.set_hexpand(True)
+        
+        index_folders_switch = Gtk.Switch()
+        index_folders_switch.set_active(self.index_opened_folders)
+        index_folders_switch.set_valign(Gtk.Align.CENTER)
+        
+        index_folders_box.append(index_folders_label)
+        index_folders_box.append(index_folders_switch)
+        content_box.append(index_folders_box)
+        
+        # Long tables
+        tables_section = Gtk.Label()
+        tables_section.set_markup("<b>Tables</b>")
+        tables_section.set_halign(Gtk.Align.START)
+        tables_section.set_margin_bottom(12)
+        tables_section.set_margin_top(24)
+        content_box.append(tables_section)
+        
+        virtualization_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
+        virtualization_box.set_margin_start(12)
+        
+        virtualization_label = Gtk.Label(label=f"Hide Off-screen Rows of Tables over {TABLE_VIRTUAL_ROWS} Rows:")
+        virtualization_label.set_halign(Gtk.Align.START)
+        virtualization_label.set_hexpand(True)
+        
+        virtualization_switch = Gtk.Switch()
+        virtualization_switch.set_active(self.table_virtualization)
+        virtualization_switch.set_valign(Gtk.Align.CENTER)
+        
+        virtualization_box.append(virtualization_label)
+        virtualization_box.append(virtualization_switch)
+        content_box.append(virtualization_box)
+        
         # Dialog buttons
         button_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
         button_box.set_halign(Gtk.Align.END)
@@ -1846,7 +3528,9 @@ class HTMLEditorApp(Adw.Application):
         ok_button = Gtk.Button(label="OK")
         ok_button.add_css_class("suggested-action")
         ok_button.connect("clicked", lambda btn: self.save_preferences(
-            dialog, active_win, auto_save_switch.get_active(), spinner.get_value_as_int()
+            dialog, active_win, auto_save_switch.get_active(), spinner.get_value_as_int(),
+            fsync_policies[fsync_dropdown.get_selected()], virtualization_switch.get_active(),
+            index_folders_switch.get_active()
         ))
         button_box.append(ok_button)
         
@@ -1856,9 +3540,19 @@ class HTMLEditorApp(Adw.Application):
         dialog.set_child(content_box)
         dialog.present(active_win)
 
-    def save_preferences(self, dialog, win, auto_save_enabled, auto_save_interval):
+    def save_preferences(self, dialog, win, auto_save_enabled, auto_save_interval, fsync_policy='file',
+                         table_virtualization=False, index_opened_folders=False):
         """Save preferences settings"""
         previous_auto_save = win.auto_save_enabled
+        self.save_fsync_policy = fsync_policy
+        self.index_opened_folders = index_opened_folders
+        if not index_opened_folders:
+            self.index_roots_pending = [(path, recursive) for path, recursive in self.index_roots_pending
+                                        if recursive]
+        if table_virtualization != self.table_virtualization:
+            self.table_virtualization = table_virtualization
+            for other_win in self.windows:
+                self.apply_table_preferences(other_win)
         
         win.auto_save_enabled = auto_save_enabled
         win.auto_save_interval = auto_save_interval
@@ -1897,44 +3591,110 @@ class HTMLEditorApp(Adw.Application):
             win.auto_save_source_id = None
 
     def auto_save(self, win):
-        """Perform auto-save if needed"""
+        """Journal the edits made since the last tick next to the document"""
         if win.modified and win.current_file:
-            win.statusbar.set_text("Auto-saving...")
+            path = win.current_file.get_path()
+            journal = win.autosave_journal
+            if journal is None or journal.document_path != path:
+                journal = win.autosave_journal = autosave_journal.AutosaveJournal(path)
+            
+            # Deltas only carry the changed blocks; a checkpoint is taken first and on compaction
+            script = "collectJournalCheckpoint();" if journal.needs_checkpoint() else "collectJournalDelta();"
             win.webview.evaluate_javascript(
-                "document.getElementById('editor').innerHTML;",
+                script,
                 -1, None, None, None,
-                lambda webview, result, file: self._on_get_html_content_auto_save(win, webview, result, win.current_file),
+                telemetry.timed('js: autosave', lambda webview, result, data: self._on_get_journal_content(win, webview, result, journal)),
                 None
             )
         return win.auto_save_enabled  # Continue timer if enabled
 
-    def _on_get_html_content_auto_save(self, win, webview, result, file):
-        """Handle auto-save content retrieval"""
+    def _on_get_journal_content(self, win, webview, result, journal):
+        """Append the collected checkpoint or delta to the autosave journal"""
         try:
             js_result = webview.evaluate_javascript_finish(result)
-            if js_result:
-                editor_content = (js_result.get_js_value().to_string() if hasattr(js_result, 'get_js_value') else
-                                js_result.to_string() if hasattr(js_result, 'to_string') else str(js_result))
-                
-                self.save_html_content(win, editor_content, file, 
-                                      lambda file, result: self._on_auto_save_completed(win, file, result))
+            js_value = js_result.get_js_value() if hasattr(js_result, 'get_js_value') else js_result
+            if js_value is None or js_value.is_null() or js_value.is_undefined():
+                return  # Nothing changed since the last tick
+            payload = js_value.to_string()
+            
+            import json
+            data = json.loads(payload)
+            if 'prefix' in data:
+                journal.append_delta(data['prefix'], data['suffix'], data['blocks'])
+            else:
+                journal.write_checkpoint(data['blocks'])
+            win.statusbar.set_text(f"Changes journaled at {GLib.DateTime.new_now_local().format('%H:%M:%S')}")
         except Exception as e:
-            print(f"Error getting HTML content for auto-save: {e}")
+            print(f"Error writing autosave journal: {e}")
             win.statusbar.set_text(f"Auto-save failed: {e}")
+            # The collected delta is lost, so the next tick must start from a checkpoint
+            journal.has_checkpoint = False
+
+    def discard_autosave_journal(self, win):
+        """Remove the window's journal once its changes are saved or thrown away"""
+        if win.autosave_journal is not None:
+            win.autosave_journal.discard()
+            win.autosave_journal = None
+
+    def check_autosave_recovery(self, win, filepath):
+        """Offer to restore unsaved changes journaled before a crash"""
+        if not autosave_journal.has_recoverable_journal(filepath):
+            return
+            
+        dialog = Adw.Dialog.new()
+        dialog.set_title("Recover Unsaved Changes")
+        dialog.set_content_width(400)
+        
+        content_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=20)
+        content_box.set_margin_top(24)
+        content_box.set_margin_bottom(24)
+        content_box.set_margin_start(24)
+        content_box.set_margin_end(24)
+        
+        document_name = os.path.splitext(os.path.basename(filepath))[0]
+        message_label = Gtk.Label()
+        message_label.set_markup(f"<b>\"{GLib.markup_escape_text(document_name)}\" has unsaved changes from a previous session.</b>")
+        message_label.set_wrap(True)
+        message_label.set_max_width_chars(40)
+        content_box.append(message_label)
+        
+        description_label = Gtk.Label(label="Recover them, or discard them and keep the saved document.")
+        description_label.set_wrap(True)
+        description_label.set_max_width_chars(40)
+        content_box.append(description_label)
+        
+        button_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+        button_box.set_halign(Gtk.Align.END)
+        button_box.set_margin_top(12)
+        
+        discard_button = Gtk.Button(label="Discard")
+        discard_button.add_css_class("destructive-action")
+        discard_button.connect("clicked", lambda btn: [dialog.close(), self._on_recovery_response(win, filepath, False)])
+        button_box.append(discard_button)
+        
+        recover_button = Gtk.Button(label="Recover")
+        recover_button.add_css_class("suggested-action")
+        recover_button.connect("clicked", lambda btn: [dialog.close(), self._on_recovery_response(win, filepath, True)])
+        button_box.append(recover_button)
+        
+        content_box.append(button_box)
+        dialog.set_child(content_box)
+        dialog.present(win)
 
-    def _on_auto_save_completed(self, win, file, result):
-        """Handle auto-save completion"""
-        try:
-            success, _ = file.replace_contents_finish(result)
-            if success:
-                win.modified = False  # Reset modified flag after save
-                self.update_window_title(win)
-                win.statusbar.set_text(f"Auto-saved at {GLib.DateTime.new_now_local().format('%H:%M:%S')}")
-            else:
-                win.statusbar.set_text("Auto-save failed")
-        except GLib.Error as error:
-            print(f"Error during auto-save: {error.message}")
-            win.statusbar.set_text(f"Auto-save failed: {error.message}")
+    def _on_recovery_response(self, win, filepath, recover):
+        """Replay the journal into the editor, or delete it"""
+        journal_path = autosave_journal.journal_path_for(filepath)
+        if recover:
+            html = autosave_journal.replay(journal_path)
+            if html is None:
+                win.statusbar.set_text("Could not recover changes: the journal is damaged")
+                return
+            import json
+            self.execute_js(win, f"setContent({json.dumps(html)}); scheduleStatusUpdate({{ changed: true }});")
+            win.statusbar.set_text("Recovered unsaved changes")
+        else:
+            autosave_journal.AutosaveJournal(filepath).discard()
+            win.statusbar.set_text("Discarded unsaved changes from the previous session")
 
     def show_error_dialog(self, message):
         """Show error message dialog"""
@@ -2039,8 +3799,16 @@ class HTMLEditorApp(Adw.Application):
 
         
 def main():
+    profiler.enable_from_argv(sys.argv)
+    telemetry.enable_from_argv(sys.argv)
     app = HTMLEditorApp()
-    return app.run(sys.argv)
+    status = app.run(sys.argv)
+    if telemetry.enabled:
+        try:
+            print(f"Telemetry written to {telemetry.dump()}", file=sys.stderr)
+        except OSError as e:
+            print(f"Could not write telemetry: {e}", file=sys.stderr)
+    return status
 
 if __name__ == "__main__":
     Adw.init()
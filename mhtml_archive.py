@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""MHTML web archives, read and written without holding the whole archive.
+
+MhtmlArchive walks the MIME parts of an archive in file order. Headers are
+read line by line and bodies are scanned in blocks for the next boundary,
+so a part is only decoded when it is wanted. Opening a document goes as far
+as its HTML part; the images it refers to are looked up, and the scan
+continues from where it stopped, when the editor first asks for them.
+
+write_mhtml() streams an archive to a binary file: the HTML part, then one
+image at a time, base64-encoded block by block.
+"""
+
+import base64
+import email.parser
+import email.policy
+import email.utils
+import hashlib
+import html as html_lib
+import mimetypes
+import os
+import quopri
+import re
+import threading
+import urllib.parse
+import uuid
+
+BLOCK_SIZE = 256 * 1024
+ENCODE_BLOCK_SIZE = 57 * 1024  # whole 76-character base64 lines
+
+_IMAGE_SRC_RE = re.compile(r'(<img\b[^>]*?\bsrc\s*=\s*)(["\'])(.*?)\2', re.IGNORECASE | re.DOTALL)
+_EXTENSION_RE = re.compile(r'\.[a-z0-9]+$')
+
+_header_parser = email.parser.BytesHeaderParser(policy=email.policy.compat32)
+
+
+class MhtmlPart:
+    """One MIME part: its headers and where its encoded body lies in the file"""
+
+    def __init__(self, headers, start, end):
+        self.content_type = headers.get_content_type()
+        self.charset = headers.get_content_charset()
+        self.encoding = (headers.get('Content-Transfer-Encoding') or '7bit').strip().lower()
+        self.location = (headers.get('Content-Location') or '').strip()
+        self.content_id = (headers.get('Content-ID') or '').strip().strip('<>')
+        self.start = start
+        self.end = end
+
+
+def decode_body(data, encoding):
+    if encoding == 'base64':
+        return base64.b64decode(data)
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(data)
+    return data
+
+
+def asset_name(url):
+    """Name under which the image at url is served to the editor.
+
+    It hashes the URL rather than the image, so it is known before the
+    image part has been found.
+    """
+    extension = os.path.splitext(urllib.parse.urlsplit(url).path)[1].lower()
+    if not _EXTENSION_RE.match(extension) or not (mimetypes.guess_type('image' + extension)[0] or '').startswith('image/'):
+        extension = ''
+    return hashlib.sha256(url.encode('utf-8')).hexdigest() + extension
+
+
+class _Scanner:
+    """Buffered reads from a binary file: single lines, or everything up to a MIME delimiter"""
+
+    def __init__(self, f, offset):
+        f.seek(offset)
+        self.f = f
+        self.buffer = b''
+        self.pos = 0
+        self.offset = offset  # file offset of buffer[0]
+
+    def tell(self):
+        return self.offset + self.pos
+
+    def _more(self):
+        data = self.f.read(BLOCK_SIZE)
+        if not data:
+            return False
+        # Drop what has been consumed before growing the buffer
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def readline(self):
+        while True:
+            end = self.buffer.find(b'\n', self.pos)
+            if end >= 0:
+                line = self.buffer[self.pos:end + 1]
+                self.pos = end + 1
+                return line
+            if not self._more():
+                line = self.buffer[self.pos:]
+                self.pos = len(self.buffer)
+                return line
+
+    def read_headers(self):
+        lines = []
+        while True:
+            line = self.readline()
+            if not line or line in (b'\r\n', b'\n'):
+                return _header_parser.parsebytes(b''.join(lines), headersonly=True)
+            lines.append(line)
+
+    def skip_to_delimiter(self, marker):
+        """Move past the next line that starts with marker; called at the start of a line.
+
+        Returns the file offset where the content before the delimiter ends
+        (the line break before it belongs to the delimiter) and whether it
+        closes the multipart body; (end of file, None) if there is none.
+        """
+        while len(self.buffer) - self.pos < len(marker) and self._more():
+            pass
+        if self.buffer.startswith(marker, self.pos):
+            end = self.tell()
+        else:
+            needle = b'\n' + marker
+            while True:
+                index = self.buffer.find(needle, self.pos)
+                if index >= 0:
+                    end = self.offset + index
+                    if index > self.pos and self.buffer[index - 1] == 0x0d:
+                        end -= 1
+                    self.pos = index + 1
+                    break
+                # Keep a needle split across blocks, and the \r before it
+                self.pos = max(self.pos, len(self.buffer) - len(needle))
+                if not self._more():
+                    self.pos = len(self.buffer)
+                    return self.tell(), None
+        line = self.readline()
+        return end, line[len(marker):].startswith(b'--')
+
+
+class MhtmlArchive:
+    """Reads the parts of one .mhtml/.mht file on demand.
+
+    The file stays open until close(), so the parts found so far remain
+    readable even after the file has been replaced on disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.parts = []           # found so far, in file order
+        self._by_location = {}    # Content-Location or cid: URL -> part
+        self._asset_urls = {}     # asset name -> URL, from link_images()
+        self._lock = threading.Lock()
+        self._file = open(path, 'rb')
+        try:
+            scanner = _Scanner(self._file, 0)
+            headers = scanner.read_headers()
+            self._resume = None   # file offset of the next unscanned part
+            self.start_id = (headers.get_param('start') or '').strip('<>')
+            if headers.get_content_maintype() != 'multipart':
+                # A single-part archive holds just the document
+                self._add(MhtmlPart(headers, scanner.tell(), os.fstat(self._file.fileno()).st_size))
+                return
+            boundary = headers.get_param('boundary')
+            if not boundary:
+                raise ValueError(f"{os.path.basename(path)} has no MIME boundary")
+            self._marker = b'--' + boundary.encode('ascii', 'replace')
+            _, closing = scanner.skip_to_delimiter(self._marker)  # past the preamble
+            if closing is False:
+                self._resume = scanner.tell()
+        except BaseException:
+            self._file.close()
+            raise
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _add(self, part):
+        self.parts.append(part)
+        if part.location:
+            self._by_location.setdefault(part.location, part)
+        if part.content_id:
+            self._by_location.setdefault('cid:' + part.content_id, part)
+
+    def _scan(self, wanted):
+        """Find more parts until wanted(part) is true; runs with the lock held"""
+        if self._resume is None:
+            return None
+        scanner = _Scanner(self._file, self._resume)
+        while True:
+            headers = scanner.read_headers()
+            start = scanner.tell()
+            end, closing = scanner.skip_to_delimiter(self._marker)
+            part = MhtmlPart(headers, start, end)
+            self._add(part)
+            self._resume = scanner.tell() if closing is False else None
+            if wanted(part):
+                return part
+            if self._resume is None:
+                return None
+
+    def _find(self, wanted):
+        with self._lock:
+            for part in self.parts:
+                if wanted(part):
+                    return part
+            return self._scan(wanted)
+
+    def read_part(self, part):
+        """Decoded body of a part"""
+        with self._lock:
+            self._file.seek(part.start)
+            data = self._file.read(part.end - part.start)
+        return decode_body(data, part.encoding)
+
+    def document_part(self):
+        """The part named by the archive's start parameter, or else its first HTML part"""
+        if self.start_id:
+            part = self._find(lambda part: part.content_id == self.start_id)
+            if part is not None:
+                return part
+        part = self._find(lambda part: part.content_type == 'text/html')
+        if part is None:
+            raise ValueError(f"{os.path.basename(self.path)} contains no HTML document")
+        return part
+
+    def read_html(self):
+        """The archived page as text"""
+        part = self.document_part()
+        return self.read_part(part).decode(part.charset or 'utf-8', errors='replace')
+
+    def resource(self, url):
+        """The part archived for url, or None"""
+        with self._lock:
+            part = self._by_location.get(url)
+            if part is None:
+                part = self._scan(lambda part: part.location == url or 'cid:' + part.content_id == url)
+            return part
+
+    def link_images(self, html, url_for):
+        """Point the images of html at url_for(asset name), for read_asset() to serve.
+
+        Image URLs are resolved against the document's Content-Location.
+        """
+        base = self.document_part().location
+
+        def replace(match):
+            src = html_lib.unescape(match.group(3).strip())
+            if not src or src.startswith('data:'):
+                return match.group(0)
+            url = urllib.parse.urljoin(base, src) if base and not src.startswith('cid:') else src
+            name = asset_name(url)
+            self._asset_urls[name] = url
+            return f"{match.group(1)}{match.group(2)}{url_for(name)}{match.group(2)}"
+
+        return _IMAGE_SRC_RE.sub(replace, html)
+
+    def read_asset(self, name):
+        """Bytes of an image linked by link_images()"""
+        part = self.resource(self._asset_urls[name])
+        if part is None:
+            raise KeyError(name)
+        return self.read_part(part)
+
+    def inline_images(self, html):
+        """html with the archived images it refers to as data URLs"""
+        data_urls = {}
+
+        def data_url(name):
+            part = self.resource(self._asset_urls[name])
+            if part is None:
+                return self._asset_urls[name]
+            if name not in data_urls:
+                data = base64.b64encode(self.read_part(part)).decode('ascii')
+                data_urls[name] = f"data:{part.content_type};base64,{data}"
+            return data_urls[name]
+
+        return self.link_images(html, data_url)
+
+
+def _write_header_block(f, headers):
+    f.write(''.join(f"{name}: {value}\r\n" for name, value in headers).encode('utf-8') + b'\r\n')
+
+
+def write_mhtml(f, html, images, location=None, progress=None):
+    """Write an MHTML archive to the binary file f.
+
+    html is the complete page, referring to its images as cid:<name>;
+    images yields (name, data) where data is bytes or a function returning
+    them, so each image is only loaded while it is written.
+    progress(percent) is called after every image.
+    """
+    images = list(images)
+    boundary = f"----=_AuthorPart_{uuid.uuid4().hex}"  # "=_" never occurs in either encoding
+    delimiter = f"--{boundary}\r\n".encode('ascii')
+    _write_header_block(f, [
+        ('From', '<Saved by Author>'),
+        ('Date', email.utils.formatdate(localtime=True)),
+        ('MIME-Version', '1.0'),
+        ('Content-Type', f'multipart/related; type="text/html"; boundary="{boundary}"'),
+    ])
+
+    f.write(delimiter)
+    headers = [('Content-Type', 'text/html; charset="utf-8"'), ('Content-Transfer-Encoding', 'quoted-printable')]
+    if location:
+        headers.append(('Content-Location', location))
+    _write_header_block(f, headers)
+    f.write(quopri.encodestring(html.encode('utf-8')).replace(b'\n', b'\r\n'))
+    f.write(b'\r\n')
+
+    for index, (name, data) in enumerate(images, start=1):
+        if callable(data):
+            data = data()
+        f.write(delimiter)
+        _write_header_block(f, [
+            ('Content-Type', mimetypes.guess_type(name)[0] or 'application/octet-stream'),
+            ('Content-Transfer-Encoding', 'base64'),
+            ('Content-ID', f"<{name}>"),
+        ])
+        view = memoryview(data)
+        for start in range(0, len(view), ENCODE_BLOCK_SIZE):
+            f.write(base64.encodebytes(view[start:start + ENCODE_BLOCK_SIZE]).replace(b'\n', b'\r\n'))
+        if progress:
+            progress(index * 100 // len(images))
+    f.write(f"--{boundary}--\r\n".encode('ascii'))
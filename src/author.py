@@ -1,27 +1,552 @@
 #!/usr/bin/env python3
 
+import time
 import os
-import gi
+import concurrent.futures
+import sys
+import importlib
 import json
 import base64
+import hashlib
+import html as html_lib
+import importlib.util
+import io
 import re
-import shutil
-import tempfile
+from contextlib import contextmanager
 from urllib.parse import urlparse
 from datetime import datetime
-import markdown
 
-gi.require_version('Gtk', '4.0')
-gi.require_version('Adw', '1')
-gi.require_version('WebKit', '6.0')
-gi.require_version('Pango', '1.0')
-gi.require_version('PangoCairo', '1.0')
-from gi.repository import Gtk, Adw, WebKit, Gio, GLib, Pango, PangoCairo, Gdk
+class StartupProfile:
+    """Timings for --profile-startup: imports, widget construction and WebView load"""
+    FLAG = "--profile-startup"
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.enabled = False
+        self.spans = []     # (category, name, seconds)
+        self.marks = {}     # milestone -> seconds since start
+
+    def record(self, category, name, seconds):
+        self.spans.append((category, name, seconds))
+
+    @contextmanager
+    def span(self, category, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(category, name, time.perf_counter() - start)
+
+    def mark(self, milestone):
+        if milestone in self.marks:
+            return
+        self.marks[milestone] = time.perf_counter() - self.start
+        if milestone == 'editable' and self.enabled:
+            self.report()
+
+    def report(self):
+        lines = ["Startup profile:"]
+        for milestone in ('window', 'editable'):
+            if milestone in self.marks:
+                lines.append(f"  time-to-{milestone:<9} {self.marks[milestone] * 1000:8.1f} ms")
+        for category in dict.fromkeys(category for category, _, _ in self.spans):
+            spans = [(name, seconds) for span_category, name, seconds in self.spans if span_category == category]
+            lines.append(f"  {category:<17} {sum(seconds for _, seconds in spans) * 1000:8.1f} ms")
+            lines.extend(f"    {name:<28} {seconds * 1000:8.1f} ms" for name, seconds in spans)
+        print("\n".join(lines), file=sys.stderr)
+
+startup_profile = StartupProfile()
+
+class LazyModule:
+    """Imports a module on first attribute access instead of at startup"""
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attr):
+        if self.__dict__['_module'] is None:
+            with startup_profile.span('deferred imports', self.__dict__['_name']):
+                self.__dict__['_module'] = importlib.import_module(self.__dict__['_name'])
+        return getattr(self.__dict__['_module'], attr)
+
+with startup_profile.span('imports', 'gi: Gtk, Adw, WebKit, Pango'):
+    import gi
+    gi.require_version('Gtk', '4.0')
+    gi.require_version('Adw', '1')
+    gi.require_version('WebKit', '6.0')
+    gi.require_version('Pango', '1.0')
+    gi.require_version('PangoCairo', '1.0')
+    from gi.repository import Gtk, Adw, WebKit, Gio, GLib, Pango, PangoCairo, Gdk
+
+# Only needed when a Markdown file is opened
+markdown = LazyModule('markdown')
+# Pillow reduces inserted images; without it they go into the document as they are
+pil_image = LazyModule('PIL.Image')
+pil_image_ops = LazyModule('PIL.ImageOps')
+
+_markdown_converter = None
+
+def markdown_to_html(text):
+    """Convert Markdown with one converter built on first use and reused afterwards"""
+    global _markdown_converter
+    if _markdown_converter is None:
+        _markdown_converter = markdown.Markdown(extensions=['extra', 'codehilite'])
+    return _markdown_converter.reset().convert(text)
+
+def font_cache_path():
+    return os.path.join(GLib.get_user_cache_dir(), "author", "fonts.json")
+
+def fontconfig_signature():
+    """Modification times of the fontconfig caches and user font folders.
+
+    fc-cache rewrites its cache directories whenever fonts are added or
+    removed, so a changed signature means the cached font list is stale.
+    """
+    directories = [
+        os.path.join(GLib.get_user_cache_dir(), "fontconfig"),
+        "/var/cache/fontconfig",
+        "/usr/lib/fontconfig/cache",
+        os.path.join(GLib.get_user_data_dir(), "fonts"),
+        os.path.expanduser("~/.fonts"),
+    ]
+    signature = []
+    for directory in directories:
+        try:
+            signature.append([directory, os.stat(directory).st_mtime_ns])
+        except OSError:
+            pass
+    return signature
+
+def cached_font_names():
+    """Font family names from the disk cache, or None if it is missing or stale"""
+    try:
+        with open(font_cache_path(), encoding="utf-8") as f:
+            cache = json.load(f)
+        if cache["signature"] == fontconfig_signature():
+            return cache["fonts"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+def list_font_names():
+    """Enumerate the installed font families and refresh the disk cache"""
+    with startup_profile.span('fonts', 'list_families'):
+        font_names = sorted(family.get_name() for family in PangoCairo.FontMap.get_default().list_families())
+    try:
+        path = font_cache_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"signature": fontconfig_signature(), "fonts": font_names}, f)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"Could not cache font list: {e}")
+    return font_names
+
+ASSET_SCHEME = "author-asset"
+ASSET_URL_PATTERN = re.compile(ASSET_SCHEME + r"://([0-9a-f]+)")
+DATA_IMAGE_PATTERN = re.compile(r'(["\'(])data:(image/[\w.+-]+);base64,([A-Za-z0-9+/=\s]+)(?=["\')])')
+
+class AssetStore:
+    """Images the document refers to through author-asset:// URLs.
+
+    Files are streamed from disk when the WebView asks for them, so image data
+    never passes through the DOM. Data URLs are only built when saving.
+    """
+    def __init__(self):
+        self.assets = {}
+        self.sources = {}   # rendition asset id -> id of the asset it was reduced from
+
+    def add_file(self, path):
+        path = os.path.realpath(path)
+        asset_id = hashlib.sha1(path.encode()).hexdigest()[:16]
+        content_type, _ = Gio.content_type_guess(path, None)
+        self.assets[asset_id] = (Gio.content_type_get_mime_type(content_type) or "application/octet-stream", path, None)
+        return f"{ASSET_SCHEME}://{asset_id}"
+
+    def add_bytes(self, data, mime_type):
+        asset_id = hashlib.sha1(data).hexdigest()[:16]
+        self.assets[asset_id] = (mime_type, None, GLib.Bytes.new(data))
+        return f"{ASSET_SCHEME}://{asset_id}"
+
+    def add_rendition(self, rendition, source_url):
+        """Store a rendition made from the asset at source_url; returns the URL to show"""
+        if rendition.data is None:
+            return source_url
+        url = self.add_bytes(rendition.data, rendition.mime_type)
+        self.sources[url[len(ASSET_SCHEME) + 3:]] = source_url[len(ASSET_SCHEME) + 3:]
+        return url
+
+    def source_url(self, url):
+        """URL of the asset renditions of url are made from, or None if url is not an asset"""
+        match = ASSET_URL_PATTERN.fullmatch(url or '')
+        if match is None or match.group(1) not in self.assets:
+            return None
+        return f"{ASSET_SCHEME}://{self.sources.get(match.group(1), match.group(1))}"
+
+    def source_data(self, url):
+        """The file path, or else the bytes, of the asset at url, for ingest_image()"""
+        mime_type, path, data = self.assets[url[len(ASSET_SCHEME) + 3:]]
+        return path if data is None else data.get_data()
+
+    def read_bytes(self, asset_id):
+        mime_type, path, data = self.assets[asset_id]
+        if data is None:
+            with open(path, 'rb') as f:
+                return mime_type, f.read()
+        return mime_type, data.get_data()
+
+    def on_request(self, request):
+        asset_id = request.get_uri()[len(ASSET_SCHEME) + 3:].strip('/')
+        try:
+            mime_type, path, data = self.assets[asset_id]
+            if data is None:
+                stream = Gio.File.new_for_path(path).read(None)
+                request.finish(stream, os.path.getsize(path), mime_type)
+            else:
+                request.finish(Gio.MemoryInputStream.new_from_bytes(data), data.get_size(), mime_type)
+        except (KeyError, OSError, GLib.Error) as e:
+            request.finish_error(GLib.Error.new_literal(Gio.io_error_quark(), f"Asset unavailable: {e}",
+                                                        Gio.IOErrorEnum.NOT_FOUND))
+
+    def externalize(self, html):
+        """Move base64 data URLs out of the markup into the store"""
+        def replace(match):
+            try:
+                data = base64.b64decode(match.group(3))
+            except ValueError:
+                return match.group(0)
+            return match.group(1) + self.add_bytes(data, match.group(2))
+        return DATA_IMAGE_PATTERN.sub(replace, html)
+
+    def inline(self, html):
+        """Replace asset URLs with data URLs so the saved file is self-contained"""
+        def replace(match):
+            if match.group(1) not in self.assets:
+                return match.group(0)
+            try:
+                mime_type, data = self.read_bytes(match.group(1))
+            except OSError as e:
+                print(f"Error reading image asset: {e}")
+                return match.group(0)
+            return f"data:{mime_type};base64,{base64.b64encode(data).decode()}"
+        return ASSET_URL_PATTERN.sub(replace, html)
+
+# Clipboard text from this size on is pasted in chunks rather than with one insertText
+LARGE_PASTE_CHARS = 256 * 1024
+PASTE_CHUNK_CHARS = 64 * 1024
+CONTROL_CHARS_PATTERN = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+SPACE_RUN_PATTERN = re.compile(r'^ | {2,}| $')
+
+# Prepares large pastes off the main loop; its thread starts with the first one
+paste_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="author-paste")
+
+def paste_chunks(text, preformatted):
+    """Clipboard text as HTML blocks, in chunks of about PASTE_CHUNK_CHARS.
+
+    Line endings are normalized and control characters other than tabs
+    dropped. Each line becomes a <div>, with its runs of spaces kept as
+    insertText would keep them; with preformatted, each chunk is a single
+    <pre>, which keeps the node count low for logs and code.
+    """
+    text = CONTROL_CHARS_PATTERN.sub('', text.replace('\r\n', '\n').replace('\r', '\n'))
+    if text.endswith('\n'):
+        text = text[:-1]
+    chunks = []
+    parts = []
+    size = 0
+    for line in text.split('\n'):
+        if preformatted:
+            part = html_lib.escape(line, quote=False) + '\n'
+        elif line:
+            line = SPACE_RUN_PATTERN.sub(lambda match: '\u00a0' * len(match.group()), line)
+            part = f"<div>{html_lib.escape(line, quote=False)}</div>"
+        else:
+            part = "<div><br></div>"
+        parts.append(part)
+        size += len(part)
+        if size >= PASTE_CHUNK_CHARS:
+            chunks.append(parts)
+            parts = []
+            size = 0
+    if parts:
+        chunks.append(parts)
+    if preformatted:
+        return [f"<pre>{''.join(parts)[:-1]}</pre>" for parts in chunks]
+    return [''.join(parts) for parts in chunks]
+
+# Narrowest an image can be made in the image bar, in CSS pixels
+IMAGE_MIN_WIDTH = 16
+# A resized image gets its new rendition once the width has stopped changing for this long
+IMAGE_RERENDER_DELAY_MS = 400
+THUMBNAIL_SIZE = 128
+JPEG_QUALITY = 85
+# Images with no more colors than this are stored losslessly, with a palette
+PALETTE_COLORS = 256
+# Formats every browser shows, so a source that already fits can be used as it is
+WEB_IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp')
+EXIF_ORIENTATION = 0x0112
+
+# Decodes and re-encodes images off the main loop, in the order they were asked for
+image_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="author-images")
+
+_pil_available = None
+
+def pil_available():
+    """Whether Pillow is installed, checked without importing it"""
+    global _pil_available
+    if _pil_available is None:
+        _pil_available = importlib.util.find_spec('PIL') is not None
+    return _pil_available
+
+class ImageRendition:
+    """An image sized for the page: encoded data, or None to show the source as it is"""
+    def __init__(self, data, mime_type, width, height, source_width, source_height):
+        self.data = data
+        self.mime_type = mime_type
+        self.width = width
+        self.height = height
+        self.source_width = source_width
+        self.source_height = source_height
+
+def open_image(source):
+    return pil_image.open(source if isinstance(source, str) else io.BytesIO(source))
+
+def thumbnail_path(source):
+    """Cache file for the thumbnail of a file (by path, size and mtime) or of image bytes"""
+    if isinstance(source, str):
+        stat = os.stat(source)
+        key = f"{os.path.realpath(source)}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+    else:
+        key = source
+    return os.path.join(GLib.get_user_cache_dir(), "author", "thumbnails", hashlib.sha1(key).hexdigest() + ".png")
+
+def save_thumbnail(image, path):
+    thumbnail = image.copy()
+    thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    if thumbnail.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+        thumbnail = thumbnail.convert('RGB')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + ".tmp"
+    thumbnail.save(temp_path, 'PNG')
+    os.replace(temp_path, path)
+
+def cached_thumbnail(source):
+    """Path of a small PNG of the image for the image bar, made on first use"""
+    path = thumbnail_path(source)
+    if not os.path.exists(path):
+        with open_image(source) as image:
+            image.draft(None, (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            save_thumbnail(pil_image_ops.exif_transpose(image), path)
+    return path
+
+def encode_image(image):
+    """image as (data, MIME type): PNG when it is transparent or has few colors, JPEG otherwise.
+
+    Grayscale images never have more than 256 levels, so for them the
+    smaller of the two encodings wins: PNG for scanned text, JPEG for photos.
+    """
+    if image.mode not in ('L', 'LA', 'RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.mode else 'RGB')
+    transparent = 'A' in image.mode
+    colors = None if image.mode == 'L' else image.getcolors(PALETTE_COLORS)
+    png = io.BytesIO()
+    if transparent or colors is not None:
+        # Screenshots, diagrams and anything transparent stay lossless
+        if colors is not None and not transparent:
+            image = image.convert('RGB').quantize(len(colors))
+        image.save(png, 'PNG', optimize=True)
+        return png.getvalue(), 'image/png'
+    jpeg = io.BytesIO()
+    image.save(jpeg, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    if image.mode == 'L':
+        image.save(png, 'PNG', optimize=True)
+        if png.tell() < jpeg.tell():
+            return png.getvalue(), 'image/png'
+    return jpeg.getvalue(), 'image/jpeg'
+
+def ingest_image(source, max_width):
+    """A rendition of an image no wider than max_width pixels, for the document.
+
+    source is a file path or the image's bytes. JPEGs are decoded at the
+    smallest scale that still covers max_width, the EXIF orientation is
+    applied and the result is re-encoded with encode_image(). A source that
+    already fits, is upright and is in a web format is kept as it is, as are
+    animations. The thumbnail for the image bar is cached on the way.
+    """
+    thumbnail = thumbnail_path(source)
+    with open_image(source) as image:
+        mime_type = image.get_format_mimetype() or "application/octet-stream"
+        orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+        rotated = orientation in (5, 6, 7, 8)
+        source_width, source_height = image.size[::-1] if rotated else image.size
+        if getattr(image, 'is_animated', False) or (
+                source_width <= max_width and orientation == 1 and mime_type in WEB_IMAGE_TYPES):
+            if not os.path.exists(thumbnail):
+                image.draft(None, (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+                save_thumbnail(image, thumbnail)
+            return ImageRendition(None, mime_type, source_width, source_height, source_width, source_height)
+
+        width = max(1, min(source_width, int(max_width)))
+        height = max(1, round(source_height * width / source_width))
+        image.draft(None, (height, width) if rotated else (width, height))
+        image = pil_image_ops.exif_transpose(image)
+        if image.mode in ('1', 'P'):
+            # Palette images only resize with nearest-neighbour sampling
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        if image.size != (width, height):
+            image = image.resize((width, height), pil_image.Resampling.LANCZOS, reducing_gap=3.0)
+        if not os.path.exists(thumbnail):
+            save_thumbnail(image, thumbnail)
+        data, mime_type = encode_image(image)
+    return ImageRendition(data, mime_type, width, height, source_width, source_height)
+
+def js_to_python(value):
+    """Convert a JavaScriptCore value into plain Python values"""
+    if value is None or value.is_undefined() or value.is_null():
+        return None
+    if value.is_boolean():
+        return value.to_boolean()
+    if value.is_number():
+        number = value.to_double()
+        return int(number) if number.is_integer() else number
+    if value.is_string():
+        return value.to_string()
+    if value.is_array():
+        length = value.object_get_property('length').to_int32()
+        return [js_to_python(value.object_get_property_at_index(i)) for i in range(length)]
+    if value.is_object():
+        return {name: js_to_python(value.object_get_property(name))
+                for name in value.object_enumerate_properties() or []}
+    return value.to_string()
+
+def python_to_variant(value):
+    """Wrap a plain Python value for the arguments of call_async_javascript_function.
+
+    Dicts become objects, lists and tuples arrays, and numbers doubles, as
+    they would be in the page. There is no variant for null, so None is
+    refused here, where the caller can see it.
+    """
+    if isinstance(value, bool):
+        return GLib.Variant('b', value)
+    if isinstance(value, (int, float)):
+        return GLib.Variant('d', value)
+    if isinstance(value, str):
+        return GLib.Variant('s', value)
+    if isinstance(value, dict):
+        return GLib.Variant('a{sv}', {str(key): python_to_variant(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return GLib.Variant('av', [python_to_variant(item) for item in value])
+    raise TypeError(f"cannot pass {type(value).__name__} to the page")
+
+class JsBridge:
+    """Calls between Python and the page over the single 'rpc' message handler.
+
+    call() returns a concurrent.futures.Future that is resolved on the main
+    loop. Calls made during one main loop iteration reach the page as one
+    batch in a single evaluation. Each carries a request ID, so an answer the
+    page gives later from a promise still finds its future. Values cross as
+    structured objects both ways, never as JSON strings to parse or as script
+    source: the batch is an argument of a function body that never changes.
+    Events the page sends with authorRpc.emit() go to the handlers in events.
+    """
+    HANDLER = 'rpc'
+    DISPATCH_BODY = "return window.authorRpc ? authorRpc.dispatch(calls) : null;"
+
+    def __init__(self, webview):
+        self.webview = webview
+        self.events = {}        # event name -> handler(data)
+        self.queue = []
+        self.pending = {}       # request id -> (future, method, time called)
+        self.next_id = 1
+        self.flush_id = 0
+        self.latency = {}       # method -> [calls, total seconds, slowest seconds]
+        manager = webview.get_user_content_manager()
+        manager.register_script_message_handler(self.HANDLER)
+        manager.connect(f'script-message-received::{self.HANDLER}', self.on_message)
+
+    def call(self, method, *params):
+        future = concurrent.futures.Future()
+        request_id = self.next_id
+        self.next_id += 1
+        self.queue.append((request_id, python_to_variant({'id': request_id, 'method': method, 'params': params})))
+        self.pending[request_id] = (future, method, time.perf_counter())
+        if not self.flush_id:
+            self.flush_id = GLib.idle_add(self.flush)
+        return future
+
+    def flush(self):
+        self.flush_id = 0
+        batch, self.queue = self.queue, []
+        if batch:
+            request_ids = [request_id for request_id, _ in batch]
+            arguments = GLib.Variant('a{sv}', {'calls': GLib.Variant('av', [call for _, call in batch])})
+            self.webview.call_async_javascript_function(
+                self.DISPATCH_BODY, -1, arguments, None, None, None, self.on_batch_done, request_ids)
+        return False
+
+    def on_batch_done(self, webview, result, request_ids):
+        try:
+            answers = js_to_python(webview.call_async_javascript_function_finish(result))
+        except GLib.Error as e:
+            answers = [{'id': request_id, 'error': e.message} for request_id in request_ids]
+        if answers is None:
+            answers = [{'id': request_id, 'error': "editor is not ready"} for request_id in request_ids]
+        for answer in answers:
+            # Promises answer later through the message handler
+            if not answer.get('pending'):
+                self.settle(answer['id'], answer.get('result'), answer.get('error'))
+
+    def settle(self, request_id, result=None, error=None):
+        entry = self.pending.pop(request_id, None)
+        if entry is None:
+            return
+        future, method, called = entry
+        elapsed = time.perf_counter() - called
+        stats = self.latency.setdefault(method, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(RuntimeError(f"{method}: {error}"))
+
+    def on_message(self, manager, js_result):
+        try:
+            js_value = js_result.get_js_value() if hasattr(js_result, 'get_js_value') else js_result
+            message = js_to_python(js_value)
+            if 'event' in message:
+                handler = self.events.get(message['event'])
+                if handler:
+                    handler(message['data'])
+            else:
+                self.settle(message['id'], message.get('result'), message.get('error'))
+        except Exception as e:
+            print(f"Error in page message: {e}")
+
+    def reset(self):
+        """Fail every outstanding call; the page they went to is being replaced"""
+        self.queue = []
+        for request_id in list(self.pending):
+            self.settle(request_id, error="document was reloaded")
+
+    def latency_report(self):
+        lines = ["Editor call round trips:"]
+        for method, (calls, total, slowest) in sorted(self.latency.items()):
+            lines.append(f"  {method:<22} {calls:6d} calls {total / calls * 1000:8.2f} ms avg "
+                         f"{slowest * 1000:8.2f} ms max")
+        return "\n".join(lines)
 
 class Author(Adw.Application):
     def __init__(self):
         super().__init__(application_id="io.github.fastrizwaan.author")
+        self.asset_store = AssetStore()
         self.connect("activate", self.on_activate)
+        self.connect("startup", self.on_startup)
+
+    def on_startup(self, app):
+        WebKit.WebContext.get_default().register_uri_scheme(ASSET_SCHEME, self.asset_store.on_request)
 
     def on_activate(self, app):
         win = EditorWindow(application=self)
@@ -31,6 +556,7 @@ class EditorWindow(Adw.ApplicationWindow):
     document_counter = 1
 
     def __init__(self, **kwargs):
+        build_start = time.perf_counter()
         super().__init__(**kwargs)
         self.set_title("Author")
         self.set_default_size(1000, 700)
@@ -50,6 +576,16 @@ class EditorWindow(Adw.ApplicationWindow):
 
         # Document state
         self.current_file = None
+        self.undo_memory_budget = 64 * 1024 * 1024  # bytes of undo history per window
+
+        # Chunks of a large paste still to be sent to the page, last first; None while no paste runs
+        self.paste_queue = None
+        self.paste_total = 0
+
+        # The image the image bar shows, as described by the page, and its pending re-rendition
+        self.selected_image = None
+        self.image_resize_timeout = 0
+        self.updating_image_bar = False
         self.is_new = True
         self.is_modified = False
         self.document_number = EditorWindow.document_counter
@@ -59,10 +595,11 @@ class EditorWindow(Adw.ApplicationWindow):
         scroll = Gtk.ScrolledWindow(vexpand=True)
         self.webview = WebKit.WebView(editable=True)
 
-        # Register content change handler
-        user_content = self.webview.get_user_content_manager()
-        user_content.register_script_message_handler('contentChanged')
-        user_content.connect('script-message-received::contentChanged', self.on_content_changed_js)
+        # Toolbar actions and page events all go through one bridge
+        self.rpc = JsBridge(self.webview)
+        self.rpc.events['contentChanged'] = self.on_content_changed_js
+        self.rpc.events['formatState'] = self.apply_formatting_changes
+        self.rpc.events['imageSelected'] = self.on_image_selected
 
         self.webview.connect('load-changed', self.on_webview_load)
 
@@ -182,11 +719,31 @@ class EditorWindow(Adw.ApplicationWindow):
         self.webview.add_controller(scroll_controller)
         scroll.set_child(self.webview)
 
+        self.find_bar_revealer = Gtk.Revealer()
+        self.find_bar_revealer.set_transition_type(Gtk.RevealerTransitionType.SLIDE_DOWN)
+        self.find_bar_revealer.set_child(self.create_find_bar())
+
+        paste_bar = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        paste_bar.add_css_class("toolbar-container")
+        self.paste_progress = Gtk.ProgressBar(show_text=True, text="Pasting…")
+        paste_bar.append(self.paste_progress)
+        self.paste_progress_revealer = Gtk.Revealer()
+        self.paste_progress_revealer.set_transition_type(Gtk.RevealerTransitionType.SLIDE_DOWN)
+        self.paste_progress_revealer.set_child(paste_bar)
+
+        self.image_bar_revealer = Gtk.Revealer()
+        self.image_bar_revealer.set_transition_type(Gtk.RevealerTransitionType.SLIDE_DOWN)
+        self.image_bar_revealer.set_child(self.create_image_bar())
+
         content_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
         content_box.append(toolbars_flowbox)
+        content_box.append(self.find_bar_revealer)
+        content_box.append(self.paste_progress_revealer)
+        content_box.append(self.image_bar_revealer)
         content_box.append(scroll)
         toolbar_view.set_content(content_box)
 
+        self.load_start = time.perf_counter()
         self.webview.load_html(self.initial_html, "file:///")
 
         # Populate toolbar buttons
@@ -216,7 +773,8 @@ class EditorWindow(Adw.ApplicationWindow):
 
         for icon, handler in [
             ("edit-find", self.on_find_clicked),
-            ("edit-find-replace", self.on_replace_clicked)
+            ("edit-find-replace", self.on_replace_clicked),
+            ("insert-image", self.on_insert_image_clicked)
         ]:
             btn = Gtk.Button(icon_name=icon)
             btn.add_css_class("flat")
@@ -245,9 +803,11 @@ class EditorWindow(Adw.ApplicationWindow):
         self.heading_dropdown.add_css_class("flat")
         text_style_group.append(self.heading_dropdown)
 
-        font_map = PangoCairo.FontMap.get_default()
-        families = font_map.list_families()
-        font_names = sorted([family.get_name() for family in families])
+        # Enumerating fonts is slow; use the cached list or fill it in once the window is up
+        font_names = cached_font_names()
+        if font_names is None:
+            font_names = ["Sans"]
+            GLib.idle_add(self.populate_font_list)
         font_store = Gtk.StringList()
         for name in font_names:
             font_store.append(name)
@@ -370,6 +930,88 @@ class EditorWindow(Adw.ApplicationWindow):
         self.is_modified = False
         self.update_title()
 
+        self.connect("map", lambda win: startup_profile.mark('window'))
+        startup_profile.record('widget construction', 'EditorWindow', time.perf_counter() - build_start)
+
+    def populate_font_list(self):
+        """Replace the placeholder font list with every installed family"""
+        font_names = list_font_names()
+        current = self.font_dropdown.get_selected_item()
+        current = current.get_string() if current else "Sans"
+        self.font_dropdown.handler_block_by_func(self.on_font_family_changed)
+        model = self.font_dropdown.get_model()
+        model.splice(0, model.get_n_items(), font_names)
+        self.font_dropdown.set_selected(font_names.index(current) if current in font_names else 0)
+        self.font_dropdown.handler_unblock_by_func(self.on_font_family_changed)
+        return False
+
+    def create_find_bar(self):
+        find_bar = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=4)
+        find_bar.add_css_class("toolbar-container")
+
+        find_row = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=4)
+        self.find_entry = Gtk.SearchEntry(placeholder_text="Find", hexpand=True)
+        self.find_entry.connect("search-changed", self.run_find)
+        self.find_entry.connect("activate", self.on_find_next)
+        self.find_entry.connect("stop-search", self.on_find_close_clicked)
+        find_key_controller = Gtk.EventControllerKey.new()
+        find_key_controller.connect("key-pressed", self.on_find_entry_key_pressed)
+        self.find_entry.add_controller(find_key_controller)
+        find_row.append(self.find_entry)
+
+        self.find_status_label = Gtk.Label(width_chars=12)
+        find_row.append(self.find_status_label)
+
+        for icon, tooltip, handler in [
+            ("go-up", "Previous Match", self.on_find_previous),
+            ("go-down", "Next Match", self.on_find_next),
+        ]:
+            btn = Gtk.Button(icon_name=icon, tooltip_text=tooltip)
+            btn.add_css_class("flat")
+            btn.connect("clicked", handler)
+            find_row.append(btn)
+
+        self.find_case_btn = Gtk.ToggleButton(label="Aa", tooltip_text="Match Case")
+        self.find_word_btn = Gtk.ToggleButton(label="W", tooltip_text="Whole Words")
+        self.find_regex_btn = Gtk.ToggleButton(label=".*", tooltip_text="Regular Expression")
+        for btn in (self.find_case_btn, self.find_word_btn, self.find_regex_btn):
+            btn.add_css_class("flat")
+            btn.connect("toggled", self.run_find)
+            find_row.append(btn)
+
+        close_btn = Gtk.Button(icon_name="window-close", tooltip_text="Close")
+        close_btn.add_css_class("flat")
+        close_btn.connect("clicked", self.on_find_close_clicked)
+        find_row.append(close_btn)
+        find_bar.append(find_row)
+
+        self.replace_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=4, visible=False)
+        self.replace_entry = Gtk.Entry(placeholder_text="Replace with", hexpand=True)
+        self.replace_entry.connect("activate", self.on_replace_all_clicked)
+        self.replace_box.append(self.replace_entry)
+        replace_all_btn = Gtk.Button(label="Replace All")
+        replace_all_btn.connect("clicked", self.on_replace_all_clicked)
+        self.replace_box.append(replace_all_btn)
+        find_bar.append(self.replace_box)
+        return find_bar
+
+    def create_image_bar(self):
+        image_bar = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+        image_bar.add_css_class("toolbar-container")
+        self.image_thumbnail = Gtk.Picture(can_shrink=True)
+        self.image_thumbnail.set_size_request(48, 48)
+        image_bar.append(self.image_thumbnail)
+        image_bar.append(Gtk.Label(label="Width"))
+        self.image_width_spin = Gtk.SpinButton.new_with_range(IMAGE_MIN_WIDTH, IMAGE_MIN_WIDTH, 1)
+        self.image_width_spin.connect("value-changed", self.on_image_width_changed)
+        image_bar.append(self.image_width_spin)
+        image_bar.append(Gtk.Label(label="px"))
+        self.image_keep_original_btn = Gtk.CheckButton(
+            label="Keep Original", tooltip_text="Save the full image with the document, not only the copy sized for the page")
+        self.image_keep_original_btn.connect("toggled", self.on_image_keep_original_toggled)
+        image_bar.append(self.image_keep_original_btn)
+        return image_bar
+
     def on_scroll(self, controller, dx, dy):
         state = controller.get_current_event_state()
         ctrl_pressed = (state & Gdk.ModifierType.CONTROL_MASK) != 0
@@ -381,26 +1023,11 @@ class EditorWindow(Adw.ApplicationWindow):
             return True
         return False
 
-    def on_content_changed_js(self, manager, js_result):
+    def on_content_changed_js(self, data):
         if getattr(self, 'ignore_changes', False):
             return
-        try:
-            if js_result and hasattr(js_result, 'get_js_value'):
-                js_value = js_result.get_js_value()
-                if js_value and js_value.is_string():
-                    value = js_value.to_string()
-                    if value == 'changed':
-                        self.is_modified = True
-                        self.update_title()
-                    elif value == 'selection':
-                        self.update_formatting_state()
-                else:
-                    self.is_modified = True
-                    self.update_title()
-        except Exception as e:
-            print(f"Error in on_content_changed_js: {e}")
-            self.is_modified = True
-            self.update_title()
+        self.is_modified = True
+        self.update_title()
 
     def adjust_zoom_level(self, delta):
         current = self.webview.get_zoom_level()
@@ -454,19 +1081,7 @@ class EditorWindow(Adw.ApplicationWindow):
                 self.on_print_clicked(None)
                 return True
             elif keyval == Gdk.KEY_x:
-                self.exec_js("""
-                    (function() {
-                        let sel = window.getSelection();
-                        if (sel.rangeCount) {
-                            let range = sel.getRangeAt(0);
-                            let span = document.createElement('span');
-                            span.style.backgroundColor = 'yellow';
-                            range.surroundContents(span);
-                            document.execCommand('cut');
-                            setTimeout(() => { if (span.parentNode) span.outerHTML = span.innerHTML; }, 1000);
-                        }
-                    })();
-                """)
+                self.on_cut_clicked(None)
                 return True
             elif keyval == Gdk.KEY_c:
                 self.on_copy_clicked(None)
@@ -510,6 +1125,9 @@ class EditorWindow(Adw.ApplicationWindow):
             elif keyval == Gdk.KEY_Z:
                 self.on_redo_clicked(None)
                 return True
+            elif keyval == Gdk.KEY_V:
+                self.on_paste_preformatted_clicked(None)
+                return True
             elif keyval == Gdk.KEY_X:
                 self.is_strikethrough = not self.is_strikethrough
                 self.apply_persistent_formatting('strikethrough', self.is_strikethrough)
@@ -574,7 +1192,7 @@ class EditorWindow(Adw.ApplicationWindow):
                 self.current_text_color = rgba
                 self.text_color_indicator.queue_draw()
                 color = rgba.to_string()
-                self.exec_js(f"document.execCommand('foreColor', false, '{color}')")
+                self.call_js('execCommand', 'foreColor', color)
                 self.update_formatting_state()
         except GLib.Error as e:
             print("Text color selection error:", e.message)
@@ -592,41 +1210,21 @@ class EditorWindow(Adw.ApplicationWindow):
                 self.current_bg_color = rgba
                 self.bg_color_indicator.queue_draw()
                 color = rgba.to_string()
-                self.exec_js(f"document.execCommand('backColor', false, '{color}')")
+                self.call_js('execCommand', 'backColor', color)
                 self.update_formatting_state()
         except GLib.Error as e:
             print("Background color selection error:", e.message)
 
     def on_dark_mode_toggled(self, btn):
-        if btn.get_active():
-            btn.set_icon_name("weather-clear-night")
-            script = """
-                (function() {
-                    let style = document.createElement('style');
-                    style.id = 'dynamic-theme-style';
-                    style.textContent = `
-                        @media screen {
-                            body { background-color: #242424 !important; color: #e0e0e0 !important; }
-                        }
-                    `;
-                    document.head.appendChild(style);
-                })();
-            """
-        else:
-            btn.set_icon_name("display-brightness")
-            script = """
-                (function() {
-                    let styleId = 'dynamic-theme-style';
-                    let existingStyle = document.getElementById(styleId);
-                    if (existingStyle) {
-                        existingStyle.remove();
-                    }
-                })();
-            """
-        self.exec_js(script)
+        btn.set_icon_name("weather-clear-night" if btn.get_active() else "display-brightness")
+        self.call_js('setDarkTheme', btn.get_active())
 
     def on_webview_load(self, webview, load_event):
-        if load_event == WebKit.LoadEvent.FINISHED:
+        if load_event == WebKit.LoadEvent.STARTED:
+            self.rpc.reset()
+            self.clear_selected_image()
+        elif load_event == WebKit.LoadEvent.FINISHED:
+            self.webview.evaluate_javascript(self.rpc_script(), -1, None, None, None, None, None)
             cursor_script = """
                 let p = document.querySelector('p');
                 if (p) {
@@ -654,61 +1252,41 @@ class EditorWindow(Adw.ApplicationWindow):
                     const notifyChange = debounce(function() {
                         let currentContent = document.body.innerHTML;
                         if (currentContent !== lastContent) {
-                            window.webkit.messageHandlers.contentChanged.postMessage('changed');
+                            authorRpc.emit('contentChanged');
                             lastContent = currentContent;
                         }
                     }, 250);
                     document.addEventListener('input', notifyChange);
                     document.addEventListener('paste', notifyChange);
                     document.addEventListener('cut', notifyChange);
-                    document.addEventListener('selectionchange', () => {
-                        window.webkit.messageHandlers.contentChanged.postMessage('selection');
-                    });
                 })();
             """
             self.webview.evaluate_javascript(change_detection_script, -1, None, None, None, None, None)
 
             if self.dark_mode_btn.get_active():
-                dark_mode_script = """
-                    (function() {
-                        let styleId = 'dynamic-theme-style';
-                        if (!document.getElementById(styleId)) {
-                            let style = document.createElement('style');
-                            style.id = styleId;
-                            style.textContent = `
-                                @media (prefers-color-scheme: dark) { 
-                                    body { background-color: #242424 !important; color: #e0e0e0 !important; } 
-                                }
-                                @media (prefers-color-scheme: light) { 
-                                    body { background-color: #ffffff !important; color: #000000 !important; } 
-                                }
-                            `;
-                            document.head.appendChild(style);
-                        }
-                    })();
-                """
-                self.exec_js(dark_mode_script)
-
-            selection_script = """
-                (function() {
-                    document.addEventListener('selectionchange', () => {
-                        window.webkit.messageHandlers.contentChanged.postMessage('selection');
-                    });
-                })();
-            """
-            self.webview.evaluate_javascript(selection_script, -1, None, None, None, None, None)
-
-    def exec_js(self, script, callback=None):
-        self.webview.evaluate_javascript(script, -1, None, None, None,
-                                        callback or self.on_js_executed, None)
-
-    def on_js_executed(self, webview, result, user_data):
-        try:
-            js_value = webview.evaluate_javascript_finish(result)
-            if js_value and js_value.is_string():
-                print(f"JS Result: {js_value.to_string()}")
-        except Exception as e:
-            print(f"JS Execution Error: {e}")
+                self.rpc.call('setDarkTheme', True)
+
+            self.webview.evaluate_javascript(self.formatting_state_script(), -1, None, None, None, None, None)
+            self.webview.evaluate_javascript(self.virtual_render_script(), -1, None, None, None, None, None)
+
+            if 'editable' not in startup_profile.marks:
+                startup_profile.record('webview load', 'initial document', time.perf_counter() - self.load_start)
+                startup_profile.mark('editable')
+            self.webview.evaluate_javascript(self.history_script(), -1, None, None, None, None, None)
+            self.rpc.call('history.setBudget', self.undo_memory_budget)
+            self.webview.evaluate_javascript(self.find_engine_script(), -1, None, None, None, None, None)
+            self.webview.evaluate_javascript(self.paste_script(), -1, None, None, None, None, None)
+            self.webview.evaluate_javascript(self.image_script(), -1, None, None, None, None, None)
+
+    def call_js(self, method, *params):
+        """Run an editing action in the page and give the document focus back"""
+        future = self.rpc.call(method, *params)
+        future.add_done_callback(self.on_js_executed)
+        return future
+
+    def on_js_executed(self, future):
+        if future.exception():
+            print(f"JS Execution Error: {future.exception()}")
         self.webview.grab_focus()
 
     def on_open_clicked(self, btn):
@@ -836,7 +1414,7 @@ class EditorWindow(Adw.ApplicationWindow):
         try:
             js_value = webview.evaluate_javascript_finish(result)
             if js_value:
-                html = js_value.to_string()
+                html = self.get_application().asset_store.inline(js_value.to_string())
                 file.replace_contents_bytes_async(
                     GLib.Bytes.new(html.encode()),
                     None,
@@ -889,346 +1467,1078 @@ class EditorWindow(Adw.ApplicationWindow):
         print_operation.run_dialog(self)
 
     def on_cut_clicked(self, btn):
-        self.exec_js("""
-            (function() {
-                let sel = window.getSelection();
-                if (sel.rangeCount) {
-                    let range = sel.getRangeAt(0);
-                    let span = document.createElement('span');
-                    span.style.backgroundColor = 'yellow';
-                    range.surroundContents(span);
-                    document.execCommand('cut');
-                    setTimeout(() => { if (span.parentNode) span.outerHTML = span.innerHTML; }, 1000);
-                }
-            })();
-        """)
+        self.call_js('cut')
 
     def on_copy_clicked(self, btn):
-        self.exec_js("document.execCommand('copy')")
+        self.call_js('execCommand', 'copy')
 
     def on_paste_clicked(self, btn):
         clipboard = Gdk.Display.get_default().get_clipboard()
-        clipboard.read_text_async(None, self.on_text_received, None)
+        clipboard.read_text_async(None, self.on_text_received, False)
+
+    def on_paste_preformatted_clicked(self, btn):
+        """Paste the clipboard as plain preformatted blocks, the fastest way in for logs and code"""
+        clipboard = Gdk.Display.get_default().get_clipboard()
+        clipboard.read_text_async(None, self.on_text_received, True)
 
-    def on_text_received(self, clipboard, result, user_data):
+    def on_text_received(self, clipboard, result, preformatted):
         try:
             text = clipboard.read_text_finish(result)
-            if text:
-                text_json = json.dumps(text)
-                self.exec_js(f"document.execCommand('insertText', false, {text_json})")
         except GLib.Error as e:
             print("Paste error:", e.message)
+            return
+        if not text:
+            return
+        if preformatted or len(text) >= LARGE_PASTE_CHARS:
+            self.paste_in_chunks(text, preformatted)
+        else:
+            self.call_js('execCommand', 'insertText', text)
 
-    def on_undo_clicked(self, btn):
-        self.exec_js("document.execCommand('undo')")
+    def paste_in_chunks(self, text, preformatted):
+        """Prepare the text on a worker, then send it to the page a chunk per idle frame"""
+        if self.paste_queue is not None:
+            return
+        self.paste_queue = []
+        self.paste_progress.set_fraction(0)
+        self.paste_progress_revealer.set_reveal_child(True)
+        future = paste_executor.submit(paste_chunks, text, preformatted)
+        future.add_done_callback(lambda future: GLib.idle_add(self.on_paste_prepared, future))
 
-    def on_redo_clicked(self, btn):
-        self.exec_js("document.execCommand('redo')")
+    def on_paste_prepared(self, future):
+        try:
+            chunks = future.result()
+        except Exception as e:
+            print(f"Paste error: {e}")
+            chunks = []
+        if not chunks:
+            self.on_paste_finished(None)
+            return False
+        self.paste_queue = chunks[::-1]
+        self.paste_total = len(chunks)
+        self.rpc.call('paste.begin').add_done_callback(self.on_paste_chunk_done)
+        return False
 
-    def on_find_clicked(self, btn):
-        dialog = Adw.MessageDialog(
-            transient_for=self,
-            heading="Find",
-            body="Enter search term",
-            close_response="cancel",
-            modal=True
-        )
-        entry = Gtk.Entry()
-        dialog.set_extra_child(entry)
-        dialog.add_response("cancel", "Cancel")
-        dialog.add_response("find", "Find")
-        dialog.set_response_appearance("find", Adw.ResponseAppearance.SUGGESTED)
-
-        def on_response(dialog, response):
-            if response == "find":
-                search_term = entry.get_text()
-                if search_term:
-                    script = f"""
-                        (function() {{
-                            console.log('Find script running with term: ' + {json.dumps(search_term)});
-                            const highlights = document.querySelectorAll('span.author-highlight');
-                            highlights.forEach(span => {{
-                                const parent = span.parentNode;
-                                while (span.firstChild) {{
-                                    parent.insertBefore(span.firstChild, span);
-                                }}
-                                parent.removeChild(span);
-                                parent.normalize();
-                            }});
-                            const walker = document.createTreeWalker(
-                                document.body,
-                                NodeFilter.SHOW_TEXT,
-                                {{ acceptNode: node => 
-                                    (node.parentNode.tagName !== 'SCRIPT' && 
-                                     node.parentNode.tagName !== 'STYLE' && 
-                                     node.nodeValue.trim()) 
-                                    ? NodeFilter.FILTER_ACCEPT 
-                                    : NodeFilter.FILTER_REJECT 
-                                }}
-                            );
-                            const textNodes = [];
-                            let node;
-                            while ((node = walker.nextNode())) {{
-                                textNodes.push(node);
-                            }}
-                            const regex = new RegExp({json.dumps(search_term)}, 'gi');
-                            textNodes.forEach(node => {{
-                                const text = node.nodeValue;
-                                const matches = [...text.matchAll(regex)];
-                                if (matches.length === 0) return;
-                                const fragment = document.createDocumentFragment();
-                                let lastIndex = 0;
-                                matches.forEach(match => {{
-                                    const start = match.index;
-                                    const matchText = match[0];
-                                    if (start > lastIndex) {{
-                                        fragment.appendChild(document.createTextNode(
-                                            text.slice(lastIndex, start)
-                                        ));
-                                    }}
-                                    const span = document.createElement('span');
-                                    span.className = 'author-highlight';
-                                    span.style.backgroundColor = 'yellow';
-                                    span.textContent = matchText;
-                                    fragment.appendChild(span);
-                                    lastIndex = start + matchText.length;
-                                }});
-                                if (lastIndex < text.length) {{
-                                    fragment.appendChild(document.createTextNode(
-                                        text.slice(lastIndex)
-                                    ));
-                                }}
-                                node.parentNode.replaceChild(fragment, node);
-                            }});
-                            console.log('Find script completed');
-                        }})();
-                    """
-                    print(f"Executing find script for term: '{search_term}'")
-                    self.exec_js(script)
-            dialog.destroy()
-
-        dialog.connect("response", on_response)
-        dialog.present()
+    def on_paste_chunk_done(self, future):
+        if future.exception():
+            print(f"Paste error: {future.exception()}")
+            self.paste_queue.clear()
+        if self.paste_queue:
+            self.paste_progress.set_fraction(1 - len(self.paste_queue) / self.paste_total)
+            self.rpc.call('paste.append', self.paste_queue.pop()).add_done_callback(self.on_paste_chunk_done)
+        else:
+            # Also after an error, so the page closes the paste and keeps what arrived
+            self.rpc.call('paste.finish').add_done_callback(self.on_paste_finished)
+
+    def on_paste_finished(self, future):
+        if future is not None and future.exception():
+            print(f"Paste error: {future.exception()}")
+        self.paste_queue = None
+        self.paste_progress_revealer.set_reveal_child(False)
+        self.webview.grab_focus()
 
-    def on_replace_clicked(self, btn):
-        dialog = Adw.MessageDialog(
-            transient_for=self,
-            heading="Replace",
-            body="Enter search and replacement terms",
-            close_response="cancel",
-            modal=True
-        )
-        search_entry = Gtk.Entry(placeholder_text="Search term")
-        replace_entry = Gtk.Entry(placeholder_text="Replace with")
-        content = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
-        content.append(search_entry)
-        content.append(replace_entry)
-        dialog.set_extra_child(content)
-        dialog.add_response("cancel", "Cancel")
-        dialog.add_response("replace", "Replace All")
-        dialog.set_response_appearance("replace", Adw.ResponseAppearance.SUGGESTED)
-
-        def on_response(dialog, response):
-            if response == "replace":
-                search = search_entry.get_text()
-                replacement = replace_entry.get_text()
-                if search and replacement:
-                    script = f"""
-                        (function() {{
-                            let search = {json.dumps(search)};
-                            let replace = {json.dumps(replacement)};
-                            let regex = new RegExp(search, 'gi');
-                            document.body.innerHTML = document.body.innerHTML.replace(regex, replace);
-                        }})();
-                    """
-                    self.exec_js(script)
-            dialog.destroy()
-
-        dialog.connect("response", on_response)
-        dialog.present()
+    def history_script(self):
+        return """
+            (function() {
+                if (window.authorHistory) return;
+
+                const SEAL_DELAY = 500;
+
+                // One undo history for typing, commands, pastes and replace-all, built from the
+                // mutations they cause, so each step reverts exactly the DOM it recorded
+                const history = {
+                    undoStack: [],
+                    redoStack: [],
+                    pending: [],
+                    pendingBytes: 0,
+                    totalBytes: 0,          // estimated bytes held by both stacks
+                    maxBytes: Infinity,     // set from the window's undo_memory_budget
+                    selectionBefore: null,
+                    lastKind: null,
+                    sealTimer: null,
+                    held: 0,
+                    holderEdit: false,
+                    replaying: false
+                };
+                window.authorHistory = history;
+
+                function captureSelection() {
+                    const sel = window.getSelection();
+                    if (!sel.rangeCount) return null;
+                    const range = sel.getRangeAt(0);
+                    if (!document.body.contains(range.startContainer)) return null;
+                    return { node: range.startContainer, offset: range.startOffset };
+                }
 
-    def on_zoom_changed(self, dropdown, *args):
-        selected_item = dropdown.get_selected_item()
-        if selected_item:
-            try:
-                zoom_level = int(selected_item.get_string().rstrip('%')) / 100.0
-                self.webview.set_zoom_level(zoom_level)
-            except ValueError:
-                pass
+                function restoreSelection(saved, fallback) {
+                    const range = document.createRange();
+                    if (saved && saved.node.isConnected) {
+                        const max = saved.node.nodeType === Node.TEXT_NODE ?
+                            saved.node.length : saved.node.childNodes.length;
+                        range.setStart(saved.node, Math.min(saved.offset, max));
+                    } else if (fallback && fallback.isConnected) {
+                        range.selectNodeContents(fallback);
+                        range.collapse(false);
+                    } else {
+                        return;
+                    }
+                    range.collapse(true);
+                    const sel = window.getSelection();
+                    sel.removeAllRanges();
+                    sel.addRange(range);
+                }
 
-    def on_bold_toggled(self, btn):
-        self.is_bold = btn.get_active()
-        self.apply_persistent_formatting('bold', self.is_bold)
-        self.webview.grab_focus()
-        self.update_formatting_state()
+                function nodeBytes(node) {
+                    if (node.nodeType === Node.ELEMENT_NODE) return node.outerHTML.length * 2;
+                    if (node.nodeValue !== null) return node.nodeValue.length * 2;
+                    return 0;
+                }
 
-    def on_italic_toggled(self, btn):
-        self.is_italic = btn.get_active()
-        self.apply_persistent_formatting('italic', self.is_italic)
-        self.webview.grab_focus()
-        self.update_formatting_state()
+                // Undo entries for mutation records, and the bytes they keep alive
+                function toEntries(mutations) {
+                    const entries = [];
+                    let bytes = 0;
+                    for (const m of mutations) {
+                        bytes += 64;
+                        if (m.type === 'characterData') {
+                            // newValue is filled in when the entry is reverted
+                            entries.push({ type: 'characterData', target: m.target,
+                                           oldValue: m.oldValue, newValue: null });
+                            bytes += ((m.oldValue || '').length + (m.target.nodeValue || '').length) * 2;
+                        } else if (m.type === 'attributes') {
+                            entries.push({ type: 'attributes', target: m.target, name: m.attributeName,
+                                           oldValue: m.oldValue, newValue: null });
+                            const current = m.target.getAttribute(m.attributeName);
+                            bytes += ((m.oldValue || '').length + (current || '').length) * 2;
+                        } else {
+                            const entry = { type: 'childList', target: m.target, nextSibling: m.nextSibling,
+                                            added: Array.from(m.addedNodes), removed: Array.from(m.removedNodes) };
+                            entry.added.forEach(node => bytes += nodeBytes(node));
+                            entry.removed.forEach(node => bytes += nodeBytes(node));
+                            entries.push(entry);
+                        }
+                    }
+                    return { entries: entries, bytes: bytes };
+                }
 
-    def on_underline_toggled(self, btn):
-        self.is_underline = btn.get_active()
-        self.apply_persistent_formatting('underline', self.is_underline)
-        self.webview.grab_focus()
-        self.update_formatting_state()
+                function record(mutations) {
+                    if (history.replaying || mutations.length === 0) return;
+                    // A new edit makes the redo history unreachable
+                    history.redoStack.forEach(step => history.totalBytes -= step.bytes);
+                    history.redoStack = [];
+                    const recorded = toEntries(mutations);
+                    recorded.entries.forEach(entry => history.pending.push(entry));
+                    history.pendingBytes += recorded.bytes;
+                    if (history.held === 0) {
+                        if (history.sealTimer) clearTimeout(history.sealTimer);
+                        history.sealTimer = setTimeout(history.seal, SEAL_DELAY);
+                    }
+                }
 
-    def on_strikethrough_toggled(self, btn):
-        self.is_strikethrough = btn.get_active()
-        self.apply_persistent_formatting('strikethrough', self.is_strikethrough)
-        self.webview.grab_focus()
-        self.update_formatting_state()
+                function enforceBudget() {
+                    // Always keep the newest step, even if it alone exceeds the budget
+                    while (history.totalBytes > history.maxBytes && history.undoStack.length > 1) {
+                        history.totalBytes -= history.undoStack.shift().bytes;
+                    }
+                }
 
-    def on_bullet_list_toggled(self, btn):
-        self.is_bullet_list = btn.get_active()
-        self.apply_list_formatting('unordered', self.is_bullet_list)
-        self.webview.grab_focus()
-        self.update_formatting_state()
+                const observer = new MutationObserver(record);
+                observer.observe(document.body, {
+                    childList: true, subtree: true, characterData: true, characterDataOldValue: true,
+                    attributes: true, attributeOldValue: true
+                });
+
+                // Close the open step and push it onto the undo stack
+                history.seal = function() {
+                    record(observer.takeRecords());
+                    if (history.sealTimer) {
+                        clearTimeout(history.sealTimer);
+                        history.sealTimer = null;
+                    }
+                    history.lastKind = null;
+                    if (history.held > 0 || history.pending.length === 0) return false;
+                    history.undoStack.push({
+                        records: history.pending,
+                        bytes: history.pendingBytes,
+                        selectionBefore: history.selectionBefore,
+                        selectionAfter: captureSelection()
+                    });
+                    history.totalBytes += history.pendingBytes;
+                    history.pending = [];
+                    history.pendingBytes = 0;
+                    history.selectionBefore = null;
+                    enforceBudget();
+                    return true;
+                };
 
-    def on_number_list_toggled(self, btn):
-        self.is_number_list = btn.get_active()
-        self.apply_list_formatting('ordered', self.is_number_list)
-        self.webview.grab_focus()
-        self.update_formatting_state()
+                history.setBudget = function(bytes) {
+                    history.maxBytes = bytes;
+                    enforceBudget();
+                };
+                authorRpc.register('history.setBudget', history.setBudget);
+
+                // Run a change the editor makes on its own, like swapping in an image rendition: it joins
+                // the step it belongs to instead of starting one, and leaves the redo history alone
+                history.quiet = function(change) {
+                    record(observer.takeRecords());
+                    try {
+                        return change();
+                    } finally {
+                        const recorded = toEntries(observer.takeRecords());
+                        const last = history.undoStack[history.undoStack.length - 1];
+                        if (history.pending.length > 0) {
+                            recorded.entries.forEach(entry => history.pending.push(entry));
+                            history.pendingBytes += recorded.bytes;
+                        } else if (last) {
+                            recorded.entries.forEach(entry => last.records.push(entry));
+                            last.bytes += recorded.bytes;
+                            history.totalBytes += recorded.bytes;
+                        }
+                    }
+                };
 
-    def on_heading_changed(self, dropdown, *args):
-        headings = ["div", "h1", "h2", "h3", "h4", "h5", "h6"]
-        selected = dropdown.get_selected()
-        if 0 <= selected < len(headings):
-            self.exec_js(f"document.execCommand('formatBlock', false, '{headings[selected]}')")
-            self.update_formatting_state()
+                // Keep everything until the matching release in one step, e.g. a chunked paste
+                history.hold = function() {
+                    history.seal();
+                    if (history.held === 0) history.selectionBefore = captureSelection();
+                    history.held++;
+                };
 
-    def on_align_left(self, btn):
-        if btn.get_active():
-            self.is_align_left = True
-            self.is_align_center = self.is_align_right = self.is_align_justify = False
-            self.align_center_btn.set_active(False)
-            self.align_right_btn.set_active(False)
-            self.align_justify_btn.set_active(False)
-            self.exec_js("document.execCommand('justifyLeft')")
-            self.webview.grab_focus()
-            self.update_formatting_state()
+                history.release = function() {
+                    if (history.held === 0) return;
+                    history.held--;
+                    if (history.held === 0) history.seal();
+                };
 
-    def on_align_center(self, btn):
-        if btn.get_active():
-            self.is_align_center = True
-            self.is_align_left = self.is_align_right = self.is_align_justify = False
-            self.align_left_btn.set_active(False)
-            self.align_right_btn.set_active(False)
-            self.align_justify_btn.set_active(False)
-            self.exec_js("document.execCommand('justifyCenter')")
-            self.webview.grab_focus()
-            self.update_formatting_state()
+                // Run one of the holder's own editing commands while user input is held back
+                history.runHeld = function(edit) {
+                    history.holderEdit = true;
+                    try {
+                        return edit();
+                    } finally {
+                        history.holderEdit = false;
+                    }
+                };
 
-    def on_align_right(self, btn):
-        if btn.get_active():
-            self.is_align_right = True
-            self.is_align_left = self.is_align_center = self.is_align_justify = False
-            self.align_left_btn.set_active(False)
-            self.align_center_btn.set_active(False)
-            self.align_justify_btn.set_active(False)
-            self.exec_js("document.execCommand('justifyRight')")
-            self.webview.grab_focus()
-            self.update_formatting_state()
+                function revert(entry) {
+                    const target = entry.target;
+                    if (entry.type === 'characterData') {
+                        entry.newValue = target.nodeValue;
+                        target.nodeValue = entry.oldValue;
+                    } else if (entry.type === 'attributes') {
+                        entry.newValue = target.getAttribute(entry.name);
+                        if (entry.oldValue === null) target.removeAttribute(entry.name);
+                        else target.setAttribute(entry.name, entry.oldValue);
+                    } else {
+                        entry.added.forEach(node => { if (node.parentNode === target) target.removeChild(node); });
+                        const ref = entry.nextSibling && entry.nextSibling.parentNode === target ?
+                            entry.nextSibling : null;
+                        entry.removed.forEach(node => target.insertBefore(node, ref));
+                    }
+                }
 
-    def on_align_justify(self, btn):
-        if btn.get_active():
-            self.is_align_justify = True
-            self.is_align_left = self.is_align_center = self.is_align_right = False
-            self.align_left_btn.set_active(False)
-            self.align_center_btn.set_active(False)
-            self.align_right_btn.set_active(False)
-            self.exec_js("document.execCommand('justifyFull')")
-            self.webview.grab_focus()
-            self.update_formatting_state()
+                function replay(entry) {
+                    const target = entry.target;
+                    if (entry.type === 'characterData') {
+                        target.nodeValue = entry.newValue;
+                    } else if (entry.type === 'attributes') {
+                        if (entry.newValue === null) target.removeAttribute(entry.name);
+                        else target.setAttribute(entry.name, entry.newValue);
+                    } else {
+                        entry.removed.forEach(node => { if (node.parentNode === target) target.removeChild(node); });
+                        const ref = entry.nextSibling && entry.nextSibling.parentNode === target ?
+                            entry.nextSibling : null;
+                        entry.added.forEach(node => target.insertBefore(node, ref));
+                    }
+                }
 
-    def on_indent_more(self, *args):
-        self.exec_js("document.execCommand('indent')")
-        self.update_formatting_state()
+                function apply(step, undoing) {
+                    history.replaying = true;
+                    try {
+                        if (undoing) {
+                            for (let i = step.records.length - 1; i >= 0; i--) revert(step.records[i]);
+                        } else {
+                            step.records.forEach(replay);
+                        }
+                    } finally {
+                        // Drop the mutations we just caused before they reach record
+                        observer.takeRecords();
+                        history.replaying = false;
+                    }
+                    const fallback = step.records[undoing ? 0 : step.records.length - 1].target;
+                    restoreSelection(undoing ? step.selectionBefore : step.selectionAfter, fallback);
+                    authorRpc.emit('contentChanged');
+                }
 
-    def on_indent_less(self, *args):
-        self.exec_js("document.execCommand('outdent')")
-        self.update_formatting_state()
+                // Nothing is undone while a paste or replace-all is still going in
+                history.undo = function() {
+                    if (history.held > 0) return false;
+                    history.seal();
+                    const step = history.undoStack.pop();
+                    if (!step) return false;
+                    apply(step, true);
+                    history.redoStack.push(step);
+                    return true;
+                };
 
-    def on_font_family_changed(self, dropdown, *args):
-        if item := dropdown.get_selected_item():
-            font_family = item.get_string()
-            script = """
-                (function() {
-                    let selection = window.getSelection();
-                    if (!selection.rangeCount) return;
-                    let range = selection.getRangeAt(0);
-                    let ancestor = range.commonAncestorContainer;
-                    let spans = (ancestor.nodeType === 1) 
-                        ? ancestor.querySelectorAll('span[style*="font-family"]') 
-                        : ancestor.parentElement.querySelectorAll('span[style*="font-family"]');
-                    if (spans.length > 0 && range.toString().length > 0) {
-                        let updated = false;
-                        spans.forEach(span => {
-                            if (range.intersectsNode(span)) {
-                                span.style.fontFamily = '""" + font_family + """';
-                                updated = true;
-                            }
-                        });
-                        if (updated) {
-                            let newRange = document.createRange();
-                            newRange.setStart(range.startContainer, range.startOffset);
-                            newRange.setEnd(range.endContainer, range.endOffset);
-                            selection.removeAllRanges();
-                            selection.addRange(newRange);
-                            return;
-                        }
+                history.redo = function() {
+                    if (history.held > 0) return false;
+                    history.seal();
+                    const step = history.redoStack.pop();
+                    if (!step) return false;
+                    apply(step, false);
+                    history.undoStack.push(step);
+                    return true;
+                };
+
+                // The browser's own history never sees our steps, so it is never replayed; typing is
+                // grouped into one step until the kind of edit changes, and held back during a transaction
+                document.addEventListener('beforeinput', function(event) {
+                    if (event.inputType === 'historyUndo' || event.inputType === 'historyRedo') {
+                        event.preventDefault();
+                        event.inputType === 'historyUndo' ? history.undo() : history.redo();
+                        return;
                     }
-                    let contents = range.extractContents();
-                    if (!contents.hasChildNodes()) {
-                        range.insertNode(contents);
+                    if (history.held > 0) {
+                        if (!history.holderEdit) event.preventDefault();
                         return;
                     }
-                    let span = document.createElement('span');
-                    span.style.fontFamily = '""" + font_family + """';
-                    span.appendChild(contents);
-                    range.insertNode(span);
-                    let newRange = document.createRange();
-                    newRange.selectNodeContents(span);
-                    selection.removeAllRanges();
-                    selection.addRange(newRange);
-                })();
-            """
-            self.exec_js(script)
-            self.update_formatting_state()
+                    const kind = event.inputType.startsWith('insertText') ? 'insertText' :
+                                 event.inputType.startsWith('delete') ? 'delete' : event.inputType;
+                    if (history.lastKind !== null && (kind !== history.lastKind ||
+                                                      (kind !== 'insertText' && kind !== 'delete'))) {
+                        history.seal();
+                    }
+                    if (history.pending.length === 0 && history.selectionBefore === null) {
+                        history.selectionBefore = captureSelection();
+                    }
+                    history.lastKind = kind;
+                }, true);
+            })();
+        """
 
-    def on_font_size_changed(self, dropdown, *args):
-        if item := dropdown.get_selected_item():
-            size_pt = item.get_string()
-            script = """
-                (function() {
-                    let selection = window.getSelection();
-                    if (!selection.rangeCount) return;
-                    let range = selection.getRangeAt(0);
-                    let content = range.extractContents();
-                    let span = document.createElement('span');
-                    span.style.fontSize = '""" + size_pt + """pt';
-                    let tempElement = document.createElement('div');
-                    tempElement.appendChild(content);
-                    let fontSizeSpans = tempElement.querySelectorAll('span[style*="font-size"]');
-                    for (let oldSpan of fontSizeSpans) {
-                        while (oldSpan.firstChild) {
-                            oldSpan.parentNode.insertBefore(oldSpan.firstChild, oldSpan);
+    def paste_script(self):
+        return """
+            (function() {
+                if (window.authorPaste) return;
+
+                // Blocks a paste may split; anywhere else the pasted blocks go in at the caret
+                const SPLIT_SELECTOR = 'address, blockquote, div, h1, h2, h3, h4, h5, h6, p, pre';
+
+                // A chunked paste: where it goes and the nodes it added; authorHistory keeps it
+                // open as one undo step until it finishes
+                const paste = { active: null };
+                window.authorPaste = paste;
+
+                function isEmpty(range) {
+                    return range.toString().replace(/\\u200B/g, '') === '' &&
+                        !range.cloneContents().querySelector('img, hr, table, video');
+                }
+
+                function caretAfter(node) {
+                    if (!node || !node.isConnected) return;
+                    const range = document.createRange();
+                    range.selectNodeContents(node);
+                    range.collapse(false);
+                    const sel = window.getSelection();
+                    sel.removeAllRanges();
+                    sel.addRange(range);
+                    if (node.scrollIntoView) node.scrollIntoView({ block: 'nearest' });
+                }
+
+                function insertAdded(step, nodes) {
+                    const before = step.before && step.before.parentNode === step.parent ? step.before : null;
+                    step.parent.insertBefore(nodes, before);
+                }
+
+                // The caret's block is split in two around the paste, unless the caret is at either end
+                function findInsertionPoint(range, step) {
+                    const container = range.startContainer;
+                    const element = container.nodeType === Node.ELEMENT_NODE ? container : container.parentElement;
+                    let block = element ? element.closest(SPLIT_SELECTOR) : null;
+                    if (block && (block === document.body || block.hasAttribute('contenteditable'))) block = null;
+
+                    if (!block) {
+                        step.parent = container.nodeType === Node.TEXT_NODE ? container.parentNode : container;
+                        if (container.nodeType !== Node.TEXT_NODE) {
+                            step.before = container.childNodes[range.startOffset] || null;
+                        } else if (range.startOffset === 0) {
+                            step.before = container;
+                        } else if (range.startOffset >= container.length) {
+                            step.before = container.nextSibling;
+                        } else {
+                            step.before = container.splitText(range.startOffset);
                         }
-                        oldSpan.parentNode.removeChild(oldSpan);
+                        return;
                     }
-                    while (tempElement.firstChild) {
-                        span.appendChild(tempElement.firstChild);
+
+                    step.parent = block.parentNode;
+                    const head = document.createRange();
+                    head.setStart(block, 0);
+                    head.setEnd(range.startContainer, range.startOffset);
+                    const tail = document.createRange();
+                    tail.setStart(range.startContainer, range.startOffset);
+                    tail.setEnd(block, block.childNodes.length);
+                    if (isEmpty(head)) {
+                        step.before = block;
+                    } else if (isEmpty(tail)) {
+                        step.before = block.nextSibling;
+                    } else {
+                        const tailBlock = block.cloneNode(false);
+                        tailBlock.removeAttribute('id');
+                        tailBlock.appendChild(tail.extractContents());
+                        block.after(tailBlock);
+                        step.before = tailBlock;
                     }
-                    range.insertNode(span);
-                    selection.removeAllRanges();
-                    let newRange = document.createRange();
-                    newRange.selectNodeContents(span);
-                    selection.addRange(newRange);
-                })();
-            """
-            self.exec_js(script)
+                }
+
+                paste.begin = function() {
+                    if (paste.active) return false;
+                    // Typing is held back until finish, so the paste cannot be interleaved with edits
+                    authorHistory.hold();
+                    const step = { parent: null, before: null, added: [] };
+                    const sel = window.getSelection();
+                    if (sel.rangeCount && !sel.isCollapsed) {
+                        authorHistory.runHeld(() => document.execCommand('delete'));
+                    }
+                    if (sel.rangeCount) {
+                        findInsertionPoint(sel.getRangeAt(0), step);
+                    } else {
+                        step.parent = document.querySelector('[contenteditable]') || document.body;
+                    }
+                    paste.active = step;
+                    return true;
+                };
+
+                // Answers once the page has had an idle moment to lay out and paint the chunk
+                paste.append = async function(html) {
+                    const step = paste.active;
+                    if (!step) return false;
+                    const template = document.createElement('template');
+                    template.innerHTML = html;
+                    for (let node = template.content.firstChild; node; node = node.nextSibling) step.added.push(node);
+                    insertAdded(step, template.content);
+                    await new Promise(resolve => window.requestIdleCallback ?
+                        requestIdleCallback(resolve, { timeout: 50 }) : setTimeout(resolve, 0));
+                    return true;
+                };
+
+                paste.finish = function() {
+                    const step = paste.active;
+                    if (!step) return 0;
+                    paste.active = null;
+                    caretAfter(step.added[step.added.length - 1]);
+                    authorHistory.release();
+                    if (step.added.length > 0) authorRpc.emit('contentChanged');
+                    return step.added.length;
+                };
+
+                authorRpc.register('paste.begin', paste.begin);
+                authorRpc.register('paste.append', paste.append);
+                authorRpc.register('paste.finish', paste.finish);
+            })();
+        """
+
+    def on_undo_clicked(self, btn):
+        self.call_js('undo')
+
+    def on_redo_clicked(self, btn):
+        self.call_js('redo')
+
+    def find_engine_script(self):
+        return """
+            (function() {
+                if (window.authorFind) return;
+
+                const BLOCK_TAGS = new Set(['ADDRESS', 'ARTICLE', 'ASIDE', 'BLOCKQUOTE', 'BODY', 'DD', 'DIV',
+                    'DL', 'DT', 'FIGCAPTION', 'FIGURE', 'FOOTER', 'H1', 'H2', 'H3', 'H4', 'H5', 'H6', 'HEADER',
+                    'HR', 'LI', 'OL', 'P', 'PRE', 'SECTION', 'TABLE', 'TBODY', 'TD', 'TFOOT', 'TH', 'THEAD',
+                    'TR', 'UL']);
+                const SKIP_TAGS = new Set(['SCRIPT', 'STYLE', 'NOSCRIPT', 'TEMPLATE']);
+                const MAX_HIGHLIGHTS = 5000;
+
+                // Flat text index: one entry per block with its text nodes and their start offsets
+                const find = {
+                    entries: null,
+                    entryOf: new Map(),     // block element -> entry
+                    dirtyEntries: new Set(),
+                    dirtyContainers: new Set(),
+                    matches: [],
+                    current: -1,
+                    query: null,
+                    options: null,
+                    stale: false
+                };
+                window.authorFind = find;
+
+                const isBlock = el => BLOCK_TAGS.has(el.tagName);
+
+                function closestBlock(node) {
+                    let el = node.nodeType === Node.ELEMENT_NODE ? node : node.parentElement;
+                    while (el && !isBlock(el)) el = el.parentElement;
+                    return el || document.body;
+                }
+
+                function isSkipped(node) {
+                    for (let el = node.parentElement; el; el = el.parentElement) {
+                        if (SKIP_TAGS.has(el.tagName)) return true;
+                    }
+                    return false;
+                }
+
+                function makeEntry(block, nodes) {
+                    const starts = [];
+                    let text = '';
+                    for (const node of nodes) {
+                        starts.push(text.length);
+                        text += node.nodeValue;
+                    }
+                    return { block: block, nodes: nodes, starts: starts, text: text };
+                }
+
+                // Text nodes of a block, not descending into nested blocks
+                function blockTextNodes(block) {
+                    const nodes = [];
+                    const walker = document.createTreeWalker(block, NodeFilter.SHOW_ELEMENT | NodeFilter.SHOW_TEXT, {
+                        acceptNode: node => {
+                            if (node.nodeType === Node.TEXT_NODE) return NodeFilter.FILTER_ACCEPT;
+                            if (SKIP_TAGS.has(node.tagName) || isBlock(node)) return NodeFilter.FILTER_REJECT;
+                            return NodeFilter.FILTER_SKIP;
+                        }
+                    });
+                    let node;
+                    while ((node = walker.nextNode())) nodes.push(node);
+                    return nodes;
+                }
+
+                // Entries for every block inside root, in document order
+                function collectEntries(root) {
+                    const groups = new Map();
+                    const walker = document.createTreeWalker(root, NodeFilter.SHOW_ELEMENT | NodeFilter.SHOW_TEXT, {
+                        acceptNode: node => {
+                            if (node.nodeType === Node.TEXT_NODE) return NodeFilter.FILTER_ACCEPT;
+                            return SKIP_TAGS.has(node.tagName) ? NodeFilter.FILTER_REJECT : NodeFilter.FILTER_SKIP;
+                        }
+                    });
+                    if (root.nodeType === Node.ELEMENT_NODE && isSkipped(root)) return [];
+                    let node;
+                    while ((node = walker.nextNode())) {
+                        const block = closestBlock(node);
+                        if (!groups.has(block)) groups.set(block, []);
+                        groups.get(block).push(node);
+                    }
+                    const entries = [];
+                    groups.forEach((nodes, block) => entries.push(makeEntry(block, nodes)));
+                    return entries;
+                }
+
+                function entryPrecedes(a, b) {
+                    return !!(a.nodes[0].compareDocumentPosition(b.nodes[0]) & Node.DOCUMENT_POSITION_FOLLOWING);
+                }
+
+                function insertEntry(entry) {
+                    let lo = 0;
+                    let hi = find.entries.length;
+                    while (lo < hi) {
+                        const mid = (lo + hi) >> 1;
+                        if (entryPrecedes(find.entries[mid], entry)) lo = mid + 1;
+                        else hi = mid;
+                    }
+                    find.entries.splice(lo, 0, entry);
+                    find.entryOf.set(entry.block, entry);
+                }
+
+                function markNode(node) {
+                    const block = closestBlock(node);
+                    if (find.entryOf.has(block)) find.dirtyEntries.add(find.entryOf.get(block));
+                    else find.dirtyContainers.add(block);
+                }
+
+                function trackMutations(mutations) {
+                    if (find.entries === null) return;
+                    for (const m of mutations) {
+                        if (m.type === 'characterData') {
+                            markNode(m.target);
+                            continue;
+                        }
+                        m.addedNodes.forEach(node => {
+                            if (node.nodeType === Node.ELEMENT_NODE && isBlock(node)) find.dirtyContainers.add(node);
+                            else markNode(m.target);
+                        });
+                        // Removed blocks are purged as disconnected; inline removals change the parent block
+                        m.removedNodes.forEach(node => {
+                            if (node.nodeType !== Node.ELEMENT_NODE || !isBlock(node)) markNode(m.target);
+                        });
+                    }
+                    find.stale = true;
+                }
+
+                const observer = new MutationObserver(trackMutations);
+                observer.observe(document.body, { childList: true, subtree: true, characterData: true });
+
+                function refreshIndex() {
+                    if (find.entries === null) {
+                        find.entries = collectEntries(document.body);
+                        find.entries.forEach(entry => find.entryOf.set(entry.block, entry));
+                        return;
+                    }
+                    trackMutations(observer.takeRecords());
+                    if (find.dirtyEntries.size === 0 && find.dirtyContainers.size === 0) return;
+
+                    // Drop a container when one of its ancestors is re-indexed anyway
+                    const containers = Array.from(find.dirtyContainers).filter(c => c.isConnected &&
+                        !Array.from(find.dirtyContainers).some(other => other !== c && other.contains(c)));
+                    find.entries = find.entries.filter(entry => {
+                        const keep = entry.block.isConnected && !containers.some(c => c.contains(entry.block));
+                        if (!keep) find.entryOf.delete(entry.block);
+                        return keep;
+                    });
+
+                    find.dirtyEntries.forEach(entry => {
+                        if (find.entryOf.get(entry.block) !== entry) return;
+                        const nodes = blockTextNodes(entry.block);
+                        const index = find.entries.indexOf(entry);
+                        if (nodes.length === 0) {
+                            find.entries.splice(index, 1);
+                            find.entryOf.delete(entry.block);
+                        } else {
+                            const fresh = makeEntry(entry.block, nodes);
+                            find.entries[index] = fresh;
+                            find.entryOf.set(entry.block, fresh);
+                        }
+                    });
+                    containers.forEach(container => collectEntries(container).forEach(insertEntry));
+                    find.dirtyEntries.clear();
+                    find.dirtyContainers.clear();
+                }
+
+                function buildRegex(query, options) {
+                    let source = options.regex ? query : query.replace(/[.*+?^${}()|[\\]\\\\]/g, '\\\\$&');
+                    if (options.wholeWord) source = '(?<![\\\\p{L}\\\\p{N}_])(?:' + source + ')(?![\\\\p{L}\\\\p{N}_])';
+                    return new RegExp(source, 'gu' + (options.matchCase ? '' : 'i'));
+                }
+
+                // Node and offset for a character offset inside an entry
+                function locate(entry, offset, preferEnd) {
+                    let lo = 0;
+                    let hi = entry.starts.length - 1;
+                    while (lo < hi) {
+                        const mid = (lo + hi + 1) >> 1;
+                        if (entry.starts[mid] < offset || (!preferEnd && entry.starts[mid] === offset)) lo = mid;
+                        else hi = mid - 1;
+                    }
+                    return { index: lo, node: entry.nodes[lo], offset: offset - entry.starts[lo] };
+                }
+
+                function matchRange(match) {
+                    const start = locate(match.entry, match.start, false);
+                    const end = locate(match.entry, match.end, true);
+                    const range = document.createRange();
+                    range.setStart(start.node, start.offset);
+                    range.setEnd(end.node, end.offset);
+                    return range;
+                }
+
+                function ensureHighlightStyle() {
+                    if (find.sheet || !window.CSSStyleSheet) return;
+                    // An adopted stylesheet is never serialized when the document is saved
+                    find.sheet = new CSSStyleSheet();
+                    find.sheet.replaceSync(
+                        '::highlight(author-find) { background-color: #fce94f; color: black; }' +
+                        '::highlight(author-find-current) { background-color: #f57900; color: black; }');
+                    document.adoptedStyleSheets = [...document.adoptedStyleSheets, find.sheet];
+                }
+
+                function paint() {
+                    if (!window.CSS || !CSS.highlights) return;
+                    ensureHighlightStyle();
+                    const ranges = find.matches.slice(0, MAX_HIGHLIGHTS).map(matchRange);
+                    CSS.highlights.set('author-find', new Highlight(...ranges));
+                    paintCurrent();
+                }
+
+                function paintCurrent() {
+                    const match = find.matches[find.current];
+                    if (!match) return;
+                    const range = matchRange(match);
+                    if (window.CSS && CSS.highlights) {
+                        CSS.highlights.set('author-find-current', new Highlight(range));
+                    } else {
+                        const sel = window.getSelection();
+                        sel.removeAllRanges();
+                        sel.addRange(range);
+                    }
+                    const rect = range.getBoundingClientRect();
+                    if (rect.top < 0 || rect.bottom > window.innerHeight) {
+                        window.scrollBy(0, rect.top - window.innerHeight / 2);
+                    }
+                }
+
+                function firstMatchAfterCaret() {
+                    const sel = window.getSelection();
+                    if (!sel.rangeCount || find.matches.length === 0) return 0;
+                    const caret = sel.getRangeAt(0);
+                    let lo = 0;
+                    let hi = find.matches.length;
+                    while (lo < hi) {
+                        const mid = (lo + hi) >> 1;
+                        const m = find.matches[mid];
+                        const pos = locate(m.entry, m.start, false);
+                        if (caret.comparePoint(pos.node, pos.offset) < 0) lo = mid + 1;
+                        else hi = mid;
+                    }
+                    return lo < find.matches.length ? lo : 0;
+                }
+
+                // Expand $&, $1 and $<name> in a regular expression replacement
+                function expandReplacement(template, m) {
+                    return template.replace(/\\$(\\$|&|\\d{1,2}|<[^>]*>)/g, (token, ref) => {
+                        if (ref === '$') return '$';
+                        if (ref === '&') return m[0];
+                        if (ref[0] === '<') return (m.groups && m.groups[ref.slice(1, -1)]) || '';
+                        return m[Number(ref)] !== undefined ? m[Number(ref)] : token;
+                    });
+                }
+
+                function collectMatches(regex, replacement) {
+                    refreshIndex();
+                    const matches = [];
+                    for (const entry of find.entries) {
+                        regex.lastIndex = 0;
+                        let m;
+                        while ((m = regex.exec(entry.text)) !== null) {
+                            if (m[0].length === 0) {
+                                regex.lastIndex++;
+                                continue;
+                            }
+                            const match = { entry: entry, start: m.index, end: m.index + m[0].length };
+                            if (replacement !== null) {
+                                match.found = m[0];
+                                match.replacement = find.options.regex ? expandReplacement(replacement, m) : replacement;
+                            }
+                            matches.push(match);
+                        }
+                    }
+                    return matches;
+                }
+
+                function textBetween(entry, start, end) {
+                    if (start.index === end.index) return start.node.nodeValue.slice(start.offset, end.offset);
+                    let text = start.node.nodeValue.slice(start.offset);
+                    for (let i = start.index + 1; i < end.index; i++) text += entry.nodes[i].nodeValue;
+                    return text + end.node.nodeValue.slice(0, end.offset);
+                }
+
+                // Rewrite the text nodes covered by a match
+                function applyReplacement(match) {
+                    const entry = match.entry;
+                    const start = locate(entry, match.start, false);
+                    const end = locate(entry, match.end, true);
+                    // The user may have edited the text while the replace was yielding
+                    if (!start.node.isConnected || textBetween(entry, start, end) !== match.found) return false;
+
+                    if (start.index === end.index) {
+                        const value = start.node.nodeValue;
+                        start.node.nodeValue = value.slice(0, start.offset) + match.replacement + value.slice(end.offset);
+                    } else {
+                        start.node.nodeValue = start.node.nodeValue.slice(0, start.offset) + match.replacement;
+                        for (let i = start.index + 1; i < end.index; i++) entry.nodes[i].nodeValue = '';
+                        end.node.nodeValue = end.node.nodeValue.slice(end.offset);
+                    }
+                    return true;
+                }
+
+                function report(error) {
+                    return {
+                        count: find.matches.length,
+                        current: find.current + 1,
+                        error: error || null
+                    };
+                }
+
+                find.search = function(query, options) {
+                    find.query = query;
+                    find.options = options;
+                    find.matches = [];
+                    find.current = -1;
+                    find.stale = false;
+                    if (!query) {
+                        find.clear();
+                        return report();
+                    }
+                    let regex;
+                    try {
+                        regex = buildRegex(query, options);
+                    } catch (e) {
+                        find.clear();
+                        return report('Invalid pattern');
+                    }
+                    find.matches = collectMatches(regex, null);
+                    if (find.matches.length > 0) find.current = firstMatchAfterCaret();
+                    paint();
+                    return report();
+                };
+
+                // Replace every match in chunks, yielding to the UI between them; authorHistory
+                // holds typing back meanwhile and keeps the whole replace as one undo step
+                find.replaceAll = async function(query, options, replacement) {
+                    if (find.replacing || !query) return { replaced: 0, ms: 0 };
+                    let regex;
+                    try {
+                        regex = buildRegex(query, options);
+                    } catch (e) {
+                        return { error: 'Invalid pattern' };
+                    }
+                    find.replacing = true;
+                    find.query = query;
+                    find.options = options;
+                    find.clear();
+                    const began = performance.now();
+                    const matches = collectMatches(regex, replacement);
+                    let replaced = 0;
+
+                    authorHistory.hold();
+                    try {
+                        let sliceStart = performance.now();
+                        // Back to front, so offsets of the remaining matches stay valid
+                        for (let i = matches.length - 1; i >= 0; i--) {
+                            if (applyReplacement(matches[i])) replaced++;
+                            if (performance.now() - sliceStart > 8) {
+                                await new Promise(resolve => window.requestIdleCallback ?
+                                    requestIdleCallback(resolve, { timeout: 50 }) : setTimeout(resolve, 0));
+                                sliceStart = performance.now();
+                            }
+                        }
+                    } finally {
+                        authorHistory.release();
+                        find.replacing = false;
+                    }
+                    find.search(query, options);
+                    if (replaced > 0) authorRpc.emit('contentChanged');
+                    return { replaced: replaced, ms: Math.round(performance.now() - began) };
+                };
+
+                find.step = function(delta) {
+                    if (find.stale && find.query) find.search(find.query, find.options);
+                    if (find.matches.length === 0) return report();
+                    find.current = (find.current + delta + find.matches.length) % find.matches.length;
+                    paintCurrent();
+                    return report();
+                };
+
+                // Put the caret on the current match so editing continues there
+                find.selectCurrent = function() {
+                    const match = find.matches[find.current];
+                    if (!match) return;
+                    const sel = window.getSelection();
+                    sel.removeAllRanges();
+                    sel.addRange(matchRange(match));
+                };
+
+                find.clear = function() {
+                    find.matches = [];
+                    find.current = -1;
+                    if (window.CSS && CSS.highlights) {
+                        CSS.highlights.delete('author-find');
+                        CSS.highlights.delete('author-find-current');
+                    }
+                };
+
+                authorRpc.register('find.search', find.search);
+                authorRpc.register('find.step', find.step);
+                authorRpc.register('find.replaceAll', find.replaceAll);
+                authorRpc.register('find.close', function() {
+                    find.selectCurrent();
+                    find.clear();
+                });
+            })();
+        """
+
+    def on_find_clicked(self, btn):
+        self.replace_box.set_visible(False)
+        self.show_find_bar()
+
+    def show_find_bar(self):
+        self.find_bar_revealer.set_reveal_child(True)
+        self.find_entry.grab_focus()
+        self.find_entry.select_region(0, -1)
+        if self.find_entry.get_text():
+            self.run_find()
+
+    def on_find_close_clicked(self, *args):
+        self.find_bar_revealer.set_reveal_child(False)
+        self.call_js('find.close')
+
+    def find_options(self):
+        return {
+            'matchCase': self.find_case_btn.get_active(),
+            'wholeWord': self.find_word_btn.get_active(),
+            'regex': self.find_regex_btn.get_active(),
+        }
+
+    def run_find(self, *args):
+        self.rpc.call('find.search', self.find_entry.get_text(), self.find_options()).add_done_callback(
+            self.on_find_result)
+
+    def on_find_next(self, *args):
+        self.rpc.call('find.step', 1).add_done_callback(self.on_find_result)
+
+    def on_find_previous(self, *args):
+        self.rpc.call('find.step', -1).add_done_callback(self.on_find_result)
+
+    def on_find_entry_key_pressed(self, controller, keyval, keycode, state):
+        if keyval in (Gdk.KEY_Return, Gdk.KEY_KP_Enter) and state & Gdk.ModifierType.SHIFT_MASK:
+            self.on_find_previous()
+            return True
+        return False
+
+    def on_find_result(self, future):
+        try:
+            state = future.result()
+            if state.get('error'):
+                self.find_status_label.set_text(state['error'])
+            elif not self.find_entry.get_text():
+                self.find_status_label.set_text("")
+            elif state['count'] == 0:
+                self.find_status_label.set_text("No matches")
+            else:
+                self.find_status_label.set_text(f"{state['current']} of {state['count']}")
+        except Exception as e:
+            print(f"Find error: {e}")
+
+    def on_replace_clicked(self, btn):
+        self.replace_box.set_visible(True)
+        self.show_find_bar()
+
+    def on_replace_all_clicked(self, *args):
+        query = self.find_entry.get_text()
+        if not query:
+            self.find_entry.grab_focus()
+            return
+        self.find_status_label.set_text("Replacing…")
+        self.rpc.call('find.replaceAll', query, self.find_options(), self.replace_entry.get_text()).add_done_callback(
+            self.on_replace_all_done)
+
+    def on_replace_all_done(self, future):
+        try:
+            status = future.result()
+            if status.get('error'):
+                self.find_status_label.set_text(status['error'])
+                return
+            replaced = status['replaced']
+            self.find_status_label.set_text(
+                f"Replaced {replaced} {'match' if replaced == 1 else 'matches'} in {status['ms']} ms")
+        except Exception as e:
+            print(f"Replace error: {e}")
+        self.webview.grab_focus()
+
+    def on_zoom_changed(self, dropdown, *args):
+        selected_item = dropdown.get_selected_item()
+        if selected_item:
+            try:
+                zoom_level = int(selected_item.get_string().rstrip('%')) / 100.0
+                self.webview.set_zoom_level(zoom_level)
+            except ValueError:
+                pass
+
+    def on_bold_toggled(self, btn):
+        self.is_bold = btn.get_active()
+        self.apply_persistent_formatting('bold', self.is_bold)
+        self.webview.grab_focus()
+
+    def on_italic_toggled(self, btn):
+        self.is_italic = btn.get_active()
+        self.apply_persistent_formatting('italic', self.is_italic)
+        self.webview.grab_focus()
+
+    def on_underline_toggled(self, btn):
+        self.is_underline = btn.get_active()
+        self.apply_persistent_formatting('underline', self.is_underline)
+        self.webview.grab_focus()
+
+    def on_strikethrough_toggled(self, btn):
+        self.is_strikethrough = btn.get_active()
+        self.apply_persistent_formatting('strikethrough', self.is_strikethrough)
+        self.webview.grab_focus()
+
+    def on_bullet_list_toggled(self, btn):
+        self.is_bullet_list = btn.get_active()
+        self.apply_list_formatting('unordered', self.is_bullet_list)
+        self.webview.grab_focus()
+        self.update_formatting_state()
+
+    def on_number_list_toggled(self, btn):
+        self.is_number_list = btn.get_active()
+        self.apply_list_formatting('ordered', self.is_number_list)
+        self.webview.grab_focus()
+        self.update_formatting_state()
+
+    def on_heading_changed(self, dropdown, *args):
+        headings = ["div", "h1", "h2", "h3", "h4", "h5", "h6"]
+        selected = dropdown.get_selected()
+        if 0 <= selected < len(headings):
+            self.call_js('execCommand', 'formatBlock', headings[selected])
+            self.update_formatting_state()
+
+    def on_align_left(self, btn):
+        if btn.get_active():
+            self.is_align_left = True
+            self.is_align_center = self.is_align_right = self.is_align_justify = False
+            self.align_center_btn.set_active(False)
+            self.align_right_btn.set_active(False)
+            self.align_justify_btn.set_active(False)
+            self.call_js('execCommand', 'justifyLeft')
+            self.webview.grab_focus()
+            self.update_formatting_state()
+
+    def on_align_center(self, btn):
+        if btn.get_active():
+            self.is_align_center = True
+            self.is_align_left = self.is_align_right = self.is_align_justify = False
+            self.align_left_btn.set_active(False)
+            self.align_right_btn.set_active(False)
+            self.align_justify_btn.set_active(False)
+            self.call_js('execCommand', 'justifyCenter')
+            self.webview.grab_focus()
+            self.update_formatting_state()
+
+    def on_align_right(self, btn):
+        if btn.get_active():
+            self.is_align_right = True
+            self.is_align_left = self.is_align_center = self.is_align_justify = False
+            self.align_left_btn.set_active(False)
+            self.align_center_btn.set_active(False)
+            self.align_justify_btn.set_active(False)
+            self.call_js('execCommand', 'justifyRight')
+            self.webview.grab_focus()
+            self.update_formatting_state()
+
+    def on_align_justify(self, btn):
+        if btn.get_active():
+            self.is_align_justify = True
+            self.is_align_left = self.is_align_center = self.is_align_right = False
+            self.align_left_btn.set_active(False)
+            self.align_center_btn.set_active(False)
+            self.align_right_btn.set_active(False)
+            self.call_js('execCommand', 'justifyFull')
+            self.webview.grab_focus()
+            self.update_formatting_state()
+
+    def on_indent_more(self, *args):
+        self.call_js('execCommand', 'indent')
+        self.update_formatting_state()
+
+    def on_indent_less(self, *args):
+        self.call_js('execCommand', 'outdent')
+        self.update_formatting_state()
+
+    def on_font_family_changed(self, dropdown, *args):
+        if item := dropdown.get_selected_item():
+            self.call_js('setFontFamily', item.get_string())
+            self.update_formatting_state()
+
+    def on_font_size_changed(self, dropdown, *args):
+        if item := dropdown.get_selected_item():
+            self.call_js('setFontSize', item.get_string())
             self.update_formatting_state()
 
     def open_file_dialog(self):
@@ -1295,7 +2605,8 @@ class EditorWindow(Adw.ApplicationWindow):
             ok, content, _ = file.load_contents_finish(result)
             if ok:
                 self.ignore_changes = True
-                self.webview.load_html(content.decode(), file.get_uri())
+                html = self.get_application().asset_store.externalize(content.decode())
+                self.webview.load_html(html, file.get_uri())
                 GLib.timeout_add(500, self.clear_ignore_changes)
                 self.is_modified = False
                 self.update_title()
@@ -1306,13 +2617,10 @@ class EditorWindow(Adw.ApplicationWindow):
         try:
             with open(file.get_path(), 'r', encoding='utf-8') as f:
                 md_content = f.read()
-            with tempfile.TemporaryDirectory() as temp_dir:
-                assets_dir = os.path.join(temp_dir, "assets")
-                os.makedirs(assets_dir, exist_ok=True)
-                base_dir = os.path.dirname(file.get_path())
-                md_content = self.process_markdown_images(md_content, base_dir, assets_dir)
-                html_body = markdown.markdown(md_content, extensions=['extra', 'codehilite'])
-                html_content = f"""<!DOCTYPE html>
+            base_dir = os.path.dirname(file.get_path())
+            md_content = self.process_markdown_images(md_content, base_dir)
+            html_body = markdown_to_html(md_content)
+            html_content = f"""<!DOCTYPE html>
 <html>
 <head>
     <style>
@@ -1326,13 +2634,12 @@ class EditorWindow(Adw.ApplicationWindow):
 </head>
 <body>{html_body}</body>
 </html>"""
-                html_content = html_content.replace("assets/", f"file://{assets_dir}/")
-                self.ignore_changes = True
-                self.webview.load_html(html_content, f"file://{temp_dir}/")
-                GLib.timeout_add(500, self.clear_ignore_changes)
-                self.is_modified = False
-                self.update_title()
-                print(f"Loaded Markdown file: {file.get_path()}")
+            self.ignore_changes = True
+            self.webview.load_html(html_content, file.get_uri())
+            GLib.timeout_add(500, self.clear_ignore_changes)
+            self.is_modified = False
+            self.update_title()
+            print(f"Loaded Markdown file: {file.get_path()}")
         except Exception as e:
             print(f"Error loading Markdown file: {e}")
 
@@ -1359,7 +2666,8 @@ class EditorWindow(Adw.ApplicationWindow):
         except Exception as e:
             print(f"Error loading text file: {e}")
 
-    def process_markdown_images(self, md_content, base_dir, temp_assets_dir):
+    def process_markdown_images(self, md_content, base_dir):
+        asset_store = self.get_application().asset_store
         img_pattern = r'!\[.*?\]\((.*?)\)'
         matches = re.findall(img_pattern, md_content)
         
@@ -1370,30 +2678,274 @@ class EditorWindow(Adw.ApplicationWindow):
                 try:
                     header, data = src.split(",", 1)
                     mime_type = header.split(";")[0].replace("data:", "")
-                    ext = mime_type.split("/")[1]
-                    img_data = base64.b64decode(data)
-                    img_name = f"image_{i}.{ext}"
-                    img_path = os.path.join(temp_assets_dir, img_name)
-                    with open(img_path, "wb") as f:
-                        f.write(img_data)
-                    md_content = md_content.replace(src, f"assets/{img_name}")
+                    asset_url = asset_store.add_bytes(base64.b64decode(data), mime_type)
+                    md_content = md_content.replace(src, asset_url)
                 except Exception as e:
                     print(f"Error processing Markdown base64 image {i}: {e}")
             else:
-                try:
-                    abs_path = os.path.join(base_dir, src)
-                    if os.path.exists(abs_path):
-                        img_name = f"image_{i}{os.path.splitext(abs_path)[1]}"
-                        img_path = os.path.join(temp_assets_dir, img_name)
-                        shutil.copy(abs_path, img_path)
-                        md_content = md_content.replace(src, f"assets/{img_name}")
-                    else:
-                        print(f"Markdown image not found: {abs_path}")
-                except Exception as e:
-                    print(f"Error copying Markdown image {i}: {e}")
+                abs_path = os.path.join(base_dir, src)
+                if os.path.exists(abs_path):
+                    md_content = md_content.replace(src, asset_store.add_file(abs_path))
+                else:
+                    print(f"Markdown image not found: {abs_path}")
         
         return md_content
 
+    def on_insert_image_clicked(self, btn):
+        dialog = Gtk.FileDialog()
+        dialog.set_title("Insert Image")
+        image_filter = Gtk.FileFilter()
+        image_filter.set_name("Images")
+        image_filter.add_mime_type("image/*")
+        filter_store = Gio.ListStore.new(Gtk.FileFilter)
+        filter_store.append(image_filter)
+        dialog.set_filters(filter_store)
+        dialog.open(self, None, self.on_insert_image_response)
+
+    def on_insert_image_response(self, dialog, result):
+        try:
+            file = dialog.open_finish(result)
+            if file:
+                self.insert_image(file.get_path())
+        except GLib.Error as e:
+            print("Insert image error:", e.message)
+
+    def image_display_width(self):
+        """CSS pixels an image can take up in the page: its width less the body margins"""
+        return max(IMAGE_MIN_WIDTH, int(self.webview.get_width() / self.webview.get_zoom_level()) - 40)
+
+    def insert_image(self, path):
+        """Insert the image at path, reduced on a worker to a rendition the width of the page.
+
+        Only the rendition is saved with the document unless Keep Original
+        is checked for it in the image bar.
+        """
+        source_url = self.get_application().asset_store.add_file(path)
+        if not pil_available():
+            self.insert_image_html(source_url, None)
+            return
+        css_width = self.image_display_width()
+        future = image_executor.submit(ingest_image, path, css_width * self.get_scale_factor())
+        future.add_done_callback(lambda future: GLib.idle_add(self.on_image_ingested, future, source_url, css_width))
+
+    def on_image_ingested(self, future, source_url, css_width):
+        try:
+            rendition = future.result()
+        except Exception as e:
+            # Whatever Pillow cannot read goes in as it is, for WebKit to try
+            print(f"Could not reduce image: {e}")
+            self.insert_image_html(source_url, None)
+            return False
+        url = self.get_application().asset_store.add_rendition(rendition, source_url)
+        reduced = rendition.data is not None and rendition.width < rendition.source_width
+        self.insert_image_html(url, min(css_width, rendition.source_width) if reduced else None)
+        return False
+
+    def insert_image_html(self, url, width):
+        width_attribute = f' width="{width}"' if width else ''
+        self.call_js('execCommand', 'insertHTML', f'<img src="{url}"{width_attribute} style="max-width: 100%;">')
+
+    def on_image_selected(self, image):
+        """Page event: an image was clicked (image describes it) or the selection left it (None)"""
+        self.flush_image_resize()
+        self.selected_image = image
+        asset_store = self.get_application().asset_store
+        source_url = asset_store.source_url(image['original'] or image['src']) if image else None
+        if source_url is None:
+            # Nothing selected, or an image from elsewhere than the asset store
+            self.image_bar_revealer.set_reveal_child(False)
+            return
+        self.updating_image_bar = True
+        self.image_width_spin.set_range(IMAGE_MIN_WIDTH, max(IMAGE_MIN_WIDTH, image['maxWidth'], image['width']))
+        self.image_width_spin.set_value(image['width'])
+        self.image_keep_original_btn.set_active(bool(image['original']))
+        self.image_keep_original_btn.set_sensitive(source_url != image['src'] or bool(image['original']))
+        self.updating_image_bar = False
+        self.image_thumbnail.set_paintable(None)
+        if pil_available():
+            future = image_executor.submit(cached_thumbnail, asset_store.source_data(source_url))
+            future.add_done_callback(lambda future: GLib.idle_add(self.on_thumbnail_ready, future, image['id']))
+        self.image_bar_revealer.set_reveal_child(True)
+
+    def on_thumbnail_ready(self, future, image_id):
+        try:
+            path = future.result()
+        except Exception as e:
+            print(f"Could not make thumbnail: {e}")
+            return False
+        if self.selected_image and self.selected_image['id'] == image_id:
+            self.image_thumbnail.set_filename(path)
+        return False
+
+    def clear_selected_image(self):
+        """Forget the image bar's image; its page is being replaced"""
+        if self.image_resize_timeout:
+            GLib.source_remove(self.image_resize_timeout)
+            self.image_resize_timeout = 0
+        self.selected_image = None
+        self.image_bar_revealer.set_reveal_child(False)
+
+    def on_image_width_changed(self, spin):
+        if self.updating_image_bar or self.selected_image is None:
+            return
+        image = self.selected_image
+        image['width'] = spin.get_value_as_int()
+        self.rpc.call('image.resize', image['id'], image['width'])
+        # The width shows at once; a rendition for it is made once it settles
+        if self.image_resize_timeout:
+            GLib.source_remove(self.image_resize_timeout)
+        self.image_resize_timeout = GLib.timeout_add(IMAGE_RERENDER_DELAY_MS, self.on_image_resize_settled, image)
+
+    def on_image_resize_settled(self, image):
+        self.image_resize_timeout = 0
+        self.rerender_image(image)
+        return False
+
+    def flush_image_resize(self):
+        """Start the re-rendition a resize is still waiting for, before the image bar moves on"""
+        if self.image_resize_timeout:
+            GLib.source_remove(self.image_resize_timeout)
+            self.image_resize_timeout = 0
+            self.rerender_image(self.selected_image)
+
+    def rerender_image(self, image):
+        """Make a rendition of a resized image for its new width, on a worker, from its source"""
+        if not pil_available():
+            return
+        asset_store = self.get_application().asset_store
+        source_url = asset_store.source_url(image['original'] or image['src'])
+        if source_url is None:
+            return
+        future = image_executor.submit(ingest_image, asset_store.source_data(source_url),
+                                       image['width'] * self.get_scale_factor())
+        future.add_done_callback(lambda future: GLib.idle_add(self.on_image_rerendered, future, image, source_url))
+
+    def on_image_rerendered(self, future, image, source_url):
+        try:
+            rendition = future.result()
+        except Exception as e:
+            print(f"Could not resize image: {e}")
+            return False
+        url = self.get_application().asset_store.add_rendition(rendition, source_url)
+        if url != image['src']:
+            image['src'] = url
+            self.rpc.call('image.setRendition', image['id'], url, image['original'])
+        return False
+
+    def on_image_keep_original_toggled(self, btn):
+        if self.updating_image_bar or self.selected_image is None:
+            return
+        image = self.selected_image
+        source_url = self.get_application().asset_store.source_url(image['original'] or image['src'])
+        image['original'] = source_url if btn.get_active() else ''
+        self.rpc.call('image.setSource', image['id'], image['src'], image['original'])
+
+    def image_script(self):
+        return """
+            (function() {
+                if (window.authorImages) return;
+
+                // The image the image bar works on; ids let Python name images across calls
+                // without keeping removed images alive
+                const images = { selected: null, ids: new WeakMap(), byId: new Map(), nextId: 1 };
+                window.authorImages = images;
+
+                function imageId(img) {
+                    let id = images.ids.get(img);
+                    if (!id) {
+                        id = images.nextId++;
+                        images.ids.set(img, id);
+                    }
+                    if (!images.byId.has(id)) images.byId.set(id, new WeakRef(img));
+                    return id;
+                }
+
+                function describe(img) {
+                    const parent = img.parentElement || document.body;
+                    const style = getComputedStyle(parent);
+                    const maxWidth = parent.clientWidth - parseFloat(style.paddingLeft) - parseFloat(style.paddingRight);
+                    return {
+                        id: imageId(img),
+                        src: img.getAttribute('src') || '',
+                        original: img.getAttribute('data-original-src') || '',
+                        width: Math.round(img.getBoundingClientRect().width),
+                        maxWidth: Math.round(maxWidth)
+                    };
+                }
+
+                images.select = function(img) {
+                    if (img === images.selected) return;
+                    images.selected = img;
+                    authorRpc.emit('imageSelected', img ? describe(img) : null);
+                };
+
+                document.addEventListener('click', function(event) {
+                    const img = event.target.tagName === 'IMG' ? event.target : null;
+                    if (img) {
+                        const range = document.createRange();
+                        range.selectNode(img);
+                        const sel = window.getSelection();
+                        sel.removeAllRanges();
+                        sel.addRange(range);
+                    }
+                    images.select(img);
+                });
+
+                document.addEventListener('selectionchange', function() {
+                    const img = images.selected;
+                    if (img && (!img.isConnected || !window.getSelection().containsNode(img, true))) {
+                        images.select(null);
+                    }
+                });
+
+                function imageById(id) {
+                    const ref = images.byId.get(id);
+                    const img = ref && ref.deref();
+                    if (img && img.isConnected) return img;
+                    images.byId.delete(id);
+                    return null;
+                }
+
+                // Only the width attribute changes; the height follows from the image
+                authorRpc.register('image.resize', function(id, width) {
+                    const img = imageById(id);
+                    if (!img || authorHistory.held > 0) return false;
+                    img.setAttribute('width', width);
+                    img.removeAttribute('height');
+                    img.style.removeProperty('width');
+                    img.style.removeProperty('height');
+                    authorRpc.emit('contentChanged');
+                    return true;
+                });
+
+                function setSource(img, src, original) {
+                    img.setAttribute('src', src);
+                    if (original && original !== src) {
+                        img.setAttribute('data-original-src', original);
+                    } else {
+                        img.removeAttribute('data-original-src');
+                    }
+                }
+
+                authorRpc.register('image.setSource', function(id, src, original) {
+                    const img = imageById(id);
+                    if (!img || authorHistory.held > 0) return false;
+                    setSource(img, src, original);
+                    authorRpc.emit('contentChanged');
+                    return true;
+                });
+
+                // A rendition only changes how the image is shown, so it joins the resize's undo step
+                authorRpc.register('image.setRendition', function(id, src, original) {
+                    const img = imageById(id);
+                    if (!img || authorHistory.held > 0) return false;
+                    authorHistory.quiet(() => setSource(img, src, original));
+                    authorRpc.emit('contentChanged');
+                    return true;
+                });
+            })();
+        """
+
     def clear_ignore_changes(self):
         self.ignore_changes = False
         return False
@@ -1492,58 +3044,17 @@ class EditorWindow(Adw.ApplicationWindow):
             self.start_new_document()
 
     def on_close_request(self, *args):
+        if startup_profile.enabled:
+            print(self.rpc.latency_report(), file=sys.stderr)
         if not self.check_save_before_close():
             self.get_application().quit()
         return True
 
     def apply_persistent_formatting(self, format_type, enable):
-        desired = str(enable).lower()
-        script = f"""
-            (function() {{
-                let sel = window.getSelection();
-                if (!sel.rangeCount) {{
-                    let range = document.createRange();
-                    range.selectNodeContents(document.body);
-                    range.collapse(false);
-                    sel.removeAllRanges();
-                    sel.addRange(range);
-                }}
-                let cmd = '{format_type}';
-                let currentState = document.queryCommandState(cmd);
-                if (currentState !== {desired}) {{
-                    document.execCommand(cmd, false, null);
-                }}
-            }})();
-        """
-        self.exec_js(script)
+        self.call_js('setInlineFormat', format_type, enable)
 
     def apply_list_formatting(self, list_type, enable):
-        cmd = 'insertUnorderedList' if list_type == 'unordered' else 'insertOrderedList'
-        list_tag = 'ul' if list_type == 'unordered' else 'ol'
-        script = f"""
-            (function() {{
-                let sel = window.getSelection();
-                if (!sel.rangeCount) {{
-                    let body = document.body;
-                    let range = document.createRange();
-                    range.selectNodeContents(body);
-                    range.collapse(false);
-                    sel.removeAllRanges();
-                    sel.addRange(range);
-                }}
-                let range = sel.getRangeAt(0);
-                let isEnabled = {'true' if enable else 'false'};
-                let ancestor = range.commonAncestorContainer;
-                let parentElement = (ancestor.nodeType === 3) ? ancestor.parentElement : ancestor;
-                let currentList = parentElement.closest('{list_tag}');
-                if (isEnabled && !currentList) {{
-                    document.execCommand('{cmd}', false, null);
-                }} else if (!isEnabled && currentList) {{
-                    document.execCommand('{cmd}', false, null);
-                }}
-            }})();
-        """
-        self.exec_js(script)
+        self.call_js('setList', list_type, enable)
         if list_type == 'unordered' and enable:
             self.is_number_list = False
             self.number_btn.set_active(False)
@@ -1551,134 +3062,451 @@ class EditorWindow(Adw.ApplicationWindow):
             self.is_bullet_list = False
             self.bullet_btn.set_active(False)
 
-    def update_formatting_state(self):
-        script = """
+    def rpc_script(self):
+        return """
             (function() {
-                let sel = window.getSelection();
-                if (!sel.rangeCount) return JSON.stringify({});
-                let range = sel.getRangeAt(0);
-                let container = range.startContainer;
-                let parent = (container.nodeType === 3) ? container.parentElement : container;
-                let computedStyle = window.getComputedStyle(parent);
-                let blockParent = parent;
-                while (blockParent && !window.getComputedStyle(blockParent).display.includes('block')) {
-                    blockParent = blockParent.parentElement;
+                if (window.authorRpc) return;
+                const rpc = window.authorRpc = { methods: Object.create(null) };
+
+                function post(message) {
+                    window.webkit.messageHandlers.rpc.postMessage(message);
                 }
-                let heading = blockParent ? blockParent.tagName.toLowerCase() : 'div';
-                if (heading === 'p' || !['h1','h2','h3','h4','h5','h6'].includes(heading)) heading = 'div';
-                let states = {
-                    bold: computedStyle.fontWeight === 'bold' || parseInt(computedStyle.fontWeight) > 400,
-                    italic: computedStyle.fontStyle === 'italic',
-                    underline: computedStyle.textDecorationLine.includes('underline'),
-                    strikethrough: computedStyle.textDecorationLine.includes('line-through'),
-                    ul: parent.closest('ul') !== null,
-                    ol: parent.closest('ol') !== null,
-                    justifyLeft: document.queryCommandState('justifyLeft'),
-                    justifyCenter: document.queryCommandState('justifyCenter'),
-                    justifyRight: document.queryCommandState('justifyRight'),
-                    justifyFull: document.queryCommandState('justifyFull'),
-                    fontFamily: computedStyle.fontFamily.split(',')[0].replace(/['"]/g, ''),
-                    fontSize: computedStyle.fontSize,
-                    color: computedStyle.color,
-                    backgroundColor: computedStyle.backgroundColor,
-                    heading: heading
+
+                rpc.register = function(name, fn) {
+                    rpc.methods[name] = fn;
                 };
-                return JSON.stringify(states);
+
+                rpc.emit = function(event, data) {
+                    post({ event: event, data: data === undefined ? null : data });
+                };
+
+                // Answers every call of a batch; promises are answered when they settle
+                rpc.dispatch = function(calls) {
+                    return calls.map(call => {
+                        const fn = rpc.methods[call.method];
+                        if (!fn) return { id: call.id, error: 'Unknown method ' + call.method };
+                        try {
+                            const result = fn.apply(null, call.params);
+                            if (result && typeof result.then === 'function') {
+                                result.then(
+                                    value => post({ id: call.id, result: value === undefined ? null : value }),
+                                    error => post({ id: call.id, error: String(error) }));
+                                return { id: call.id, pending: true };
+                            }
+                            return { id: call.id, result: result === undefined ? null : result };
+                        } catch (e) {
+                            return { id: call.id, error: String(e) };
+                        }
+                    });
+                };
+
+                function ensureSelection() {
+                    let sel = window.getSelection();
+                    if (!sel.rangeCount) {
+                        let range = document.createRange();
+                        range.selectNodeContents(document.body);
+                        range.collapse(false);
+                        sel.removeAllRanges();
+                        sel.addRange(range);
+                    }
+                    return sel;
+                }
+
+                // Edits are refused, like typing, while a paste or replace-all holds the undo history open;
+                // they would otherwise become part of its single undo step
+                function historyHeld() {
+                    return Boolean(window.authorHistory && authorHistory.held > 0);
+                }
+
+                rpc.register('execCommand', function(command, value) {
+                    if (historyHeld()) return false;
+                    return document.execCommand(command, false, value === undefined ? null : value);
+                });
+
+                rpc.register('setInlineFormat', function(cmd, enable) {
+                    if (historyHeld()) return false;
+                    ensureSelection();
+                    if (document.queryCommandState(cmd) !== enable) {
+                        document.execCommand(cmd, false, null);
+                    }
+                    // A collapsed caret only changes the typing style, which computed styles don't show
+                    if (window.authorFormat) authorFormat.assume({ [cmd]: enable });
+                });
+
+                rpc.register('setList', function(listType, enable) {
+                    if (historyHeld()) return false;
+                    let cmd = listType === 'unordered' ? 'insertUnorderedList' : 'insertOrderedList';
+                    let range = ensureSelection().getRangeAt(0);
+                    let ancestor = range.commonAncestorContainer;
+                    let parentElement = (ancestor.nodeType === 3) ? ancestor.parentElement : ancestor;
+                    let currentList = parentElement.closest(listType === 'unordered' ? 'ul' : 'ol');
+                    if (enable !== Boolean(currentList)) {
+                        document.execCommand(cmd, false, null);
+                    }
+                });
+
+                rpc.register('setFontFamily', function(fontFamily) {
+                    if (historyHeld()) return false;
+                    let selection = window.getSelection();
+                    if (!selection.rangeCount) return;
+                    let range = selection.getRangeAt(0);
+                    let ancestor = range.commonAncestorContainer;
+                    let spans = (ancestor.nodeType === 1)
+                        ? ancestor.querySelectorAll('span[style*="font-family"]')
+                        : ancestor.parentElement.querySelectorAll('span[style*="font-family"]');
+                    if (spans.length > 0 && range.toString().length > 0) {
+                        let updated = false;
+                        spans.forEach(span => {
+                            if (range.intersectsNode(span)) {
+                                span.style.fontFamily = fontFamily;
+                                updated = true;
+                            }
+                        });
+                        if (updated) {
+                            let newRange = document.createRange();
+                            newRange.setStart(range.startContainer, range.startOffset);
+                            newRange.setEnd(range.endContainer, range.endOffset);
+                            selection.removeAllRanges();
+                            selection.addRange(newRange);
+                            return;
+                        }
+                    }
+                    let contents = range.extractContents();
+                    if (!contents.hasChildNodes()) {
+                        range.insertNode(contents);
+                        return;
+                    }
+                    let span = document.createElement('span');
+                    span.style.fontFamily = fontFamily;
+                    span.appendChild(contents);
+                    range.insertNode(span);
+                    let newRange = document.createRange();
+                    newRange.selectNodeContents(span);
+                    selection.removeAllRanges();
+                    selection.addRange(newRange);
+                });
+
+                rpc.register('setFontSize', function(sizePt) {
+                    if (historyHeld()) return false;
+                    let selection = window.getSelection();
+                    if (!selection.rangeCount) return;
+                    let range = selection.getRangeAt(0);
+                    let content = range.extractContents();
+                    let span = document.createElement('span');
+                    span.style.fontSize = sizePt + 'pt';
+                    let tempElement = document.createElement('div');
+                    tempElement.appendChild(content);
+                    let fontSizeSpans = tempElement.querySelectorAll('span[style*="font-size"]');
+                    for (let oldSpan of fontSizeSpans) {
+                        while (oldSpan.firstChild) {
+                            oldSpan.parentNode.insertBefore(oldSpan.firstChild, oldSpan);
+                        }
+                        oldSpan.parentNode.removeChild(oldSpan);
+                    }
+                    while (tempElement.firstChild) {
+                        span.appendChild(tempElement.firstChild);
+                    }
+                    range.insertNode(span);
+                    selection.removeAllRanges();
+                    let newRange = document.createRange();
+                    newRange.selectNodeContents(span);
+                    selection.addRange(newRange);
+                });
+
+                rpc.register('cut', function() {
+                    if (historyHeld()) return false;
+                    if (window.getSelection().rangeCount) document.execCommand('cut');
+                });
+
+                rpc.register('undo', function() {
+                    return window.authorHistory ? authorHistory.undo() : false;
+                });
+
+                rpc.register('redo', function() {
+                    return window.authorHistory ? authorHistory.redo() : false;
+                });
+
+                rpc.register('setDarkTheme', function(enable) {
+                    let style = document.getElementById('dynamic-theme-style');
+                    if (enable && !style) {
+                        style = document.createElement('style');
+                        style.id = 'dynamic-theme-style';
+                        style.textContent = `
+                            @media screen {
+                                body { background-color: #242424 !important; color: #e0e0e0 !important; }
+                            }
+                        `;
+                        document.head.appendChild(style);
+                    } else if (!enable && style) {
+                        style.remove();
+                    }
+                });
             })();
         """
-        self.webview.evaluate_javascript(script, -1, None, None, None, self.on_formatting_state_received, None)
 
-    def on_formatting_state_received(self, webview, result, user_data):
-        try:
-            js_value = webview.evaluate_javascript_finish(result)
-            if js_value and js_value.is_string():
-                states = json.loads(js_value.to_string())
-                
-                # Bold
-                if states.get('bold', False) != self.is_bold:
-                    self.is_bold = states['bold']
-                    self.bold_btn.set_active(self.is_bold)
-                
-                # Italic
-                if states.get('italic', False) != self.is_italic:
-                    self.is_italic = states['italic']
-                    self.italic_btn.set_active(self.is_italic)
-                
-                # Underline
-                if states.get('underline', False) != self.is_underline:
-                    self.is_underline = states['underline']
-                    self.underline_btn.set_active(self.is_underline)
-                
-                # Strikethrough
-                if states.get('strikethrough', False) != self.is_strikethrough:
-                    self.is_strikethrough = states['strikethrough']
-                    self.strikethrough_btn.set_active(self.is_strikethrough)
-                
-                # Bullet List
-                if states.get('ul', False) != self.is_bullet_list:
-                    self.is_bullet_list = states['ul']
-                    self.bullet_btn.set_active(self.is_bullet_list)
-                
-                # Numbered List
-                if states.get('ol', False) != self.is_number_list:
-                    self.is_number_list = states['ol']
-                    self.number_btn.set_active(self.is_number_list)
-                
-                # Alignment
-                if states.get('justifyLeft', False) != self.is_align_left:
-                    self.is_align_left = states['justifyLeft']
-                    self.align_left_btn.set_active(self.is_align_left)
-                if states.get('justifyCenter', False) != self.is_align_center:
-                    self.is_align_center = states['justifyCenter']
-                    self.align_center_btn.set_active(self.is_align_center)
-                if states.get('justifyRight', False) != self.is_align_right:
-                    self.is_align_right = states['justifyRight']
-                    self.align_right_btn.set_active(self.is_align_right)
-                if states.get('justifyFull', False) != self.is_align_justify:
-                    self.is_align_justify = states['justifyFull']
-                    self.align_justify_btn.set_active(self.is_align_justify)
-                
-                # Font Family
-                font_family = states.get('fontFamily', 'Sans')
-                model = self.font_dropdown.get_model()
-                for i in range(model.get_n_items()):
-                    if model.get_item(i).get_string() == font_family:
-                        self.font_dropdown.set_selected(i)
-                        break
-                
-                # Font Size
-                font_size = states.get('fontSize', '11pt').replace('px', '').replace('pt', '')
-                try:
-                    font_size = str(float(font_size))
-                    model = self.size_dropdown.get_model()
-                    for i in range(model.get_n_items()):
-                        if model.get_item(i).get_string() == font_size:
-                            self.size_dropdown.set_selected(i)
-                            break
-                except ValueError:
-                    pass
-                
-                # Text Color
-                color = states.get('color', 'rgb(0, 0, 0)')
-                if Gdk.RGBA().parse(color):
-                    self.current_text_color = Gdk.RGBA()
-                    self.current_text_color.parse(color)
-                    self.text_color_indicator.queue_draw()
-                
-                # Background Color
-                bg_color = states.get('backgroundColor', 'rgba(0, 0, 0, 0)')
-                if Gdk.RGBA().parse(bg_color):
-                    self.current_bg_color = Gdk.RGBA()
-                    self.current_bg_color.parse(bg_color)
-                    self.bg_color_indicator.queue_draw()
-                
-                # Heading
-                heading = states.get('heading', 'div')
-                headings = {"div": 0, "h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
-                self.heading_dropdown.set_selected(headings.get(heading, 0))
-        except Exception as e:
-            print(f"Error updating formatting state: {e}")
+    def virtual_render_script(self):
+        return """
+            (function() {
+                if (window.authorVirtual) return;
+                if (!window.CSS || !CSS.supports('content-visibility', 'auto') || !window.CSSStyleSheet) return;
+
+                const MIN_BLOCKS = 200;     // shorter documents are cheap enough to render whole
+                const SAMPLE_BLOCKS = 50;
+
+                // Off-screen top-level blocks skip style, layout and paint but stay in the DOM,
+                // so find, selection and saving still see the whole document
+                const virtual = {
+                    sheet: new CSSStyleSheet(),     // adopted, so it is never saved with the document
+                    enabled: false,
+                    estimate: 0,
+                    pending: false
+                };
+                window.authorVirtual = virtual;
+                document.adoptedStyleSheets = [...document.adoptedStyleSheets, virtual.sheet];
+
+                // Placeholder height for blocks that have never been rendered, measured from
+                // the blocks that are; blocks remember their real height once rendered (auto)
+                function measureEstimate() {
+                    let total = 0, count = 0;
+                    for (let el = document.body.firstElementChild; el && count < SAMPLE_BLOCKS;
+                         el = el.nextElementSibling) {
+                        let height = el.getBoundingClientRect().height;
+                        if (height > 0) {
+                            total += height;
+                            count++;
+                        }
+                    }
+                    return count ? Math.max(16, Math.round(total / count)) : 24;
+                }
+
+                virtual.update = function() {
+                    virtual.pending = false;
+                    let enable = document.body.childElementCount >= MIN_BLOCKS;
+                    if (enable === virtual.enabled) return;
+                    virtual.enabled = enable;
+                    if (enable) {
+                        virtual.estimate = measureEstimate();
+                        virtual.sheet.replaceSync(`body > * { content-visibility: auto; ` +
+                            `contain-intrinsic-block-size: auto ${virtual.estimate}px; }`);
+                    } else {
+                        virtual.sheet.replaceSync('');
+                    }
+                };
+
+                function scheduleUpdate() {
+                    if (virtual.pending) return;
+                    virtual.pending = true;
+                    if (window.requestIdleCallback) requestIdleCallback(virtual.update, {timeout: 1000});
+                    else setTimeout(virtual.update, 200);
+                }
+
+                // Only the number of top-level blocks matters, so nested edits are not observed
+                new MutationObserver(scheduleUpdate).observe(document.body, {childList: true});
+                virtual.update();
+            })();
+        """
+
+    def formatting_state_script(self):
+        return """
+            (function() {
+                if (window.authorFormat) return;
+
+                const BLOCK_TAGS = new Set(['ADDRESS', 'ARTICLE', 'ASIDE', 'BLOCKQUOTE', 'BODY', 'DD', 'DIV',
+                    'DL', 'DT', 'FIGCAPTION', 'FIGURE', 'FOOTER', 'H1', 'H2', 'H3', 'H4', 'H5', 'H6', 'HEADER',
+                    'LI', 'P', 'PRE', 'SECTION', 'TD', 'TH']);
+                const HEADINGS = new Set(['H1', 'H2', 'H3', 'H4', 'H5', 'H6']);
+
+                // blockCache: block element -> {block: block-level state, inline: element -> inline state}
+                const format = {
+                    blockCache: new WeakMap(),
+                    posted: {},         // what the toolbar currently shows
+                    frame: 0
+                };
+                window.authorFormat = format;
+
+                function closestBlock(node) {
+                    let el = node.nodeType === Node.ELEMENT_NODE ? node : node.parentElement;
+                    while (el && !BLOCK_TAGS.has(el.tagName)) el = el.parentElement;
+                    return el || document.body;
+                }
+
+                function blockState(block) {
+                    let align = window.getComputedStyle(block).textAlign;
+                    return {
+                        heading: HEADINGS.has(block.tagName) ? block.tagName.toLowerCase() : 'div',
+                        ul: block.closest('ul') !== null,
+                        ol: block.closest('ol') !== null,
+                        justifyLeft: align === 'left' || align === 'start' || align === '-webkit-auto',
+                        justifyCenter: align === 'center' || align === '-webkit-center',
+                        justifyRight: align === 'right' || align === 'end' || align === '-webkit-right',
+                        justifyFull: align === 'justify'
+                    };
+                }
+
+                function inlineState(el) {
+                    let style = window.getComputedStyle(el);
+                    return {
+                        bold: style.fontWeight === 'bold' || parseInt(style.fontWeight) > 400,
+                        italic: style.fontStyle === 'italic',
+                        underline: style.textDecorationLine.includes('underline'),
+                        strikethrough: style.textDecorationLine.includes('line-through'),
+                        fontFamily: style.fontFamily.split(',')[0].replace(/['"]/g, ''),
+                        fontSize: style.fontSize,
+                        color: style.color,
+                        backgroundColor: style.backgroundColor
+                    };
+                }
+
+                function compute() {
+                    let sel = window.getSelection();
+                    if (!sel.rangeCount) return null;
+                    let container = sel.getRangeAt(0).startContainer;
+                    let el = container.nodeType === Node.ELEMENT_NODE ? container : container.parentElement;
+                    if (!el || !document.body.contains(el)) return null;
+                    let block = closestBlock(el);
+                    let cached = format.blockCache.get(block);
+                    if (!cached) {
+                        cached = {block: blockState(block), inline: new WeakMap()};
+                        format.blockCache.set(block, cached);
+                    }
+                    let inline = cached.inline.get(el);
+                    if (!inline) {
+                        inline = inlineState(el);
+                        cached.inline.set(el, inline);
+                    }
+                    return Object.assign({}, cached.block, inline);
+                }
+
+                function flush() {
+                    format.frame = 0;
+                    let state = compute();
+                    if (!state) return;
+                    let changes = {};
+                    let changed = false;
+                    for (let key in state) {
+                        if (state[key] !== format.posted[key]) {
+                            changes[key] = state[key];
+                            changed = true;
+                        }
+                    }
+                    if (!changed) return;
+                    Object.assign(format.posted, changes);
+                    authorRpc.emit('formatState', changes);
+                }
+
+                // At most one computation per frame, however many events arrive
+                format.schedule = function() {
+                    if (!format.frame) format.frame = requestAnimationFrame(flush);
+                };
+
+                // The toolbar was changed from Python; diff against what it shows now
+                format.assume = function(changes) {
+                    Object.assign(format.posted, changes);
+                };
+
+                format.invalidate = function() {
+                    format.blockCache = new WeakMap();
+                    format.schedule();
+                };
+
+                // Typing into a text node does not change formatting, so characterData is not observed
+                new MutationObserver(records => {
+                    for (let record of records) {
+                        let target = record.target;
+                        if (!document.body || !document.body.contains(target) ||
+                            (record.type === 'attributes' && BLOCK_TAGS.has(target.tagName))) {
+                            // Stylesheets and block attributes can restyle many blocks at once
+                            format.blockCache = new WeakMap();
+                            break;
+                        }
+                        format.blockCache.delete(closestBlock(target));
+                    }
+                    format.schedule();
+                }).observe(document.documentElement, {childList: true, attributes: true, subtree: true});
+
+                authorRpc.register('format.schedule', format.schedule);
+                document.addEventListener('selectionchange', format.schedule);
+                format.schedule();
+            })();
+        """
+
+    def update_formatting_state(self):
+        self.rpc.call('format.schedule')
+
+    def formatting_toggles(self):
+        """State field -> (button, toggled handler, attribute) for every toolbar toggle"""
+        return {
+            'bold': (self.bold_btn, self.on_bold_toggled, 'is_bold'),
+            'italic': (self.italic_btn, self.on_italic_toggled, 'is_italic'),
+            'underline': (self.underline_btn, self.on_underline_toggled, 'is_underline'),
+            'strikethrough': (self.strikethrough_btn, self.on_strikethrough_toggled, 'is_strikethrough'),
+            'ul': (self.bullet_btn, self.on_bullet_list_toggled, 'is_bullet_list'),
+            'ol': (self.number_btn, self.on_number_list_toggled, 'is_number_list'),
+            'justifyLeft': (self.align_left_btn, self.on_align_left, 'is_align_left'),
+            'justifyCenter': (self.align_center_btn, self.on_align_center, 'is_align_center'),
+            'justifyRight': (self.align_right_btn, self.on_align_right, 'is_align_right'),
+            'justifyFull': (self.align_justify_btn, self.on_align_justify, 'is_align_justify'),
+        }
+
+    def set_dropdown_quietly(self, dropdown, handler, index):
+        if index is None or dropdown.get_selected() == index:
+            return
+        dropdown.handler_block_by_func(handler)
+        dropdown.set_selected(index)
+        dropdown.handler_unblock_by_func(handler)
+
+    def dropdown_index(self, dropdown, value):
+        model = dropdown.get_model()
+        for i in range(model.get_n_items()):
+            if model.get_item(i).get_string() == value:
+                return i
+        return None
+
+    def apply_formatting_changes(self, changes):
+        """Update only the toolbar widgets whose state changed, without re-running their handlers"""
+        toggles = self.formatting_toggles()
+        for key, value in changes.items():
+            if key in toggles:
+                btn, handler, attr = toggles[key]
+                setattr(self, attr, value)
+                if btn.get_active() != value:
+                    btn.handler_block_by_func(handler)
+                    btn.set_active(value)
+                    btn.handler_unblock_by_func(handler)
+
+        if 'fontFamily' in changes:
+            self.set_dropdown_quietly(self.font_dropdown, self.on_font_family_changed,
+                                      self.dropdown_index(self.font_dropdown, changes['fontFamily']))
+
+        if 'fontSize' in changes:
+            # Computed sizes are in px; the dropdown lists points
+            try:
+                size_pt = float(changes['fontSize'].replace('px', '')) * 0.75
+                self.set_dropdown_quietly(self.size_dropdown, self.on_font_size_changed,
+                                          self.dropdown_index(self.size_dropdown, f"{size_pt:g}"))
+            except ValueError:
+                pass
+
+        if 'color' in changes:
+            color = Gdk.RGBA()
+            if color.parse(changes['color']):
+                self.current_text_color = color
+                self.text_color_indicator.queue_draw()
+
+        if 'backgroundColor' in changes:
+            bg_color = Gdk.RGBA()
+            if bg_color.parse(changes['backgroundColor']):
+                self.current_bg_color = bg_color
+                self.bg_color_indicator.queue_draw()
+
+        if 'heading' in changes:
+            headings = {"div": 0, "h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+            self.set_dropdown_quietly(self.heading_dropdown, self.on_heading_changed,
+                                      headings.get(changes['heading'], 0))
 
 if __name__ == "__main__":
+    if StartupProfile.FLAG in sys.argv:
+        sys.argv.remove(StartupProfile.FLAG)
+        startup_profile.enabled = True
     app = Author()
     app.run()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Startup timing and deferred imports for the editor.
+
+Start the editor with --profile-startup to get a report on stderr once the
+first window can be typed into. It gives time-to-window and
+time-to-editable, and breaks the time down into imports, widget
+construction and WebView load.
+
+Modules that are only needed by some commands (Markdown, html2text) are
+imported through lazy_import() so they cost nothing until first used.
+"""
+
+import importlib
+import importlib.util
+import sys
+import time
+from contextlib import contextmanager
+
+PROFILE_FLAG = "--profile-startup"
+
+
+class StartupProfiler:
+    """Collects timed spans and milestones relative to process start"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.enabled = False
+        self.spans = []         # (category, name, seconds)
+        self.marks = {}         # milestone -> seconds since start
+        self.reported = False
+
+    def enable_from_argv(self, argv):
+        """Turn profiling on if the flag is present, removing it so GTK does not see it"""
+        if PROFILE_FLAG in argv:
+            argv.remove(PROFILE_FLAG)
+            self.enabled = True
+        return self.enabled
+
+    def record(self, category, name, seconds):
+        self.spans.append((category, name, seconds))
+
+    @contextmanager
+    def span(self, category, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(category, name, time.perf_counter() - start)
+
+    def mark(self, milestone):
+        """Note the first time a milestone is reached; 'editable' ends the profile"""
+        if milestone in self.marks:
+            return
+        self.marks[milestone] = time.perf_counter() - self.start
+        if milestone == 'editable':
+            self.report()
+
+    def report(self):
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        lines = ["Startup profile:"]
+        for milestone in ('window', 'editable'):
+            if milestone in self.marks:
+                lines.append(f"  time-to-{milestone:<9} {self.marks[milestone] * 1000:8.1f} ms")
+        totals = {}
+        for category, name, seconds in self.spans:
+            totals[category] = totals.get(category, 0.0) + seconds
+        for category, total in totals.items():
+            lines.append(f"  {category:<17} {total * 1000:8.1f} ms")
+            for span_category, name, seconds in self.spans:
+                if span_category == category:
+                    lines.append(f"    {name:<28} {seconds * 1000:8.1f} ms")
+        print("\n".join(lines), file=sys.stderr)
+
+
+# Started as early as the first import of this module
+profiler = StartupProfiler()
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access"""
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attr):
+        module = self.__dict__['_module']
+        if module is None:
+            name = self.__dict__['_name']
+            with profiler.span('deferred imports', name):
+                module = importlib.import_module(name)
+            self.__dict__['_module'] = module
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    """Return a module proxy that imports name when it is first used"""
+    return LazyModule(name)
+
+
+def module_available(name):
+    """True if name can be imported, without importing it"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Synthetic documents for benchmarking the editor.
+
+generate() builds editor HTML of a given kind and approximate size out of
+top-level blocks, the way real documents arrive. The same kind, size and
+seed always produce the same document, so results from different commits
+can be compared.
+"""
+
+import base64
+import random
+import struct
+import zlib
+
+KINDS = ('text', 'images', 'tables', 'lists')
+
+WORDS = ("the of and to in is that for it as was with be by on not he this are or his from at which "
+         "but have an they you were her she there been one all we their has would when if so no what "
+         "up out who them some could into about then time these other two more very after first also "
+         "document editor paragraph letter report chapter section table figure image").split()
+
+SIZE_SUFFIXES = {'K': 1024, 'M': 1024 * 1024, 'G': 1024 * 1024 * 1024}
+
+
+def parse_size(text):
+    """'10K', '50M' or a plain number of bytes"""
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def size_name(size):
+    for suffix in ('G', 'M', 'K'):
+        if size >= SIZE_SUFFIXES[suffix] and size % SIZE_SUFFIXES[suffix] == 0:
+            return f"{size // SIZE_SUFFIXES[suffix]}{suffix}"
+    return str(size)
+
+
+def png_bytes(rng, width, height):
+    """A valid RGB PNG of random noise, which compresses about as badly as a photo"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    rows = b''.join(b'\x00' + rng.randbytes(width * 3) for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(rows, 6)) +
+            chunk(b'IEND', b''))
+
+
+def sentence(rng, words=12):
+    text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(words // 2, words * 2)))
+    return text[0].upper() + text[1:] + '.'
+
+
+def paragraph(rng):
+    parts = []
+    for _ in range(rng.randint(3, 7)):
+        text = sentence(rng)
+        style = rng.random()
+        if style < 0.1:
+            text = f"<b>{text}</b>"
+        elif style < 0.2:
+            text = f"<i>{text}</i>"
+        elif style < 0.25:
+            text = f'<span style="font-size: 14pt;">{text}</span>'
+        parts.append(text)
+    return f"<p>{' '.join(parts)}</p>"
+
+
+def table(rng, rows=50, columns=6):
+    header = ''.join(f"<th>{rng.choice(WORDS).title()}</th>" for _ in range(columns))
+    body = ''.join(
+        '<tr>' + ''.join(f"<td>{rng.choice(WORDS)} {rng.randint(0, 99999)}</td>" for _ in range(columns)) + '</tr>'
+        for _ in range(rows))
+    return f'<table border="1"><thead><tr>{header}</tr></thead><tbody>{body}</tbody></table>'
+
+
+def nested_list(rng, depth=8):
+    tag = 'ul' if depth % 2 else 'ol'
+    items = []
+    for i in range(rng.randint(2, 4)):
+        item = sentence(rng, 6)
+        if depth > 1 and i == 0:
+            item += nested_list(rng, depth - 1)
+        items.append(f"<li>{item}</li>")
+    return f"<{tag}>{''.join(items)}</{tag}>"
+
+
+def generate(kind, size, seed=0):
+    """Editor HTML of roughly size bytes made of top-level blocks of the given kind"""
+    if kind not in KINDS:
+        raise ValueError(f"unknown document kind {kind!r}")
+    rng = random.Random(f"{kind}-{size}-{seed}")
+    images = []
+    if kind == 'images':
+        # A pool of distinct images; large documents repeat them
+        images = [base64.b64encode(png_bytes(rng, 96, 64)).decode('ascii') for _ in range(16)]
+
+    blocks = []
+    total = 0
+    count = 0
+    while total < size:
+        if kind == 'text':
+            block = paragraph(rng)
+        elif kind == 'images':
+            block = (f'<p><img src="data:image/png;base64,{images[count % len(images)]}" '
+                     f'style="max-width: 100%;"></p>' if count % 2 == 0 else paragraph(rng))
+        elif kind == 'tables':
+            block = table(rng) if count % 4 == 0 else paragraph(rng)
+        else:
+            block = nested_list(rng) if count % 2 == 0 else paragraph(rng)
+        blocks.append(block)
+        total += len(block) + 1
+        count += 1
+    return '\n'.join(blocks)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Rows of CSV and TSV files, read a batch at a time for the editor's table import.
+
+The delimiter follows from the extension for .tsv and .tab files and is
+sniffed from the start of the file otherwise. Only the batch being handed
+to the editor is held in memory, so files of any length stream in.
+"""
+
+import csv
+import os
+
+TABLE_EXTENSIONS = ['.csv', '.tsv', '.tab']
+TAB_EXTENSIONS = ['.tsv', '.tab']
+SNIFF_CHARS = 64 * 1024
+
+
+def sniff_dialect(sample, extension):
+    if extension in TAB_EXTENSIONS:
+        return csv.excel_tab
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=',;\t|')
+    except csv.Error:
+        return csv.excel
+
+
+def row_batches(path, batch_rows):
+    """Lists of up to batch_rows rows of the file at path, each row a list of cell texts.
+
+    Blank lines are skipped, and rows shorter than the first are padded so
+    that every row fills the table.
+    """
+    with open(path, newline='', encoding='utf-8-sig', errors='replace') as f:
+        dialect = sniff_dialect(f.read(SNIFF_CHARS), os.path.splitext(path)[1].lower())
+        f.seek(0)
+        width = None
+        batch = []
+        for row in csv.reader(f, dialect):
+            if not row:
+                continue
+            if width is None:
+                width = len(row)
+            elif len(row) < width:
+                row.extend([''] * (width - len(row)))
+            batch.append(row)
+            if len(batch) >= batch_rows:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
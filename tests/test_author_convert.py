@@ -0,0 +1,20 @@
+from author_convert import ConversionState, source_key
+
+
+def test_state_resumes_from_another_directory(tmp_path, monkeypatch):
+    source = tmp_path / 'notes.txt'
+    source.write_text('hello')
+    (tmp_path / 'out').mkdir()
+    target = tmp_path / 'out' / 'notes.html'
+    target.write_text('<p>hello</p>')
+    state_path = str(tmp_path / 'state')
+
+    monkeypatch.chdir(tmp_path)
+    state = ConversionState(state_path)
+    state.record(source_key('notes.txt'), 'out/notes.html')
+    state.close()
+
+    monkeypatch.chdir(tmp_path / 'out')
+    state = ConversionState(state_path)
+    assert state.is_done(source_key('../notes.txt'), 'notes.html')
+    assert not state.is_done(source_key('../notes.txt'), 'other.html')
@@ -0,0 +1,58 @@
+import document_formats
+from document_formats import CHUNK_SIZE, FIRST_CHUNK_SIZE, extract_body, split_top_level
+
+PARAGRAPH = '<p>' + 'x' * 990 + '</p>\n'  # 1000 characters
+
+
+def document(size):
+    return PARAGRAPH * (size // len(PARAGRAPH))
+
+
+def pieces(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def check_chunks(chunks, text):
+    assert ''.join(chunks) == text
+    assert FIRST_CHUNK_SIZE <= len(chunks[0]) < FIRST_CHUNK_SIZE + len(PARAGRAPH)
+    for chunk in chunks[1:-1]:
+        assert CHUNK_SIZE <= len(chunk) < CHUNK_SIZE + len(PARAGRAPH)
+    for chunk in chunks:
+        assert chunk.lstrip().startswith('<p>') and chunk.rstrip().endswith('</p>')
+
+
+def test_one_piece_is_split():
+    text = document(2300 * 1024)
+    chunks = list(split_top_level([text]))
+    assert len(chunks) == 6
+    check_chunks(chunks, text)
+
+
+def test_read_sized_pieces_keep_a_small_first_chunk():
+    text = document(2300 * 1024)
+    chunks = list(split_top_level(pieces(text, document_formats.READ_CHUNK_SIZE)))
+    check_chunks(chunks, text)
+
+
+def test_chunks_end_between_top_level_elements():
+    text = ('<div><p>' + 'y' * 5000 + '</p><script>if (a < b) x = "</div>";</script></div>') * 40
+    chunks = list(split_top_level(pieces(text, 777)))
+    assert ''.join(chunks) == text
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.startswith('<div>') and chunk.endswith('</script></div>')
+
+
+def test_unclosed_markup_stays_in_one_chunk():
+    text = '<div>' + PARAGRAPH * 100
+    assert list(split_top_level([text])) == [text]
+
+
+def test_extract_body_from_a_list():
+    assert ''.join(extract_body(['ab', 'c<html><body>abcdef'])) == 'abcdef'
+    assert ''.join(extract_body(['<body>', 'x' * 40, 'y</bo', 'dy>tail'])) == 'x' * 40 + 'y'
+
+
+def test_extract_body_without_body_tag():
+    text = '<p>' + 'x' * document_formats.BODY_SEARCH_LIMIT + '</p>'
+    assert ''.join(extract_body([text[:10], text[10:], '<p>end</p>'])) == text + '<p>end</p>'
@@ -0,0 +1,35 @@
+from document_index import DocumentIndex
+
+
+def make_index(tmp_path):
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    (docs / 'notes.txt').write_text('hello world')
+    index = DocumentIndex(str(tmp_path / 'index.sqlite'))
+    index.add_root(str(docs), recursive=False)
+    assert index.update() == (1, 0)
+    return index, docs
+
+
+def test_missing_root_keeps_its_documents(tmp_path):
+    index, docs = make_index(tmp_path)
+    docs.rename(tmp_path / 'unmounted')
+    assert index.update() == (0, 0)
+    assert [hit.title for hit in index.search('hello')] == ['notes']
+
+    (tmp_path / 'unmounted').rename(docs)
+    assert index.update() == (0, 0)
+
+
+def test_vanished_file_is_forgotten(tmp_path):
+    index, docs = make_index(tmp_path)
+    (docs / 'notes.txt').unlink()
+    assert index.update() == (0, 1)
+    assert index.search('hello') == []
+
+
+def test_removed_root_is_forgotten(tmp_path):
+    index, docs = make_index(tmp_path)
+    index.remove_root(str(docs))
+    assert index.roots() == []
+    assert index.update() == (0, 1)
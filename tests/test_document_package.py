@@ -0,0 +1,47 @@
+import os
+import zipfile
+
+import pytest
+
+from document_package import DocumentPackage, asset_name
+
+IMAGE = b'\x89PNG' + b'\x00' * 64
+NAME = asset_name(IMAGE, 'image/png')
+HTML = f'<p><img src="assets/{NAME}"></p>'
+
+
+def test_save_appends_a_revision(tmp_path):
+    package = DocumentPackage(str(tmp_path / 'doc.hdoc'))
+    assert package.save(HTML, {NAME: IMAGE}) == len(IMAGE)
+    assert package.save(HTML + '<p>more</p>', {}) == 0
+    assert package.read_document() == HTML + '<p>more</p>'
+    assert package.read_asset(NAME) == IMAGE
+    with zipfile.ZipFile(package.path) as archive:
+        assert 'document/2.html' in archive.namelist()
+    assert os.listdir(tmp_path) == ['doc.hdoc']
+
+
+def test_failed_append_leaves_package_intact(tmp_path):
+    package = DocumentPackage(str(tmp_path / 'doc.hdoc'))
+    package.save(HTML, {NAME: IMAGE})
+    before = open(package.path, 'rb').read()
+
+    def broken():
+        raise OSError('disk full')
+
+    other = asset_name(b'other', 'image/png')
+    with pytest.raises(OSError):
+        package.save(f'<img src="assets/{other}">', {other: broken})
+    assert open(package.path, 'rb').read() == before
+    assert os.listdir(tmp_path) == ['doc.hdoc']
+
+
+def test_failed_rewrite_removes_temporary_file(tmp_path):
+    package = DocumentPackage(str(tmp_path / 'doc.hdoc'))
+
+    def broken():
+        raise OSError('disk full')
+
+    with pytest.raises(OSError):
+        package.save(HTML, {NAME: broken})
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+import html_sanitizer
+from html_sanitizer import sanitize_html, url_allowed
+
+
+@pytest.mark.parametrize('href', [
+    'javascript:alert(1)',
+    'java&#9;script:alert(1)',
+    'java&#x09;script:alert(1)',
+    'java&#x0A;script:alert(1)',
+    'java&#13;script:alert(1)',
+    'jav&#x0D;&#x0A;ascript:alert(1)',
+    '&#1;javascript:alert(1)',
+    ' &#x1F;javascript:alert(1)',
+    'JaVaScRiPt:alert(1)',
+    'vbscript:msgbox(1)',
+])
+def test_script_urls_are_removed(href):
+    assert sanitize_html(f'<a href="{href}">x</a>') == '<a>x</a>'
+
+
+@pytest.mark.parametrize('value', ['java\tscript:alert(1)', 'java\nscript:x', '\x01 javascript:x'])
+def test_url_allowed_ignores_what_browsers_ignore(value):
+    assert not url_allowed('a', value)
+
+
+def test_data_urls_only_for_images():
+    assert url_allowed('img', 'data:image/png;base64,AAAA')
+    assert url_allowed('img', ' da\tta:image/png;base64,AAAA')
+    assert not url_allowed('a', 'data:image/png;base64,AAAA')
+    assert not url_allowed('img', 'data:text/html;base64,AAAA')
+
+
+def test_safe_and_relative_urls_are_kept():
+    assert sanitize_html('<a href="https://example.org/a">x</a>') == '<a href="https://example.org/a">x</a>'
+    assert sanitize_html('<a href="notes/page.html#top">x</a>') == '<a href="notes/page.html#top">x</a>'
+
+
+@pytest.mark.parametrize('style', [
+    'border-image-source: url(http://example.org/x.png)',
+    'list-style-image: url(x.png)',
+    'list-style-image: image-set("x.png" 1x)',
+    'border-image-source: \\75 rl(x.png)',
+])
+def test_style_values_that_load_urls_are_removed(style):
+    assert sanitize_html(f'<p style="color: red; {style}">x</p>') == '<p style="color: red">x</p>'
+
+
+def test_page_gets_the_same_url_and_style_rules():
+    tables = json.loads(html_sanitizer.tables_json())
+    assert tables['blockedStyleValues'] == list(html_sanitizer.BLOCKED_STYLE_VALUES)
+    assert tables['schemePattern'] == html_sanitizer.SCHEME_PATTERN
+    assert tables['urlIgnoredPattern'] == html_sanitizer.URL_IGNORED_PATTERN